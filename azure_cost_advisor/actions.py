@@ -1,231 +1,484 @@
 import logging
+import sys
 import time
+import concurrent.futures
+import functools
 
 from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.compute import ComputeManagementClient
-from azure.mgmt.network import NetworkManagementClient
-from azure.mgmt.web import WebSiteManagementClient
 from azure.core.exceptions import ResourceNotFoundError
 
 # Rich for console output
 from rich.console import Console
+from rich.progress import Progress, SpinnerColumn, TextColumn
+from rich.text import Text
+
+from .clients import build_shared_transport
+from .utils import LazyImport, resource_group_from_id
+from .config import ARG_ID_BATCH_SIZE, CLEANUP_MAX_WORKERS, HTTP_CONNECTION_POOL_SIZE, LRO_POLLING_INTERVAL_SECONDS
+
+# Management clients are only needed once cleanup starts, so their (slow) packages load on first use
+ResourceManagementClient = LazyImport("azure.mgmt.resource", "ResourceManagementClient")
+ComputeManagementClient = LazyImport("azure.mgmt.compute", "ComputeManagementClient")
+NetworkManagementClient = LazyImport("azure.mgmt.network", "NetworkManagementClient")
+WebSiteManagementClient = LazyImport("azure.mgmt.web", "WebSiteManagementClient")
+ResourceGraphClient = LazyImport("azure.mgmt.resourcegraph", "ResourceGraphClient")
+QueryRequest = LazyImport("azure.mgmt.resourcegraph.models", "QueryRequest")
+QueryRequestOptions = LazyImport("azure.mgmt.resourcegraph.models", "QueryRequestOptions")
 
 # Initialize console for potential standalone use or if passed
 _console = Console()
+logger = logging.getLogger(__name__)
+
+# Printed once per resource under --force-cleanup, so the markup is parsed once here
+_FORCE_WARN = Text.from_markup(":warning: [bold red]--force-cleanup enabled.[/]")
+
+# Maps the resource type strings used in cleanup to (clients key, operations attribute, takes RG name).
+# Add other deletable resource types here as needed.
+_DELETE_DISPATCH = {
+    "Unattached Disk": ("compute", "disks", True),
+    "Unused Public IP": ("network", "public_ip_addresses", True),
+    "Empty Resource Group": ("resource", "resource_groups", False),
+    "Empty App Service Plan": ("web", "app_service_plans", True),
+    "Old Disk Snapshot": ("compute", "snapshots", True),
+    "Orphaned Network Security Group": ("network", "network_security_groups", True),
+    "Orphaned Route Table": ("network", "route_tables", True),
+}
+
+# Columns a findings DataFrame needs for cleanup, when not the default ('ID', 'Name').
+# Stopped VMs are deallocated by resource group + name, so their ID column is optional.
+_REQUIRED_COLUMNS = {
+    'stopped_vms': ('Resource Group', 'Name'),
+}
 
 # --- Action Functions ---
 
-def delete_resource(credential, subscription_id, resource_id, resource_type, resource_name, clients, console: Console = _console, wait_for_completion=False, force_cleanup=False):
-    """Generic function to delete a resource using appropriate client, with optional force flag."""
-    logger = logging.getLogger()
+def _safe_poller_status(poller):
+    """Returns the poller's status for error reporting, without letting a broken poller raise again."""
+    try:
+        return poller.status()
+    except Exception:
+        return "unknown"
+
+def _wait_for_poller(poller, log_prefix, console: Console = _console):
+    """Waits for a long-running operation on a short poll cadence, logging a heartbeat each tick."""
+    with console.status("[cyan]Waiting for operation...[/]"):
+        while not poller.done():
+            poller.wait(timeout=LRO_POLLING_INTERVAL_SECONDS)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("%s: Still waiting, status=%s", log_prefix, poller.status())
+    poller.result() # Already complete; re-raises any error from the operation
+
+def _print(console: Console, quiet, *args):
+    """Prints a per-resource status line unless quiet; each of these has a matching log record already."""
+    if not quiet:
+        console.print(*args)
+
+def _confirm_action(console: Console, prompt, resource_type, type_decisions=None):
+    """Asks the user to confirm a single action.
+
+    When a type_decisions dict is passed, the prompt also offers "all" (yes to every remaining
+    item of this resource type) and "skip" (no to every remaining item), and the answer is
+    recorded in type_decisions[resource_type] so later items are not prompted again.
+    """
+    decision = type_decisions.get(resource_type) if type_decisions is not None else None
+    if decision == "all":
+        return True
+    if decision == "skip":
+        return False
+
+    if not sys.stdin.isatty():
+        # No one can answer the prompt (CI/pipeline run), so default to "No" instead of blocking
+        logger.warning("No TTY available to confirm %s action; defaulting to skip.", resource_type)
+        return False
+
+    if type_decisions is None:
+        choice = console.input(f"{prompt} [[bold bright_red]y[/]/N]: ").strip().lower()
+        return choice == 'y'
+
+    choice = console.input(f"{prompt} [[bold bright_red]y[/]es/[bold bright_red]a[/]ll/[bold]s[/]kip type/N]: ").strip().lower()
+    if choice == 'a':
+        type_decisions[resource_type] = "all"
+    elif choice == 's':
+        type_decisions[resource_type] = "skip"
+    return choice in ('y', 'a')
+
+def _fast_delete(clients, dispatch_entry, resource_type, resource_id, resource_name, rg_name) -> bool:
+    """Starts a delete without prompting, printing or waiting; the batch path for unattended force cleanup.
+
+    Only a single audit line is logged per resource, in delete_resource's format. Returns True if the delete was initiated.
+    """
+    client_key, operations_attr, needs_rg = dispatch_entry
+    try:
+        operations = getattr(clients[client_key], operations_attr)
+        if needs_rg:
+            operations.begin_delete(rg_name, resource_name, polling_interval=LRO_POLLING_INTERVAL_SECONDS)
+        else:
+            operations.begin_delete(resource_name, polling_interval=LRO_POLLING_INTERVAL_SECONDS)
+        logger.info("ACTION - DELETE - %s - %s (%s): Deletion initiated (--force-cleanup).", resource_type, resource_name, resource_id)
+        return True
+    except ResourceNotFoundError:
+        logger.warning("ACTION - DELETE - %s - %s (%s): Resource not found (perhaps already deleted?).", resource_type, resource_name, resource_id)
+        return False
+    except Exception:
+        logger.exception("ACTION - DELETE - %s - %s (%s): Error initiating deletion.", resource_type, resource_name, resource_id)
+        return False
+
+def delete_resource(credential, subscription_id, resource_id, resource_type, resource_name, clients, console: Console = _console, wait_for_completion=False, force_cleanup=False, rg_name=None, type_decisions=None, pending_pollers=None, quiet=False):
+    """Generic function to delete a resource using appropriate client, with optional force flag.
+
+    rg_name may be passed pre-parsed by the caller; otherwise it is extracted from resource_id.
+    type_decisions (optional) holds per-type "all"/"skip" answers shared across calls.
+    If pending_pollers (a list) is given with wait_for_completion, the poller is appended to it
+    instead of being waited on here, so the caller can wait for a whole batch at once.
+    With quiet=True, per-resource status goes to the log only (no Rich console output), and a
+    forced delete that is not waited on takes the _fast_delete path.
+    """
+    dispatch_entry = _DELETE_DISPATCH.get(resource_type)
+    if force_cleanup and quiet and not wait_for_completion and dispatch_entry and (rg_name or not dispatch_entry[2]):
+        return _fast_delete(clients, dispatch_entry, resource_type, resource_id, resource_name, rg_name)
+
     log_prefix = f"ACTION - DELETE - {resource_type} - {resource_name} ({resource_id})"
     confirm = False
 
-    logger.debug(f"{log_prefix}: Checking deletion confirmation status (force_cleanup={force_cleanup}).")
+    logger.debug("%s: Checking deletion confirmation status (force_cleanup=%s).", log_prefix, force_cleanup)
 
     if force_cleanup:
-        console.print(f":warning: [bold red]--force-cleanup enabled.[/] Preparing to delete {resource_type} '{resource_name}' non-interactively...")
+        _print(console, quiet, _FORCE_WARN, f"Preparing to delete {resource_type} '{resource_name}' non-interactively...")
         confirm = True
     else:
-        choice = console.input(f":question: Delete {resource_type} '{resource_name}' ([dim]{resource_id}[/dim])? [[bold bright_red]y[/]/N]: ").lower()
-        confirm = choice == 'y'
+        confirm = _confirm_action(console, f":question: Delete {resource_type} '{resource_name}' ([dim]{resource_id}[/dim])?", resource_type, type_decisions)
 
     if confirm:
-        logger.info(f"{log_prefix}: User confirmed deletion (or --force-cleanup used). Initiating.")
-        console.print(f"  Attempting deletion of {resource_type} '{resource_name}'...")
+        logger.info("%s: User confirmed deletion (or --force-cleanup used). Initiating.", log_prefix)
+        _print(console, quiet, f"  Attempting deletion of {resource_type} '{resource_name}'...")
         poller = None
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         try:
-            # Extract RG name safely
-            try:
-                rg_name = resource_id.split('/')[4]
-            except IndexError:
-                if resource_type == "Empty Resource Group":
-                    rg_name = None # Not needed for RG deletion
-                    logger.debug(f"{log_prefix}: Resource is an RG, RG name extraction not needed.")
-                else:
-                    logger.error(f"{log_prefix}: Could not parse resource group from ID. Cannot delete.")
-                    console.print(f"  [bold red]Error:[/bold red] Could not parse resource group from ID for {resource_name}. Cannot delete.")
-                    return False
+            # Determine the correct client and delete method based on resource type string
+            dispatch_entry = _DELETE_DISPATCH.get(resource_type)
+            if not dispatch_entry:
+                logger.warning("%s: Deletion logic for resource type '%s' not implemented.", log_prefix, resource_type)
+                _print(console, quiet, f"  [yellow]Warning:[/yellow] Deletion for resource type '{resource_type}' not implemented.")
+                return False
 
-            logger.debug(f"{log_prefix}: Using Resource Group '{rg_name}' (if applicable).")
+            client_key, operations_attr, needs_rg = dispatch_entry
+            if needs_rg:
+                # Extract RG name safely (callers in bulk cleanup pass it pre-parsed)
+                rg_name = rg_name or resource_group_from_id(resource_id)
+                if not rg_name:
+                    logger.error("%s: Could not parse resource group from ID. Cannot delete.", log_prefix)
+                    _print(console, quiet, f"  [bold red]Error:[/bold red] Could not parse resource group from ID for {resource_name}. Cannot delete.")
+                    return False
+                logger.debug("%s: Using Resource Group '%s'.", log_prefix, rg_name)
+            else:
+                logger.debug("%s: Resource is an RG, RG name extraction not needed.", log_prefix)
 
-            # Determine the correct client and delete method based on resource type string
-            if resource_type == "Unattached Disk":
-                logger.debug(f"{log_prefix}: Calling compute_client.disks.begin_delete...")
-                poller = clients['compute'].disks.begin_delete(rg_name, resource_name)
-            elif resource_type == "Unused Public IP":
-                logger.debug(f"{log_prefix}: Calling network_client.public_ip_addresses.begin_delete...")
-                poller = clients['network'].public_ip_addresses.begin_delete(rg_name, resource_name)
-            elif resource_type == "Empty Resource Group":
-                 logger.debug(f"{log_prefix}: Calling resource_client.resource_groups.begin_delete...")
-                 poller = clients['resource'].resource_groups.begin_delete(resource_name) # RG name is resource_name
-            elif resource_type == "Empty App Service Plan":
-                 logger.debug(f"{log_prefix}: Calling web_client.app_service_plans.begin_delete...")
-                 poller = clients['web'].app_service_plans.begin_delete(rg_name, resource_name)
-            elif resource_type == "Old Disk Snapshot":
-                 logger.debug(f"{log_prefix}: Calling compute_client.snapshots.begin_delete...")
-                 poller = clients['compute'].snapshots.begin_delete(rg_name, resource_name)
-            elif resource_type == "Orphaned Network Security Group": # Added Type
-                 logger.debug(f"{log_prefix}: Calling network_client.network_security_groups.begin_delete...")
-                 poller = clients['network'].network_security_groups.begin_delete(rg_name, resource_name)
-            elif resource_type == "Orphaned Route Table": # Added Type
-                 logger.debug(f"{log_prefix}: Calling network_client.route_tables.begin_delete...")
-                 poller = clients['network'].route_tables.begin_delete(rg_name, resource_name)
-            # Add other resource types here as needed
+            logger.debug("%s: Calling %s_client.%s.begin_delete...", log_prefix, client_key, operations_attr)
+            operations = getattr(clients[client_key], operations_attr)
+            if needs_rg:
+                poller = operations.begin_delete(rg_name, resource_name, polling_interval=LRO_POLLING_INTERVAL_SECONDS)
             else:
-                logger.warning(f"{log_prefix}: Deletion logic for resource type '{resource_type}' not implemented.")
-                console.print(f"  [yellow]Warning:[/yellow] Deletion for resource type '{resource_type}' not implemented.")
-                return False
+                poller = operations.begin_delete(resource_name, polling_interval=LRO_POLLING_INTERVAL_SECONDS) # RG name is resource_name
 
-            logger.info(f"{log_prefix}: Deletion initiated. Initial poller state: {poller.status()}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("%s: Deletion initiated. Initial poller state: %s", log_prefix, poller.status())
 
-            if wait_for_completion and poller:
-                logger.info(f"{log_prefix}: Waiting for deletion to complete (wait_for_completion=True)...")
-                console.print(f"  Waiting for deletion of {resource_name} to complete...")
-                start_wait = time.time()
-                with console.status("[cyan]Waiting for operation...[/]"):
-                     poller.result() # This blocks until completion
-                end_wait = time.time()
-                wait_duration = end_wait - start_wait
+            if wait_for_completion and poller and pending_pollers is not None:
+                pending_pollers.append((resource_name, log_prefix, poller))
+                logger.info("%s: Deletion initiated, completion will be awaited with the rest of the batch.", log_prefix)
+                _print(console, quiet, f"  ✅ Deletion of {resource_name} initiated.")
+            elif wait_for_completion and poller:
+                logger.info("%s: Waiting for deletion to complete (wait_for_completion=True)...", log_prefix)
+                _print(console, quiet, f"  Waiting for deletion of {resource_name} to complete...")
+                start_wait_ns = time.perf_counter_ns()
+                _wait_for_poller(poller, log_prefix, console)
+                wait_duration = (time.perf_counter_ns() - start_wait_ns) / 1e9
                 final_status = poller.status()
-                logger.info(f"{log_prefix}: Deletion completed. Final Poller State: {final_status} (Wait time: {wait_duration:.2f}s)")
-                console.print(f"  ✅ Deletion of {resource_name} completed ({final_status}).")
+                logger.info("%s: Deletion completed. Final Poller State: %s (Wait time: %.2fs)", log_prefix, final_status, wait_duration)
+                _print(console, quiet, f"  ✅ Deletion of {resource_name} completed ({final_status}).")
             elif poller:
                  # Log status even if not waiting
                  current_status = poller.status()
-                 logger.info(f"{log_prefix}: Deletion initiated, not waiting for completion (poller status: {current_status}).")
-                 console.print(f"  ✅ Deletion of {resource_name} initiated (status: {current_status}).")
+                 logger.info("%s: Deletion initiated, not waiting for completion (poller status: %s).", log_prefix, current_status)
+                 _print(console, quiet, f"  ✅ Deletion of {resource_name} initiated (status: {current_status}).")
 
-            duration = time.time() - start_time
-            logger.info(f"{log_prefix}: Deletion request processed successfully. Total time: {duration:.2f}s")
+            duration = (time.perf_counter_ns() - start_ns) / 1e9
+            logger.info("%s: Deletion request processed successfully. Total time: %.2fs", log_prefix, duration)
             return True # Indicate success
         except ResourceNotFoundError:
-             duration = time.time() - start_time
-             log_msg = f"{log_prefix}: Resource not found (perhaps already deleted?). Operation took {duration:.2f}s."
-             logger.warning(log_msg)
-             console.print(f"  [yellow]Warning:[/yellow] {resource_type} '{resource_name}' not found. Skipping.")
+             duration = (time.perf_counter_ns() - start_ns) / 1e9
+             logger.warning("%s: Resource not found (perhaps already deleted?). Operation took %.2fs.", log_prefix, duration)
+             _print(console, quiet, f"  [yellow]Warning:[/yellow] {resource_type} '{resource_name}' not found. Skipping.")
              return False # Indicate failure/skip
         except Exception as e:
-            duration = time.time() - start_time
-            final_status = f"failed ({e})" if not poller else f"{poller.status()} ({e})"
-            log_msg = f"{log_prefix}: Error during deletion process. Final status: {final_status}. Operation took {duration:.2f}s."
-            logger.error(log_msg, exc_info=True)
-            console.print(f"  [bold red]Error deleting {resource_name}:[/bold red] {e}")
+            duration = (time.perf_counter_ns() - start_ns) / 1e9
+            final_status = f"failed ({e})" if not poller else f"{_safe_poller_status(poller)} ({e})"
+            logger.error("%s: Error during deletion process. Final status: %s. Operation took %.2fs.", log_prefix, final_status, duration, exc_info=True)
+            _print(console, quiet, f"  [bold red]Error deleting {resource_name}:[/bold red] {e}")
             return False # Indicate failure
     else:
-        logger.info(f"{log_prefix}: User skipped deletion.")
-        console.print(f"  Skipping deletion of {resource_type} '{resource_name}'.")
+        logger.info("%s: User skipped deletion.", log_prefix)
+        _print(console, quiet, f"  Skipping deletion of {resource_type} '{resource_name}'.")
         return False # Indicate skip
 
-def deallocate_vm(credential, subscription_id, rg_name, vm_name, compute_client, console: Console = _console, wait_for_completion=False, force_cleanup=False):
-    """Deallocates a VM after confirmation, with optional force flag."""
-    logger = logging.getLogger()
+def deallocate_vm(credential, subscription_id, rg_name, vm_name, compute_client, console: Console = _console, wait_for_completion=False, force_cleanup=False, type_decisions=None, pending_pollers=None, quiet=False):
+    """Deallocates a VM after confirmation, with optional force flag.
+
+    type_decisions, pending_pollers and quiet behave as in delete_resource.
+    """
     log_prefix = f"ACTION - DEALLOCATE - VM - {vm_name} (RG: {rg_name})"
     confirm = False
 
-    logger.debug(f"{log_prefix}: Checking deallocation confirmation status (force_cleanup={force_cleanup}).")
+    logger.debug("%s: Checking deallocation confirmation status (force_cleanup=%s).", log_prefix, force_cleanup)
 
     if force_cleanup:
-        console.print(f":warning: [bold red]--force-cleanup enabled.[/] Preparing to deallocate VM '{vm_name}' non-interactively...")
+        _print(console, quiet, _FORCE_WARN, f"Preparing to deallocate VM '{vm_name}' non-interactively...")
         confirm = True
     else:
-        choice = console.input(f":question: Deallocate VM '{vm_name}' in RG '{rg_name}'? (Keeps disks) [[bold bright_red]y[/]/N]: ").lower()
-        confirm = choice == 'y'
+        confirm = _confirm_action(console, f":question: Deallocate VM '{vm_name}' in RG '{rg_name}'? (Keeps disks)", "Stopped VM", type_decisions)
 
     if confirm:
-        logger.info(f"{log_prefix}: User confirmed deallocation (or --force-cleanup used). Initiating.")
-        console.print(f"  Attempting deallocation of VM '{vm_name}'...")
+        logger.info("%s: User confirmed deallocation (or --force-cleanup used). Initiating.", log_prefix)
+        _print(console, quiet, f"  Attempting deallocation of VM '{vm_name}'...")
         poller = None
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         try:
-            logger.debug(f"{log_prefix}: Calling compute_client.virtual_machines.begin_deallocate...")
-            poller = compute_client.virtual_machines.begin_deallocate(rg_name, vm_name)
-            logger.info(f"{log_prefix}: Deallocation initiated. Initial poller state: {poller.status()}")
-
-            if wait_for_completion and poller:
-                logger.info(f"{log_prefix}: Waiting for deallocation to complete (wait_for_completion=True)...")
-                console.print(f"  Waiting for deallocation of {vm_name} to complete...")
-                start_wait = time.time()
-                with console.status("[cyan]Waiting for operation...[/]"):
-                    poller.result() # Blocks until complete
-                end_wait = time.time()
-                wait_duration = end_wait - start_wait
+            logger.debug("%s: Calling compute_client.virtual_machines.begin_deallocate...", log_prefix)
+            poller = compute_client.virtual_machines.begin_deallocate(rg_name, vm_name, polling_interval=LRO_POLLING_INTERVAL_SECONDS)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("%s: Deallocation initiated. Initial poller state: %s", log_prefix, poller.status())
+
+            if wait_for_completion and poller and pending_pollers is not None:
+                pending_pollers.append((vm_name, log_prefix, poller))
+                logger.info("%s: Deallocation initiated, completion will be awaited with the rest of the batch.", log_prefix)
+                _print(console, quiet, f"  ✅ Deallocation of {vm_name} initiated.")
+            elif wait_for_completion and poller:
+                logger.info("%s: Waiting for deallocation to complete (wait_for_completion=True)...", log_prefix)
+                _print(console, quiet, f"  Waiting for deallocation of {vm_name} to complete...")
+                start_wait_ns = time.perf_counter_ns()
+                _wait_for_poller(poller, log_prefix, console)
+                wait_duration = (time.perf_counter_ns() - start_wait_ns) / 1e9
                 final_status = poller.status()
-                logger.info(f"{log_prefix}: Deallocation completed. Final Poller State: {final_status} (Wait time: {wait_duration:.2f}s)")
-                console.print(f"  ✅ Deallocation of {vm_name} completed ({final_status}).")
+                logger.info("%s: Deallocation completed. Final Poller State: %s (Wait time: %.2fs)", log_prefix, final_status, wait_duration)
+                _print(console, quiet, f"  ✅ Deallocation of {vm_name} completed ({final_status}).")
             elif poller:
                  # Log status even if not waiting
                  current_status = poller.status()
-                 logger.info(f"{log_prefix}: Deallocation initiated, not waiting for completion (poller status: {current_status}).")
-                 console.print(f"  ✅ Deallocation of {vm_name} initiated (status: {current_status}).")
+                 logger.info("%s: Deallocation initiated, not waiting for completion (poller status: %s).", log_prefix, current_status)
+                 _print(console, quiet, f"  ✅ Deallocation of {vm_name} initiated (status: {current_status}).")
 
-            duration = time.time() - start_time
-            logger.info(f"{log_prefix}: Deallocation request processed successfully. Total time: {duration:.2f}s")
+            duration = (time.perf_counter_ns() - start_ns) / 1e9
+            logger.info("%s: Deallocation request processed successfully. Total time: %.2fs", log_prefix, duration)
             return True # Indicate success
         except ResourceNotFoundError:
-             duration = time.time() - start_time
-             log_msg = f"{log_prefix}: VM not found (perhaps already deleted/deallocated?). Operation took {duration:.2f}s."
-             logger.warning(log_msg)
-             console.print(f"  [yellow]Warning:[/yellow] VM '{vm_name}' not found. Skipping.")
+             duration = (time.perf_counter_ns() - start_ns) / 1e9
+             logger.warning("%s: VM not found (perhaps already deleted/deallocated?). Operation took %.2fs.", log_prefix, duration)
+             _print(console, quiet, f"  [yellow]Warning:[/yellow] VM '{vm_name}' not found. Skipping.")
              return False # Indicate failure/skip
         except Exception as e:
-            duration = time.time() - start_time
-            final_status = f"failed ({e})" if not poller else f"{poller.status()} ({e})"
-            log_msg = f"{log_prefix}: Error during deallocation process. Final status: {final_status}. Operation took {duration:.2f}s."
-            logger.error(log_msg, exc_info=True)
-            console.print(f"  [bold red]Error deallocating {vm_name}:[/bold red] {e}")
+            duration = (time.perf_counter_ns() - start_ns) / 1e9
+            final_status = f"failed ({e})" if not poller else f"{_safe_poller_status(poller)} ({e})"
+            logger.error("%s: Error during deallocation process. Final status: %s. Operation took %.2fs.", log_prefix, final_status, duration, exc_info=True)
+            _print(console, quiet, f"  [bold red]Error deallocating {vm_name}:[/bold red] {e}")
             return False # Indicate failure
     else:
-        logger.info(f"{log_prefix}: User skipped deallocation.")
-        console.print(f"  Skipping deallocation of VM '{vm_name}'.")
+        logger.info("%s: User skipped deallocation.", log_prefix)
+        _print(console, quiet, f"  Skipping deallocation of VM '{vm_name}'.")
         return False # Indicate skip
 
 # --- Main Cleanup Orchestration ---
-def perform_interactive_cleanup(credential, subscription_id, findings_dfs: dict, console: Console = _console, wait_for_completion=False, force_cleanup=False):
-    """Iterates through findings DataFrames and prompts for cleanup actions."""
-    logger = logging.getLogger() # Get logger instance
+def _cleanup_row(credential, subscription_id, finding_key, resource_type_str, index, resource_id, resource_name, rg_name, clients, console: Console, wait_for_completion, force_cleanup, type_decisions=None, pending_pollers=None, quiet=False):
+    """Deletes (or, for stopped VMs, deallocates) the resource described by a single findings row.
+
+    Returns one of "succeeded", "not_succeeded" (skipped or failed inside the action) or
+    "failed" (unexpected error processing the row). Rows are validated by the caller beforehand.
+    """
+    try:
+        if resource_type_str == "Stopped VM":
+            logger.debug("Attempting deallocation for VM '%s' in RG '%s'.", resource_name, rg_name)
+            success = deallocate_vm(
+                credential=credential,
+                subscription_id=subscription_id,
+                rg_name=rg_name,
+                vm_name=resource_name,
+                compute_client=clients['compute'],
+                console=console,
+                wait_for_completion=wait_for_completion,
+                force_cleanup=force_cleanup,
+                type_decisions=type_decisions,
+                pending_pollers=pending_pollers,
+                quiet=quiet
+            )
+            return "succeeded" if success else "not_succeeded"
+
+        logger.debug("Attempting deletion for %s '%s' (ID: %s).", resource_type_str, resource_name, resource_id)
+        # Call the generic delete function
+        success = delete_resource(
+            credential=credential,
+            subscription_id=subscription_id,
+            resource_id=resource_id,
+            resource_type=resource_type_str,
+            resource_name=resource_name,
+            clients=clients,
+            console=console,
+            wait_for_completion=wait_for_completion,
+            force_cleanup=force_cleanup,
+            rg_name=rg_name,
+            type_decisions=type_decisions,
+            pending_pollers=pending_pollers,
+            quiet=quiet
+        )
+        # Note: A False return doesn't distinguish between user skip and actual failure,
+        # but delete_resource logs the specifics.
+        return "succeeded" if success else "not_succeeded"
+
+    except Exception as e:
+        logger.error("Unexpected error processing row %s (Name: %s, ID: %s) for %s during cleanup: %s", index, resource_name, resource_id, finding_key, e, exc_info=True)
+        _print(console, quiet, f"  [red]Error:[/red] Unexpected error during cleanup for {resource_name}: {e}.")
+        return "failed"
+
+def _fast_cleanup_row(clients, dispatch_entry, resource_type, index, resource_id, resource_name, rg_name):
+    """Row runner for unattended force cleanup: maps _fast_delete onto the _cleanup_row outcomes."""
+    if dispatch_entry[2] and not rg_name:
+        logger.error("Could not parse resource group from ID %s for %s. Cannot delete.", resource_id, resource_name)
+        return "not_succeeded"
+    return "succeeded" if _fast_delete(clients, dispatch_entry, resource_type, resource_id, resource_name, rg_name) else "not_succeeded"
+
+def _find_existing_ids(arg_client, subscription_id, resource_ids, batch_size=ARG_ID_BATCH_SIZE):
+    """Returns the lower-cased subset of resource_ids that Azure Resource Graph still knows about.
+
+    One query per batch_size IDs replaces a round-trip per resource that would otherwise only
+    learn "already gone" from a ResourceNotFoundError. Returns None if the lookup fails, in which
+    case callers should not filter anything.
+    """
+    existing_ids = set()
+    resource_ids = list(resource_ids)
+    try:
+        for start in range(0, len(resource_ids), batch_size):
+            batch = resource_ids[start:start + batch_size]
+            id_list = ", ".join("'{}'".format(resource_id.replace("'", "\\'")) for resource_id in batch)
+            # Resource groups live in ResourceContainers, everything else in Resources
+            kql_query = f"union Resources, ResourceContainers | where id in~ ({id_list}) | project id"
+            query_request = QueryRequest(subscriptions=[subscription_id], query=kql_query, options=QueryRequestOptions(top=len(batch)))
+            query_response = arg_client.resources(query_request)
+            existing_ids.update(row['id'].lower() for row in (query_response.data or []) if row.get('id'))
+        logger.debug("ARG existence check: %s of %s candidate resource(s) still exist.", len(existing_ids), len(resource_ids))
+        return existing_ids
+    except Exception as e:
+        logger.warning("Could not pre-check resource existence via Resource Graph, attempting every action: %s", e, exc_info=True)
+        return None
+
+def _run_rows_concurrently(run_row, rows, max_workers):
+    """Runs run_row(index, *row) for each (index, row) on a bounded thread pool; returns the outcomes."""
+    worker_count = min(max_workers, len(rows))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=worker_count) as executor:
+        futures = [executor.submit(run_row, index, *row) for index, row in rows]
+        return [future.result() for future in concurrent.futures.as_completed(futures)]
+
+def _wait_for_pending_pollers(pending_pollers, max_workers, console: Console = _console, quiet=False):
+    """Waits for all initiated operations together and returns how many of them failed.
+
+    Total wait time is roughly that of the slowest operation rather than the sum of all of them.
+    """
+    failed = 0
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        TextColumn("{task.completed}/{task.total}"),
+        console=console,
+        transient=True
+    ) as progress:
+        task = progress.add_task("[cyan]Waiting for cleanup operations to complete...", total=len(pending_pollers))
+        start_wait_ns = time.perf_counter_ns()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(pending_pollers))) as executor:
+            futures = {
+                executor.submit(poller.result): (resource_name, log_prefix, poller)
+                for resource_name, log_prefix, poller in pending_pollers
+            }
+            for future in concurrent.futures.as_completed(futures):
+                resource_name, log_prefix, poller = futures[future]
+                try:
+                    future.result()
+                    logger.info("%s: Operation completed. Final Poller State: %s (Wait time: %.2fs)", log_prefix, _safe_poller_status(poller), (time.perf_counter_ns() - start_wait_ns) / 1e9)
+                    _print(console, quiet, f"  ✅ {resource_name} completed.")
+                except Exception as e:
+                    failed += 1
+                    logger.error("%s: Operation failed while waiting for completion: %s", log_prefix, e, exc_info=True)
+                    _print(console, quiet, f"  [bold red]Error completing operation for {resource_name}:[/bold red] {e}")
+                progress.advance(task)
+    return failed
+
+def perform_interactive_cleanup(credential, subscription_id, findings_dfs: dict, console: Console = _console, wait_for_completion=False, force_cleanup=False, max_workers=CLEANUP_MAX_WORKERS):
+    """Iterates through findings DataFrames and prompts for cleanup actions.
+
+    With force_cleanup, up to max_workers actions of each type run concurrently. When force_cleanup
+    runs without a terminal on stdout (cron/CI), per-resource status is only logged and the console
+    just gets the section headers and the final summary.
+    """
     console.print("\n[bold cyan]--- Interactive Cleanup ---[/]")
+    if not force_cleanup and not sys.stdin.isatty():
+        logger.warning("Interactive cleanup requested but stdin is not a TTY. Skipping all cleanup actions.")
+        console.print("[yellow]No interactive terminal detected, so cleanup prompts cannot be answered. Skipping cleanup (use --force-cleanup for non-interactive runs).[/]")
+        return
     if force_cleanup:
         console.print(":warning: [bold red]--force-cleanup flag is active! Actions will proceed without confirmation.[/] :warning:")
     else:
-        console.print(":warning: [yellow]You will be prompted to confirm each action. Deletions may take time.[/] :warning:")
+        console.print(":warning: [yellow]You will be prompted to confirm each action (answer 'a' to approve or 's' to skip all remaining items of a type). Deletions may take time.[/] :warning:")
     if wait_for_completion:
-        console.print(":hourglass: [cyan]Waiting for each cleanup operation to complete...[/]")
+        console.print(":hourglass: [cyan]Will wait for all cleanup operations to complete once they have been started...[/]")
 
     # Initialize clients needed for actions within this function scope
     try:
         logger.debug("Initializing Azure management clients for cleanup.")
+        # One transport for all clients so concurrent actions reuse pooled connections
+        # Size the pool to the worker count so a wide fan-out never queues on connections
+        transport = build_shared_transport(pool_maxsize=max(HTTP_CONNECTION_POOL_SIZE, max_workers))
         clients = {
-            'resource': ResourceManagementClient(credential, subscription_id),
-            'compute': ComputeManagementClient(credential, subscription_id),
-            'network': NetworkManagementClient(credential, subscription_id),
-            'web': WebSiteManagementClient(credential, subscription_id)
+            'resource': ResourceManagementClient(credential, subscription_id, transport=transport),
+            'compute': ComputeManagementClient(credential, subscription_id, transport=transport),
+            'network': NetworkManagementClient(credential, subscription_id, transport=transport),
+            'web': WebSiteManagementClient(credential, subscription_id, transport=transport),
+            'graph': ResourceGraphClient(credential, transport=transport)
         }
         logger.debug("Azure management clients initialized successfully.")
     except Exception as client_error:
-        logger.error(f"Failed to initialize Azure clients for cleanup: {client_error}", exc_info=True)
+        logger.error("Failed to initialize Azure clients for cleanup: %s", client_error, exc_info=True)
         console.print(f"[bold red]Error initializing Azure clients:[/bold red] {client_error}. Cleanup aborted.")
         return
 
     # Define mapping from DataFrame key to resource type string used in delete_resource
-    # This mapping ensures we call delete_resource with the correct type
+    # This mapping ensures we call delete_resource with the correct type.
+    # Ordered leaf-first so individual resources are handled before the containers holding them.
     cleanup_map = {
         'unattached_disks': 'Unattached Disk',
-        'unused_public_ips': 'Unused Public IP',
-        'empty_rgs': 'Empty Resource Group',
-        'empty_asps': 'Empty App Service Plan',
         'old_snapshots': 'Old Disk Snapshot',
         'orphaned_nsgs': 'Orphaned Network Security Group',
-        'orphaned_rts': 'Orphaned Route Table'
-        # Add other deletable resource types here
+        'orphaned_rts': 'Orphaned Route Table',
+        'unused_public_ips': 'Unused Public IP',
+        'empty_asps': 'Empty App Service Plan',
+        'empty_rgs': 'Empty Resource Group',
+        'stopped_vms': 'Stopped VM' # Deallocated rather than deleted
+        # Add other cleanable resource types here
     }
 
     total_actions_attempted = 0
     total_actions_succeeded = 0
     total_actions_skipped = 0
     total_actions_failed = 0
+    type_decisions = {} # Per-resource-type "all"/"skip" answers from the confirmation prompt
+    # With --wait-for-cleanup, pollers are collected here and awaited together once everything is started
+    pending_pollers = [] if wait_for_completion else None
+    quiet = force_cleanup and not sys.stdout.isatty()
+    seen_ids = set() # Lower-cased IDs already handled, so a resource in two findings is only acted on once
+
+    # Look up once which candidates still exist, so a re-run after a partial sweep does not spend
+    # a round-trip per resource just to be told it is already gone
+    candidate_ids = set()
+    for finding_key in cleanup_map:
+        df = findings_dfs.get(finding_key)
+        if df is not None and 'ID' in df.columns:
+            candidate_ids.update(df['ID'].dropna().loc[lambda ids: ids != ''])
+    existing_ids = _find_existing_ids(clients['graph'], subscription_id, candidate_ids) if candidate_ids else None
 
     # Iterate through findings that have a corresponding action
     for finding_key, resource_type_str in cleanup_map.items():
@@ -233,103 +486,99 @@ def perform_interactive_cleanup(credential, subscription_id, findings_dfs: dict,
         if df is not None and not df.empty:
             console.print(f"\n🧹 [bold]Checking {resource_type_str}s for cleanup...[/]")
             # Ensure necessary columns exist
-            if 'ID' not in df.columns or 'Name' not in df.columns:
-                logger.warning(f"Skipping cleanup for {finding_key}: DataFrame missing required 'ID' or 'Name' column.")
-                console.print(f"  [yellow]Warning:[/yellow] Cannot perform cleanup for {finding_key}, missing ID or Name column.")
+            required_columns = _REQUIRED_COLUMNS.get(finding_key, ('ID', 'Name'))
+            if not set(df.columns) >= set(required_columns):
+                missing_desc = " or ".join(required_columns)
+                logger.warning("Skipping cleanup for %s: DataFrame missing required %s column.", finding_key, missing_desc)
+                console.print(f"  [yellow]Warning:[/yellow] Cannot perform cleanup for {finding_key}, missing {missing_desc} column.")
                 continue
 
-            logger.info(f"Processing {len(df)} potential {resource_type_str}(s) for deletion.")
-            for index, row in df.iterrows():
-                try:
-                     resource_id = row['ID']
-                     resource_name = row['Name']
-                     if not resource_id or not resource_name:
-                         logger.warning(f"Skipping row {index} for {finding_key}: Missing ID ('{resource_id}') or Name ('{resource_name}').")
-                         console.print(f"  [yellow]Warning:[/yellow] Skipping item at index {index} due to missing ID/Name.")
-                         continue
-
-                     logger.debug(f"Attempting deletion for {resource_type_str} '{resource_name}' (ID: {resource_id}).")
-                     total_actions_attempted += 1
-                     # Call the generic delete function
-                     success = delete_resource(
-                         credential=credential,
-                         subscription_id=subscription_id,
-                         resource_id=resource_id,
-                         resource_type=resource_type_str,
-                         resource_name=resource_name,
-                         clients=clients,
-                         console=console,
-                         wait_for_completion=wait_for_completion,
-                         force_cleanup=force_cleanup
-                     )
-                     # Tally results based on return value (True=Success/Initiated, False=Skipped/Failed)
-                     # Note: This doesn't distinguish between user skip and actual failure here,
-                     # but delete_resource logs the specifics.
-                     if success:
-                         total_actions_succeeded += 1
-                     # else: # A False return could be skip or failure - logged internally
-                     #     total_actions_failed += 1 # Or track skips separately if needed
-
-                except KeyError as e:
-                    logger.error(f"Missing expected column {e} in DataFrame for {finding_key} at row {index} during cleanup.", exc_info=True)
-                    console.print(f"  [red]Error:[/red] Internal error processing cleanup for {finding_key} - missing column {e}.")
-                    total_actions_failed += 1
-                except Exception as e:
-                    # Log the specific resource name/ID if available
-                    r_name = row.get('Name', 'Unknown')
-                    r_id = row.get('ID', 'Unknown')
-                    logger.error(f"Unexpected error processing row {index} (Name: {r_name}, ID: {r_id}) for {finding_key} during cleanup: {e}", exc_info=True)
-                    console.print(f"  [red]Error:[/red] Unexpected error during cleanup for {r_name}: {e}.")
-                    total_actions_failed += 1
+            # Drop rows missing any required value in one pass instead of checking row by row
+            key_columns = df[list(required_columns)]
+            valid_mask = (key_columns.notna() & key_columns.ne('')).all(axis=1)
+            if not valid_mask.all():
+                invalid_count = int((~valid_mask).sum())
+                logger.warning("Skipped %s row(s) with missing %s for %s.", invalid_count, "/".join(required_columns), finding_key)
+                console.print(f"  [yellow]Warning:[/yellow] Skipping {invalid_count} item(s) due to missing {'/'.join(required_columns)}.")
+                df = df[valid_mask]
 
-    # Specific action for Stopped VMs (Deallocate)
-    stopped_vms_df = findings_dfs.get('stopped_vms')
-    if stopped_vms_df is not None and not stopped_vms_df.empty:
-        console.print("\n🧹 [bold]Checking Stopped VMs for deallocation...[/]")
-        if 'Resource Group' not in stopped_vms_df.columns or 'Name' not in stopped_vms_df.columns:
-             logger.warning("Skipping deallocation: DataFrame missing required 'Resource Group' or 'Name' column.")
-             console.print("  [yellow]Warning:[/yellow] Cannot perform deallocation, missing Resource Group or Name column.")
-        else:
-            logger.info(f"Processing {len(stopped_vms_df)} potential Stopped VM(s) for deallocation.")
-            for index, row in stopped_vms_df.iterrows():
-                try:
-                    rg_name = row['Resource Group']
-                    vm_name = row['Name']
-                    if not rg_name or not vm_name:
-                         logger.warning(f"Skipping row {index} for stopped_vms: Missing Resource Group ('{rg_name}') or Name ('{vm_name}').")
-                         console.print(f"  [yellow]Warning:[/yellow] Skipping item at index {index} due to missing RG/Name.")
-                         continue
-
-                    logger.debug(f"Attempting deallocation for VM '{vm_name}' in RG '{rg_name}'.")
+            has_ids = 'ID' in df.columns
+            if has_ids:
+                # Drop IDs already handled under another finding (or repeated here); ARM IDs are case-insensitive
+                # Rows without an ID (allowed for stopped VMs) are distinct resources, not duplicates of each other
+                id_keys = df['ID'].str.lower()
+                has_id = id_keys.notna() & id_keys.ne('')
+                duplicate_mask = has_id & (id_keys.isin(seen_ids) | id_keys.duplicated())
+                if duplicate_mask.any():
+                    logger.info("Skipping %s duplicate resource ID(s) in %s.", int(duplicate_mask.sum()), finding_key)
+                    df = df[~duplicate_mask]
+                seen_ids.update(id_keys[has_id & ~duplicate_mask])
+
+                if existing_ids is not None:
+                    # Only rows with an ID were looked up, so a missing ID says nothing about existence
+                    gone_mask = df['ID'].notna() & df['ID'].ne('') & ~df['ID'].str.lower().isin(existing_ids)
+                    if gone_mask.any():
+                        gone_count = int(gone_mask.sum())
+                        logger.info("Skipping %s %s(s) in %s that no longer exist.", gone_count, resource_type_str, finding_key)
+                        console.print(f"  Skipping {gone_count} {resource_type_str}(s) that no longer exist.")
+                        df = df[~gone_mask]
+
+            logger.info("Processing %s potential %s(s) for cleanup.", len(df), resource_type_str)
+            # Pull the needed columns out once rather than boxing every row into a Series,
+            # and parse every resource group name in one vectorized split
+            if 'Resource Group' in required_columns:
+                rg_names = df['Resource Group'].to_numpy()
+            elif _DELETE_DISPATCH[resource_type_str][2]:
+                rg_names = df['ID'].str.split('/', n=5).str[4].to_numpy(dtype=object, na_value=None)
+            else:
+                rg_names = [None] * len(df) # RG deletes address the group by name
+            ids = df['ID'].to_numpy() if has_ids else [None] * len(df)
+            rows = list(enumerate(zip(ids, df['Name'].to_numpy(), rg_names)))
+            if quiet and not wait_for_completion and resource_type_str in _DELETE_DISPATCH:
+                # Unattended fire-and-forget deletes: skip the prompt/wait/print machinery entirely
+                run_row = functools.partial(_fast_cleanup_row, clients, _DELETE_DISPATCH[resource_type_str], resource_type_str)
+            else:
+                run_row = functools.partial(
+                    _cleanup_row, credential, subscription_id, finding_key, resource_type_str,
+                    clients=clients, console=console, wait_for_completion=wait_for_completion,
+                    force_cleanup=force_cleanup, type_decisions=type_decisions,
+                    pending_pollers=pending_pollers, quiet=quiet
+                )
+            if force_cleanup and len(rows) > 1:
+                # No prompts to serialize on, so overlap the ARM round-trips across a bounded pool.
+                # The clients dict is shared; azure-mgmt clients are safe for independent concurrent calls.
+                logger.debug("Cleaning up %s %s(s) concurrently with up to %s workers.", len(rows), resource_type_str, max_workers)
+                outcomes = _run_rows_concurrently(run_row, rows, max_workers)
+            else:
+                outcomes = []
+                for index, row in rows:
+                    decision = type_decisions.get(resource_type_str)
+                    if decision == "skip":
+                        logger.info("User skipped the remaining %s %s(s).", len(rows) - index, resource_type_str)
+                        console.print(f"  Skipping remaining {resource_type_str}s.")
+                        break
+                    if decision == "all":
+                        # Approved for the whole type, so the rest no longer has to wait on prompts
+                        outcomes.extend(_run_rows_concurrently(run_row, rows[index:], max_workers))
+                        break
+                    outcomes.append(run_row(index, *row))
+
+            for outcome in outcomes:
+                if outcome in ("succeeded", "not_succeeded"):
                     total_actions_attempted += 1
-                    success = deallocate_vm(
-                        credential=credential,
-                        subscription_id=subscription_id,
-                        rg_name=rg_name,
-                        vm_name=vm_name,
-                        compute_client=clients['compute'],
-                        console=console,
-                        wait_for_completion=wait_for_completion,
-                        force_cleanup=force_cleanup
-                    )
-                    if success:
-                        total_actions_succeeded += 1
-                    # else: # Skip or failure
-                    #     total_actions_failed += 1
-
-                except KeyError as e:
-                    logger.error(f"Missing expected column {e} in DataFrame for stopped_vms at row {index} during deallocation.", exc_info=True)
-                    console.print(f"  [red]Error:[/red] Internal error processing deallocation - missing column {e}.")
+                if outcome == "succeeded":
+                    total_actions_succeeded += 1
+                elif outcome == "failed":
                     total_actions_failed += 1
-                except Exception as e:
-                     vm_n = row.get('Name', 'Unknown')
-                     rg_n = row.get('Resource Group', 'Unknown')
-                     logger.error(f"Unexpected error processing row {index} (Name: {vm_n}, RG: {rg_n}) for stopped_vms during deallocation: {e}", exc_info=True)
-                     console.print(f"  [red]Error:[/red] Unexpected error during deallocation for {vm_n}: {e}.")
-                     total_actions_failed += 1
+
+    if pending_pollers:
+        console.print(f"\n:hourglass: [cyan]Waiting for {len(pending_pollers)} initiated operation(s) to complete...[/]")
+        failed_on_wait = _wait_for_pending_pollers(pending_pollers, max_workers, console, quiet)
+        total_actions_succeeded -= failed_on_wait
+        total_actions_failed += failed_on_wait
 
     # Log summary of cleanup actions
-    logger.info(f"Cleanup process finished. Attempted: {total_actions_attempted}, Succeeded/Initiated: {total_actions_succeeded}, Failed: {total_actions_failed}.") # Note: Skipped are implicitly not in Succeeded/Failed
+    logger.info("Cleanup process finished. Attempted: %s, Succeeded/Initiated: %s, Failed: %s.", total_actions_attempted, total_actions_succeeded, total_actions_failed) # Note: Skipped are implicitly not in Succeeded/Failed
     console.print(f"\n[bold cyan]--- Cleanup Summary ---[/]")
     console.print(f"  Actions Attempted: {total_actions_attempted}")
     console.print(f"  Actions Succeeded/Initiated: {total_actions_succeeded}")
@@ -1,27 +1,34 @@
+import json
 import logging
+import numpy as np
+import pandas as pd
+import requests
+import threading
 from datetime import datetime, timedelta, timezone
 from collections import defaultdict
 
-# Azure SDK clients
-from azure.identity import DefaultAzureCredential, AzureCliCredential, ManagedIdentityCredential, ChainedTokenCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.compute import ComputeManagementClient
-from azure.mgmt.network import NetworkManagementClient
-from azure.mgmt.web import WebSiteManagementClient
-from azure.mgmt.monitor import MonitorManagementClient
-from azure.mgmt.sql import SqlManagementClient
-from azure.mgmt.costmanagement import CostManagementClient
-from azure.mgmt.costmanagement.models import QueryTimePeriod, QueryDataset, QueryDefinition
+# Azure SDK clients (management packages are slow to import, so they load on first use)
 from azure.core.exceptions import HttpResponseError, ClientAuthenticationError
-from azure.mgmt.resourcegraph import ResourceGraphClient
-from azure.mgmt.resourcegraph.models import QueryRequest, QueryRequestOptions
+from azure.core.pipeline.policies import RetryPolicy
+from azure.core.rest import HttpRequest
+from .utils import LazyImport
+ComputeManagementClient = LazyImport("azure.mgmt.compute", "ComputeManagementClient")
+NetworkManagementClient = LazyImport("azure.mgmt.network", "NetworkManagementClient")
+MonitorManagementClient = LazyImport("azure.mgmt.monitor", "MonitorManagementClient")
+CostManagementClient = LazyImport("azure.mgmt.costmanagement", "CostManagementClient")
+QueryTimePeriod = LazyImport("azure.mgmt.costmanagement.models", "QueryTimePeriod")
+QueryDataset = LazyImport("azure.mgmt.costmanagement.models", "QueryDataset")
+QueryDefinition = LazyImport("azure.mgmt.costmanagement.models", "QueryDefinition")
+QueryResult = LazyImport("azure.mgmt.costmanagement.models", "QueryResult")
+ResourceGraphClient = LazyImport("azure.mgmt.resourcegraph", "ResourceGraphClient")
+QueryRequest = LazyImport("azure.mgmt.resourcegraph.models", "QueryRequest")
+QueryRequestOptions = LazyImport("azure.mgmt.resourcegraph.models", "QueryRequestOptions")
 
 # Rich for console output
 from rich.console import Console
 from rich.table import Table
-from rich.progress import track # For simple progress bars if needed elsewhere
 import concurrent.futures # For potential parallelization
-import time # For potential retries
+import time # For throttling retries
 
 # Import constants from config module
 # Use relative import assuming config.py is in the same directory
@@ -33,12 +40,177 @@ from .config import (
     SQL_DB_LOW_DTU_THRESHOLD_PERCENT,
     SQL_VCORE_LOW_CPU_THRESHOLD_PERCENT,
     IDLE_CONNECTION_THRESHOLD_GATEWAY,
-    LOW_CPU_THRESHOLD_WEB_APP
+    LOW_CPU_THRESHOLD_WEB_APP,
+    ANALYSIS_MAX_WORKERS,
+    ARG_PAGE_SIZE,
+    ARG_ID_BATCH_SIZE,
+    ARG_MAX_PAGES,
+    ARG_MAX_CONCURRENT_QUERIES,
+    ARG_QUERY_BURST,
+    ARG_QUERIES_PER_SECOND,
+    ARM_READ_BURST,
+    ARM_READS_PER_SECOND,
+    ANALYSIS_CHECK_WORKERS,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_WAIT_SECONDS,
+    COST_CACHE_TTL_HOURS,
+    COST_SETTLE_DAYS,
+    COST_BREAKDOWN_MAX_ROWS,
+    COST_MAX_PAGES,
+    METRICS_BATCH_SIZE,
+    METRICS_MAX_CONCURRENT_QUERIES,
+    METRICS_BATCH_API_VERSION,
+    METRICS_CACHE_FILENAME,
+    METRICS_CACHE_TTL_MINUTES,
+    TOKEN_REFRESH_MARGIN_SECONDS,
+    THROTTLE_SLOWDOWN_SECONDS
 )
+from . import cache
+from .utils import resource_group_from_id
+from .clients import build_shared_transport
 
 # Initialize console for potential standalone use or if passed
 _console = Console()
 
+# --- Utility Functions for Client Reuse ---
+
+class _CappedRetryPolicy(RetryPolicy):
+    """azure-core's retry policy, minus throttling: 429s and any Retry-After over RETRY_MAX_WAIT_SECONDS.
+
+    Left to itself, azure-core retries a 429 up to ten times and sleeps out the full Retry-After, so
+    _with_retry's cap and the rate limiters' throttling feedback would only see a 429 after all of that.
+    Connection errors and 5xx responses are still retried here.
+    """
+
+    def is_retry(self, settings, response):
+        if response.http_response.status_code == 429:
+            return False
+        retry_after = self.get_retry_after(response)
+        if retry_after and retry_after > RETRY_MAX_WAIT_SECONDS:
+            return False
+        return super().is_retry(settings, response)
+
+# Management clients are shared across checks (and their threads) rather than rebuilt in every call.
+# Keyed by client class and constructor arguments, so each credential/subscription pair gets its own.
+_clients = {}
+_clients_lock = threading.Lock()
+# All of them talk to the same ARM endpoint, so they also share one pooled transport (built on first use)
+_transport = None
+
+def _get_client(client_class, *args, **kwargs):
+    """Returns the shared client_class(*args, **kwargs), constructing it on first request.
+
+    Every client is built on the one shared transport, so its connections (and their TLS sessions) stay
+    open for the other clients and checks rather than each client keeping a pool of its own. Clients also
+    get _CappedRetryPolicy, which leaves 429s to _with_retry.
+    """
+    global _transport
+    key = (client_class, args, tuple(sorted(kwargs.items())))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            if _transport is None:
+                _transport = build_shared_transport()
+            client = _clients[key] = client_class(*args, transport=_transport, retry_policy=_CappedRetryPolicy(), **kwargs)
+    return client
+
+# Tokens for calls made outside the SDK clients (the metrics batch API), shared across checks. Management
+# clients cache their own tokens, but a bare get_token may re-run the credential chain (e.g. an `az` call) each time.
+_tokens = {}
+_tokens_lock = threading.Lock()
+
+def _get_token(credential, scope):
+    """Returns a cached access token string for scope, fetching a new one within TOKEN_REFRESH_MARGIN_SECONDS of expiry."""
+    key = (credential, scope)
+    with _tokens_lock:
+        access_token = _tokens.get(key)
+        if access_token is None or access_token.expires_on - time.time() < TOKEN_REFRESH_MARGIN_SECONDS:
+            access_token = _tokens[key] = credential.get_token(scope)
+    return access_token.token
+
+# --- Utility Functions for Throttling Retries ---
+
+def _retry_after_seconds(response, attempt):
+    """Returns how long the server asked us to wait, else an exponential backoff for this attempt."""
+    headers = getattr(response, "headers", None) or {}
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass # HTTP-date form; fall through
+    # Resource Graph reports its quota window as hh:mm:ss
+    quota_resets_after = headers.get("x-ms-user-quota-resets-after")
+    if quota_resets_after:
+        try:
+            hours, minutes, seconds = quota_resets_after.split(":")
+            return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        except ValueError:
+            pass
+    return float(2 ** attempt)
+
+def _with_retry(fn, *args, **kwargs):
+    """Calls fn(*args, **kwargs), retrying HTTP 429 responses after the server-advertised wait.
+
+    This is the only layer that retries throttling: clients from _get_client use _CappedRetryPolicy,
+    so SDK calls raise their first 429 here, as do the raw metrics batch POSTs.
+    Up to RETRY_MAX_ATTEMPTS attempts. Any other error, a 429 on the last attempt, or a 429 asking
+    for a wait longer than RETRY_MAX_WAIT_SECONDS is raised to the caller, so one exhausted quota
+    reports a throttling error instead of stalling the whole run.
+    """
+    for attempt in range(RETRY_MAX_ATTEMPTS):
+        try:
+            return fn(*args, **kwargs)
+        except (HttpResponseError, requests.HTTPError) as e:
+            response = getattr(e, "response", None)
+            status_code = getattr(e, "status_code", None) or getattr(response, "status_code", None)
+            if status_code != 429 or attempt == RETRY_MAX_ATTEMPTS - 1:
+                raise
+            wait = _retry_after_seconds(response, attempt)
+            if wait > RETRY_MAX_WAIT_SECONDS:
+                logging.getLogger().warning(f"Throttled calling {getattr(fn, '__name__', fn)}; the server asked for {wait:.0f}s, more than the {RETRY_MAX_WAIT_SECONDS}s limit, so not retrying.")
+                raise
+            logging.getLogger().warning(f"Throttled calling {getattr(fn, '__name__', fn)}; retrying in {wait:.1f}s (attempt {attempt + 1} of {RETRY_MAX_ATTEMPTS}).")
+            time.sleep(wait)
+
+def _is_resource_gone(error):
+    """True if error is a 404/410 response, i.e. the resource was deleted after the scan found it."""
+    return isinstance(error, HttpResponseError) and error.status_code in (404, 410)
+
+class _TokenBucket:
+    """Client-side rate limit shared across threads: bursts of up to capacity calls, refilled at rate per second.
+
+    Keeps side-by-side checks under a service's documented request budget, so 429s (and
+    _with_retry's waits) stay the exception rather than the pacing mechanism. When one still
+    arrives, throttled() halves the rate for THROTTLE_SLOWDOWN_SECONDS.
+    """
+
+    def __init__(self, capacity, rate):
+        self._capacity = capacity
+        self._rate = rate
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._slow_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes one token, sleeping until it is available. Tokens may go negative, which reserves future ones in call order."""
+        with self._lock:
+            now = time.monotonic()
+            rate = self._rate / 2 if now < self._slow_until else self._rate
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+    def throttled(self):
+        """Records a 429: drops any saved-up burst and refills at half rate until the slowdown expires."""
+        with self._lock:
+            self._tokens = min(self._tokens, 0.0)
+            self._slow_until = time.monotonic() + THROTTLE_SLOWDOWN_SECONDS
+
 # --- Utility Function for Timespan ---
 
 def _get_iso8601_timespan(lookback_days: int) -> str:
@@ -49,38 +221,564 @@ def _get_iso8601_timespan(lookback_days: int) -> str:
     timespan = f"{start_utc.strftime('%Y-%m-%dT%H:%M:%SZ')}/{now_utc.strftime('%Y-%m-%dT%H:%M:%SZ')}"
     return timespan
 
+# --- Utility Functions for Metrics ---
+
+def _mean_average(data_points):
+    """Returns the mean of the points' .average values, skipping missing ones; None if there are none."""
+    # One pass with a running sum and count, so no list of averages is built for each resource
+    total, count = 0.0, 0
+    for point in data_points:
+        average = point.average
+        if average is not None:
+            total += average
+            count += 1
+    return total / count if count else None
+
+def _first_series_data(metrics_data):
+    """Returns the data points of the first time series in a metrics.list response; empty if it has none."""
+    value = metrics_data.value if metrics_data else None
+    # An empty series carries data=None rather than an empty list
+    return (value[0].timeseries[0].data or ()) if value and value[0].timeseries else ()
+
+
+# Caps per-resource metrics calls in flight, since several checks fan out over their own thread pools at once,
+# and paces them within ARM's per-subscription read budget
+_metrics_query_slots = threading.BoundedSemaphore(METRICS_MAX_CONCURRENT_QUERIES)
+_metrics_rate_limit = _TokenBucket(ARM_READ_BURST, ARM_READS_PER_SECOND)
+
+def _limited_metrics_list(monitor_client, **kwargs):
+    """Runs one metrics.list call while holding a query slot (released again during any retry wait)."""
+    with _metrics_query_slots:
+        _metrics_rate_limit.acquire()
+        try:
+            return monitor_client.metrics.list(**kwargs)
+        except HttpResponseError as e:
+            if e.status_code == 429:
+                _metrics_rate_limit.throttled()
+            raise
+
+def _fetch_metric_average(monitor_client, resource_id, metric_name, timespan, batch_averages):
+    """Returns the resource's average from the batch results, else from its own daily metrics.list query.
+
+    None means the metric had no data points over the timespan.
+    """
+    resource_key = resource_id.lower()
+    if resource_key in batch_averages:
+        return batch_averages[resource_key]
+    metrics_data = _with_retry(
+        _limited_metrics_list, monitor_client,
+        resource_uri=resource_id,
+        timespan=timespan,
+        interval='P1D',
+        metricnames=metric_name,
+        aggregation="Average"
+    )
+    return _mean_average(_first_series_data(metrics_data))
+
+def _post_and_check(url, **kwargs):
+    """POSTs with requests and raises for HTTP error statuses (so 429s reach _with_retry)."""
+    response = requests.post(url, **kwargs)
+    response.raise_for_status()
+    return response
+
+def _query_metrics_batch(token, subscription_id, region, metric_namespace, metric_name, resource_ids, lookback_days, interval):
+    """Calls the regional Azure Monitor metrics:getBatch endpoint for up to METRICS_BATCH_SIZE resources.
+
+    Returns {lower-cased resource ID: float64 array of averages, NaN where a point has none}.
+    """
+    now_utc = datetime.now(timezone.utc)
+    response = _with_retry(
+        _post_and_check,
+        f"https://{region}.metrics.monitor.azure.com/subscriptions/{subscription_id}/metrics:getBatch",
+        params={
+            "api-version": METRICS_BATCH_API_VERSION,
+            "metricnamespace": metric_namespace,
+            "metricnames": metric_name,
+            "starttime": (now_utc - timedelta(days=lookback_days)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "endtime": now_utc.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "interval": interval,
+            "aggregation": "average",
+        },
+        json={"resourceids": resource_ids},
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=60
+    )
+    points_by_id = {}
+    for resource_values in response.json().get("values", []):
+        series = [s for metric in resource_values.get("value", []) for s in metric.get("timeseries", [])[:1]]
+        # Missing averages become NaN so the whole series converts in one step
+        points_by_id[resource_values.get("resourceid", "").lower()] = np.array(
+            [point.get("average") for s in series for point in s.get("data", [])], dtype=np.float64
+        )
+    return points_by_id
+
+def _get_batch_metric_averages(credential, subscription_id, resources, metric_namespace, metric_name, lookback_days, interval='P1D', use_cache=True):
+    """Fetches the average of one metric for many resources via the Monitor batch API.
+
+    resources is a list of (resource_id, location). Resources are grouped per region (the batch
+    API is regional) into requests of METRICS_BATCH_SIZE, which run concurrently. Returns
+    {lower-cased resource ID: average or None}; IDs whose batch failed are left out so callers
+    can fall back to a per-resource metrics.list query.
+
+    Averages are cached on disk for METRICS_CACHE_TTL_MINUTES, so a repeat run only queries
+    resources not seen recently; pass use_cache=False to query them all (the cache is still refreshed).
+    Each average carries its own timestamp ({id: [stored_at, average]}), so rewriting the entry with
+    new resources never extends the life of the ones already in it.
+    """
+    logger = logging.getLogger()
+    cache_key = cache.make_key(subscription_id, metric_namespace, metric_name, lookback_days, interval)
+    max_age = timedelta(minutes=METRICS_CACHE_TTL_MINUTES)
+    cached_averages = {}
+    cached = cache.get(cache_key, max_age, filename=METRICS_CACHE_FILENAME)
+    if cached:
+        now = datetime.now(timezone.utc)
+        for resource_key, entry in (cached[0] or {}).items():
+            try:
+                stored_at, average = entry
+                if now - datetime.fromisoformat(stored_at) < max_age:
+                    cached_averages[resource_key] = entry
+            except (TypeError, ValueError):
+                continue # Entries in an older layout are simply re-fetched
+
+    averages = {}
+    ids_by_region = defaultdict(list)
+    for resource_id, location in resources:
+        if use_cache and resource_id and resource_id.lower() in cached_averages:
+            averages[resource_id.lower()] = cached_averages[resource_id.lower()][1]
+        elif resource_id and location:
+            ids_by_region[location.lower().replace(' ', '')].append(resource_id)
+    if averages:
+        logger.debug(f"Metrics cache HIT for '{metric_name}' on {len(averages)} resource(s).")
+    if not ids_by_region:
+        return averages
+
+    try:
+        token = _get_token(credential, "https://metrics.monitor.azure.com/.default")
+    except ClientAuthenticationError:
+        raise
+    except Exception as e:
+        logger.warning(f"Could not get a token for the metrics batch API, falling back to per-resource queries: {e}")
+        return averages
+
+    batches = [
+        (region, region_ids[start:start + METRICS_BATCH_SIZE])
+        for region, region_ids in ids_by_region.items()
+        for start in range(0, len(region_ids), METRICS_BATCH_SIZE)
+    ]
+    fetched = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(ANALYSIS_MAX_WORKERS, len(batches))) as executor:
+        futures = {
+            executor.submit(_query_metrics_batch, token, subscription_id, region, metric_namespace, metric_name, batch_ids, lookback_days, interval): (region, batch_ids)
+            for region, batch_ids in batches
+        }
+        for future in concurrent.futures.as_completed(futures):
+            region, batch_ids = futures[future]
+            try:
+                points_by_id = future.result()
+            except Exception as e:
+                logger.warning(f"Metrics batch query for '{metric_name}' in {region} ({len(batch_ids)} resources) failed, falling back to per-resource queries: {e}")
+                continue
+            for resource_id in batch_ids:
+                points = points_by_id.get(resource_id.lower())
+                has_data = points is not None and np.isfinite(points).any()
+                fetched[resource_id.lower()] = float(np.nanmean(points)) if has_data else None
+    logger.debug(f"Metrics batch API returned '{metric_name}' for {len(fetched)} of {sum(len(ids) for ids in ids_by_region.values())} resources in {len(batches)} request(s).")
+    if fetched:
+        # Only the averages just fetched get a new timestamp; expired entries were dropped on read
+        stored_at = datetime.now(timezone.utc).isoformat()
+        cache.put(cache_key, {**cached_averages, **{resource_key: [stored_at, average] for resource_key, average in fetched.items()}}, filename=METRICS_CACHE_FILENAME)
+    averages.update(fetched)
+    return averages
+
+# --- Utility Functions for Resource Graph ---
+
+# KQL for the checks answered entirely from Resource Graph, keyed by check name
+_ARG_CHECK_QUERIES = {
+    # Unattached disks: diskState == 'Unattached' and managedBy is null or empty
+    "unattached_disks": """
+        Resources
+        | where type =~ 'microsoft.compute/disks'
+        | where properties.diskState == 'Unattached' and (isnull(properties.managedBy) or properties.managedBy == '')
+        | project name, id, resourceGroup, location, sizeGb = properties.diskSizeGB, skuName = sku.name
+        """,
+    # Empty resource groups: join resource groups with resource counts per group, keep those with none
+    "empty_rgs": """
+        ResourceContainers
+        | where type == 'microsoft.resources/subscriptions/resourcegroups'
+        | project id, name, location, resourceGroup = name 
+        | join kind=leftouter (Resources | summarize count() by resourceGroup) on resourceGroup
+        | where isnull(count_) or count_ == 0
+        | project name, id, location
+        """,
+    # Empty App Service Plans: join plans with site counts per plan (serverFarmId casing varies, so compare lower-cased)
+    "empty_asps": """
+        Resources
+        | where type =~ 'microsoft.web/serverfarms'
+        | extend planKey = tolower(id)
+        | join kind=leftouter (
+            Resources
+            | where type =~ 'microsoft.web/sites'
+            | extend planKey = tolower(tostring(properties.serverFarmId))
+            | summarize siteCount = count() by planKey
+          ) on planKey
+        | where isnull(siteCount) or siteCount == 0
+        | project name, id, resourceGroup, location, skuName = tostring(sku.name), skuTier = tostring(sku.tier)
+        """,
+    # Plans worth a CPU check: paid tiers that host at least one site (empty plans are reported by empty_asps)
+    "asps_to_check": """
+        Resources
+        | where type =~ 'microsoft.web/serverfarms'
+        | where tolower(tostring(sku.tier)) !in ('free', 'shared', 'dynamic')
+        | where toint(properties.numberOfSites) > 0
+        | project name, id, resourceGroup, location, skuName = tostring(sku.name), skuTier = tostring(sku.tier)
+        """,
+    # Running VMs (for the CPU check), with the size and OS type reported alongside their findings
+    "running_vms": """
+        Resources
+        | where type =~ 'microsoft.compute/virtualmachines'
+        | where tostring(properties.extended.instanceView.powerState.code) =~ 'PowerState/running'
+        | project name, id, resourceGroup, location,
+            vmSize = tostring(properties.hardwareProfile.vmSize), osType = tostring(properties.storageProfile.osDisk.osType)
+        """,
+    # Stopped (not deallocated) VMs: ARG exposes the power state from each VM's instance view
+    "stopped_vms": """
+        Resources
+        | where type =~ 'microsoft.compute/virtualmachines'
+        | where tostring(properties.extended.instanceView.powerState.code) =~ 'PowerState/stopped'
+        | project name, id, resourceGroup, location,
+            osDiskId = tostring(properties.storageProfile.osDisk.managedDisk.id), dataDisks = properties.storageProfile.dataDisks
+        """,
+    # Orphaned NSGs: ARG exposes each NSG's NIC and subnet associations directly, so no subnet walk is needed
+    "orphaned_nsgs": """
+        Resources
+        | where type =~ 'microsoft.network/networksecuritygroups'
+        | where coalesce(array_length(properties.networkInterfaces), 0) == 0 and coalesce(array_length(properties.subnets), 0) == 0
+        | project name, id, resourceGroup, location
+        """,
+    # Orphaned route tables: no associated subnets
+    "orphaned_route_tables": """
+        Resources
+        | where type =~ 'microsoft.network/routetables'
+        | where coalesce(array_length(properties.subnets), 0) == 0
+        | project name, id, resourceGroup, location
+        """,
+    # SQL databases on the DTU model (Basic/Standard/Premium), excluding elastic pool members
+    "sql_dtu_dbs": """
+        Resources
+        | where type =~ 'microsoft.sql/servers/databases'
+        | where tolower(tostring(sku.tier)) in ('basic', 'standard', 'premium') and isempty(properties.elasticPoolId)
+        | project name, id, resourceGroup, location, serverName = tostring(split(id, '/')[8]),
+                  skuName = tostring(sku.name), skuTier = tostring(sku.tier), skuFamily = tostring(sku.family), skuCapacity = toint(sku.capacity)
+        """,
+    # SQL databases on the vCore model (Business Critical, General Purpose or Hyperscale SKUs)
+    "sql_vcore_dbs": """
+        Resources
+        | where type =~ 'microsoft.sql/servers/databases'
+        | extend skuKey = tolower(tostring(sku.name))
+        | where skuKey contains 'bc_' or skuKey contains 'gp_' or skuKey contains 'hs_'
+        | project name, id, resourceGroup, location, serverName = tostring(split(id, '/')[8]),
+                  skuName = tostring(sku.name), skuTier = tostring(sku.tier)
+        """,
+    # Web Apps worth a CPU check: inner join with their plan so the tier filter reads the plan's own SKU
+    "web_apps_to_check": """
+        Resources
+        | where type =~ 'microsoft.web/sites'
+        | extend planKey = tolower(tostring(properties.serverFarmId))
+        | join kind=inner (
+            Resources
+            | where type =~ 'microsoft.web/serverfarms'
+            | extend planTier = tolower(tostring(sku.tier))
+            | where isnotempty(planTier) and planTier !in ('free', 'shared', 'dynamic')
+            | project planKey = tolower(id), planName = name, planTier
+          ) on planKey
+        | project name, id, resourceGroup, location, planName, planTier
+        """,
+}
+
+# How prefetch_arg_checks groups the checks. ARG allows at most 3 union legs and 3 joins in one query, so
+# each group has up to 3 legs and one join; empty_rgs runs alone, its join already spanning two tables.
+_ARG_PREFETCH_GROUPS = (
+    ("unattached_disks", "orphaned_nsgs", "orphaned_route_tables"),
+    ("running_vms", "stopped_vms", "asps_to_check"),
+    ("sql_dtu_dbs", "sql_vcore_dbs", "empty_asps"),
+    ("web_apps_to_check",),
+    ("empty_rgs",),
+)
+
+# Caps concurrent ARG queries when checks run side by side (see run_all_checks), and paces them within ARG's quota
+_arg_query_slots = threading.BoundedSemaphore(ARG_MAX_CONCURRENT_QUERIES)
+_arg_rate_limit = _TokenBucket(ARG_QUERY_BURST, ARG_QUERIES_PER_SECOND)
+
+# Rows fetched by prefetch_arg_checks, keyed by (subscription_id, check). Each finder takes its rows once,
+# so a later call for the same subscription queries ARG afresh instead of reusing stale results.
+_prefetched_arg_rows = {}
+
+def _limited_arg_query(arg_client, query_request):
+    """Runs one ARG request while holding a query slot (released again during any retry wait)."""
+    with _arg_query_slots:
+        _arg_rate_limit.acquire()
+        try:
+            return arg_client.resources(query_request)
+        except HttpResponseError as e:
+            if e.status_code == 429:
+                _arg_rate_limit.throttled()
+            raise
+
+def _arg_query_all(arg_client, subscriptions, kql_query, page_size=ARG_PAGE_SIZE, max_pages=ARG_MAX_PAGES):
+    """Runs a KQL query and follows skip tokens until every row is fetched (ARG pages at 100 rows by default).
+
+    Stops after max_pages pages with a warning rather than looping forever on a misbehaving token.
+    """
+    rows = []
+    skip_token = None
+    for _ in range(max_pages):
+        options = QueryRequestOptions(top=page_size, skip_token=skip_token, result_format="objectArray")
+        query_response = _with_retry(_limited_arg_query, arg_client, QueryRequest(subscriptions=subscriptions, query=kql_query, options=options))
+        rows.extend(query_response.data or [])
+        skip_token = query_response.skip_token
+        if not skip_token:
+            return rows
+    logging.getLogger().warning(f"ARG query stopped after {max_pages} pages ({len(rows)} rows); results may be incomplete.")
+    return rows
+
+def _run_arg_query(credential, subscription_id, kql_query):
+    """Runs a KQL query against one subscription and returns all result rows (list of dicts)."""
+    return _arg_query_all(_get_client(ResourceGraphClient, credential), [subscription_id], kql_query)
+
+def _arg_prefetch_query(checks):
+    """Returns the KQL for one prefetch group: each check's query tagged with a check column, unioned if several."""
+    legs = [f"{_ARG_CHECK_QUERIES[check].rstrip()}\n        | extend check = '{check}'" for check in checks]
+    return legs[0] if len(legs) == 1 else "union " + ",\n".join(f"({leg})" for leg in legs)
+
+def prefetch_arg_checks(credential, subscription_id):
+    """Runs the Resource Graph checks as a few grouped queries and holds the rows for the find_* functions.
+
+    ARG throttles per query, so len(_ARG_PREFETCH_GROUPS) queries replace one per check. Returns False
+    if any group's query fails; the checks in that group then run their own queries.
+    """
+    logger = logging.getLogger()
+
+    def _fetch_group(checks):
+        rows_by_check = {check: [] for check in checks}
+        for row in _run_arg_query(credential, subscription_id, _arg_prefetch_query(checks)):
+            check_rows = rows_by_check.get(row.get("check"))
+            if check_rows is not None:
+                check_rows.append(row)
+        return rows_by_check
+
+    all_fetched = True
+    with concurrent.futures.ThreadPoolExecutor(max_workers=ARG_MAX_CONCURRENT_QUERIES) as executor:
+        futures = {executor.submit(_fetch_group, checks): checks for checks in _ARG_PREFETCH_GROUPS}
+        for future in concurrent.futures.as_completed(futures):
+            checks = futures[future]
+            try:
+                rows_by_check = future.result()
+            except ClientAuthenticationError:
+                for pending in futures:
+                    pending.cancel()
+                raise
+            except Exception as e:
+                logger.warning(f"Combined ARG query for {', '.join(checks)} failed, these checks will query ARG individually: {e}")
+                all_fetched = False
+                continue
+            for check, check_rows in rows_by_check.items():
+                _prefetched_arg_rows[(subscription_id, check)] = check_rows
+            logger.debug(f"Combined ARG query returned {sum(len(rows) for rows in rows_by_check.values())} rows for {', '.join(checks)}.")
+    return all_fetched
+
+def _get_arg_check_rows(credential, subscription_id, check):
+    """Returns the rows for an ARG check, from prefetch_arg_checks if available, else from its own query."""
+    logger = logging.getLogger()
+    rows = _prefetched_arg_rows.pop((subscription_id, check), None)
+    if rows is not None:
+        logger.debug(f"Using prefetched ARG rows for '{check}'.")
+        return rows
+    kql_query = _ARG_CHECK_QUERIES[check]
+    logger.debug(f"Executing ARG query for '{check}': {kql_query}")
+    return _run_arg_query(credential, subscription_id, kql_query)
+
+def _managed_disk_ids(vm_row):
+    """Returns the managed disk IDs (OS disk first) from a stopped_vms row's storage profile columns."""
+    data_disk_ids = [(disk.get('managedDisk') or {}).get('id') for disk in vm_row.get('dataDisks') or []]
+    return [disk_id for disk_id in [vm_row.get('osDiskId'), *data_disk_ids] if disk_id]
+
+def _get_disk_details(credential, subscription_id, disk_ids, batch_size=ARG_ID_BATCH_SIZE):
+    """Looks up managed disks by ID in ARG, one query per batch_size IDs instead of a disks.get per disk.
+
+    Returns {lower-cased disk ID: row}; empty if the lookup fails, so callers report the disks without details.
+    """
+    disks_by_id = {}
+    try:
+        for start in range(0, len(disk_ids), batch_size):
+            id_list = ", ".join("'{}'".format(disk_id.replace("'", "\\'")) for disk_id in disk_ids[start:start + batch_size])
+            kql_query = f"""
+                Resources
+                | where type =~ 'microsoft.compute/disks' and id in~ ({id_list})
+                | project id, name, location, sizeGb = properties.diskSizeGB, skuName = tostring(sku.name)
+                """
+            disks_by_id.update((row['id'].lower(), row) for row in _run_arg_query(credential, subscription_id, kql_query) if row.get('id'))
+    except Exception as e:
+        logging.getLogger().warning(f"Could not look up disk details in ARG: {e}", exc_info=True)
+    return disks_by_id
+
 # --- Resource Listing and Cost Data ---
 
+_RESOURCE_COLUMNS = ["name", "type", "location", "id", "tags"]
+
 def list_all_resources(credential, subscription_id, console: Console = _console):
-    """Lists all resources in the subscription."""
-    resources = []
+    """Lists all resources in the subscription as a DataFrame with name, type, location, id and tags columns.
+
+    Uses Resource Graph to fetch only the projected fields rather than each resource's full ARM payload.
+    Columns keep filters vectorized (e.g. resources[resources['type'] == 'microsoft.compute/disks']);
+    use .to_dict('records') where a list of dicts is needed. Note that ARG reports resource types
+    lower-cased.
+    """
     try:
-        resource_client = ResourceManagementClient(credential, subscription_id)
         console.print("\n[bold blue]--- Fetching Azure Resources ---[/]")
-        resource_list = list(resource_client.resources.list())
-        
-        for resource in resource_list:
-            resources.append({
-                "name": resource.name,
-                "type": resource.type,
-                "location": resource.location,
-                "id": resource.id,
-                "tags": resource.tags
-            })
+        rows = _run_arg_query(credential, subscription_id, f"Resources | project {', '.join(_RESOURCE_COLUMNS)}")
+        resources = pd.DataFrame.from_records(rows, columns=_RESOURCE_COLUMNS)
         console.print(f":white_check_mark: Total resources found: {len(resources)}")
         return resources
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         console.print(f"[bold red]Error listing resources:[/] {e}")
-        return []
+        return pd.DataFrame(columns=_RESOURCE_COLUMNS)
+
+def print_cost_breakdown(console: Console, costs_by_type, total_cost, currency):
+    """Prints the month-to-date cost per resource type, in the given order (get_cost_data sorts highest first).
+
+    Only the first COST_BREAKDOWN_MAX_ROWS types get their own row; the rest are summed into one line.
+    get_cost_data doesn't call this itself, so callers can render it once the concurrent checks are done.
+    """
+    console.print("\n  [bold]Cost Breakdown by Resource Type (Month-to-Date):[/]")
+    items = list(costs_by_type.items())
+    shown, rest = items[:COST_BREAKDOWN_MAX_ROWS], items[COST_BREAKDOWN_MAX_ROWS:]
+    rows = [(f"  - {res_type}", f"{cost:.2f} {currency}") for res_type, cost in shown]
+    if rest:
+        rows.append((f"  … {len(rest)} more resource type(s)", f"{sum(cost for _, cost in rest):.2f} {currency}"))
+    table = Table(show_header=False, box=None, padding=(0, 1))
+    table.add_column(style="cyan") # Resource Type
+    table.add_column(style="green") # Cost
+    for row in rows:
+        table.add_row(*row)
+    console.print(table)
+    console.print(f"  [bold]Total Estimated Cost:[/][bold green] {total_cost:.2f} {currency}[/]")
+
+def _report_usage_results(console: Console, results, value_key, threshold, resource_label, value_label):
+    """Returns the results whose value_key is below threshold, printing them as one table.
+
+    Called once the check's workers have finished, so the console is written from a single thread
+    instead of once per resource. Results without data are listed on one line.
+    """
+    below_threshold = [details for details in results if details[value_key] is not None and details[value_key] < threshold]
+    if below_threshold:
+        table = Table(show_header=True, header_style="bold yellow", box=None, padding=(0, 1))
+        table.add_column(f"Low usage {resource_label}")
+        table.add_column(value_label, justify="right")
+        for details in below_threshold:
+            table.add_row(details["name"], f"{details[value_key]:.1f}")
+        console.print(table)
+    no_data = [details["name"] for details in results if details[value_key] is None]
+    if no_data:
+        console.print(f"  - [dim]No usage data for {len(no_data)} {resource_label}(s):[/dim] {', '.join(no_data)}")
+    return below_threshold
+
+def _is_metric_not_found(error):
+    """True if a metrics query failed because the metric isn't defined for the resource (e.g. needs Diagnostics)."""
+    message = getattr(error.error, "message", None) if error.error else None
+    return error.status_code == 400 and bool(message) and "failed to find metric configuration" in message.lower()
+
+def _check_usage_metric(monitor_client, details, metric_name, value_key, threshold, resource_label, timespan, batch_averages, console: Console, metric_not_found=None, report=True):
+    """Sets details[value_key] to the resource's average metric_name value and returns details.
+
+    Returns None to drop the resource instead: it was deleted during the scan (404/410), or
+    metric_not_found (an Event shared by the check's workers) shows the metric isn't defined for
+    this resource type. Throttling and other errors are logged and leave the value None; with
+    report they are also printed to the console.
+    """
+    logger = logging.getLogger()
+    label = f"{resource_label} {details['name']}" + (f" on {details['server_name']}" if details.get("server_name") else "")
+    try:
+        if metric_not_found is not None and metric_not_found.is_set() and details["id"].lower() not in batch_averages:
+            logger.debug(f"Skipping metrics query for {label}; metric '{metric_name}' was not found for this resource type.")
+            return None
+        average = _fetch_metric_average(monitor_client, details["id"], metric_name, timespan, batch_averages)
+        if average is None:
+            logger.debug(f"No valid data points found for metric '{metric_name}' for {label} in the timespan.")
+        else:
+            details[value_key] = average
+            logger.debug(f"{label} avg {metric_name}: {average:.2f}")
+            if average >= threshold:
+                logger.info(f"{label} usage OK (Avg: {average:.1f})")
+    except ClientAuthenticationError:
+        raise
+    except HttpResponseError as metric_error:
+        if _is_resource_gone(metric_error):
+            logger.debug(f"{label} no longer exists; skipping its metrics.")
+            return None
+        if metric_not_found is not None and _is_metric_not_found(metric_error):
+            metric_not_found.set()
+            logger.warning(f"Metric '{metric_name}' not found for {label}. It might need to be enabled in Diagnostics settings.")
+            if report:
+                console.print(f"  - [yellow]Warning:[/yellow] Metric '{metric_name}' not found for {label}. (Enable in Diagnostics?)")
+        elif metric_error.status_code == 429: # Too Many Requests
+            logger.warning(f"Metrics query for {label} throttled. Skipping.")
+            if report:
+                console.print(f"  - [yellow]Throttled:[/yellow] Skipping metrics for {label}.")
+        else:
+            # The message carries the service's error, so no traceback
+            logger.warning(f"Could not get metrics for {label}. Error: {metric_error}")
+            if report:
+                console.print(f"  - [yellow]Warning:[/yellow] Could not get metrics for {label}.")
+    except Exception as metric_error: # Anything else is unexpected, so keep the traceback
+        logger.warning(f"Error processing metrics for {label}: {metric_error}", exc_info=True)
+        if report:
+            console.print(f"  - [yellow]Warning:[/yellow] Error processing metrics for {label}. Check logs.")
+    return details
+
+def _find_low_usage(monitor_client, resources, metric_name, value_key, threshold, resource_label, value_label, timespan, batch_averages, console: Console, skip_missing_metric=False, report=True):
+    """Runs _check_usage_metric over the resources' details dicts on a thread pool and returns those below threshold.
+
+    skip_missing_metric stops querying the remaining resources once one reports the metric as undefined,
+    since metric definitions are per resource type. report=False only logs, leaving the console untouched.
+    """
+    metric_not_found = threading.Event() if skip_missing_metric else None
+
+    def _check(details):
+        return _check_usage_metric(
+            monitor_client, details, metric_name, value_key, threshold, resource_label,
+            timespan, batch_averages, console, metric_not_found, report
+        )
 
-def get_cost_data(credential, subscription_id, console: Console = _console):
-    """Retrieves cost data for the current billing month, grouped by Resource Type."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(ANALYSIS_MAX_WORKERS, len(resources))) as executor:
+        results = [details for details in executor.map(_check, resources) if details]
+    if not report:
+        return [details for details in results if details[value_key] is not None and details[value_key] < threshold]
+    return _report_usage_results(console, results, value_key, threshold, resource_label, value_label)
+
+def _cost_query_next_page(cost_client, next_link, query_definition):
+    """Fetches the result page at next_link; query.usage only returns the first page of a large result."""
+    response = cost_client.send_request(HttpRequest("POST", next_link, json=query_definition.as_dict()))
+    response.raise_for_status()
+    return QueryResult(response.json())
+
+def get_cost_data(credential, subscription_id, console: Console = _console, use_cache=True):
+    """Retrieves cost data for the current billing month, grouped by Resource Type.
+
+    Results are cached on disk for COST_CACHE_TTL_HOURS since the Cost Management API is slow
+    and aggressively throttled; pass use_cache=False to always query (the cache is still refreshed).
+    Days older than COST_SETTLE_DAYS are also cached for the rest of the month, so a cache miss
+    only queries the most recent days.
+    """
+    logger = logging.getLogger()
     costs_by_type = defaultdict(float)
     total_cost = 0.0
     currency = "N/A"
     try:
         # Explicitly set the base_url to ensure HTTPS is used
-        cost_client = CostManagementClient(
+        cost_client = _get_client(
+            CostManagementClient,
             credential=credential,
             subscription_id=subscription_id,
             base_url="https://management.azure.com" # Force HTTPS endpoint
@@ -89,71 +787,105 @@ def get_cost_data(credential, subscription_id, console: Console = _console):
 
         now = datetime.now(timezone.utc)
         start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
-        time_period = QueryTimePeriod(from_property=start_of_month, to=now)
+        # Cost Management keeps revising recent days; earlier days are final and never need querying again
+        settled_before = max(start_of_month, datetime(now.year, now.month, now.day, tzinfo=timezone.utc) - timedelta(days=COST_SETTLE_DAYS))
+
+        # Grouping is the only reduction the service can do for us: the Query API filters only by
+        # "In" (no not-null test) and has no sort or top, so null types and ordering stay client-side.
+        # Daily rows let settled days be split off and cached for the rest of the month.
+        dataset = QueryDataset(
+            granularity="Daily",
+            aggregation={"totalCost": {"name": "Cost", "function": "Sum"}},
+            grouping=[{"type": "Dimension", "name": "ResourceType"}]
+        )
 
+        console.print("\n[bold blue]--- Fetching Cost Data ---[/]")
+        # Key on what identifies the result; the end of the period moves every call so it is left out
+        dataset_key = json.dumps(dataset.as_dict(), sort_keys=True, default=str)
+        cache_key = cache.make_key(scope, start_of_month.isoformat(), "ActualCost", dataset_key)
+        settled_cache_key = cache.make_key(scope, start_of_month.isoformat(), "ActualCost", dataset_key, "settled")
+        if use_cache:
+            cached = cache.get(cache_key, timedelta(hours=COST_CACHE_TTL_HOURS))
+            if cached:
+                (cached_costs, total_cost, currency), stored_at = cached
+                logger.info(f"Cost data cache HIT (stored {stored_at.isoformat()}).")
+                console.print(f"  [dim]Using cached cost data from {stored_at.astimezone().strftime('%Y-%m-%d %H:%M')} (use --no-cache to refresh).[/]")
+                costs_by_type.update(cached_costs)
+                return costs_by_type, total_cost, currency
+
+        # Totals for settled days are kept per month, so only the days after them are queried
+        settled_costs = pd.Series(dtype=float)
+        query_from = start_of_month
+        cached_settled = cache.get(settled_cache_key, timedelta(days=31)) if use_cache else None
+        if cached_settled:
+            settled_entry, _ = cached_settled
+            settled_costs = pd.Series(settled_entry["costs"], dtype=float)
+            query_from = datetime.fromisoformat(settled_entry["through"])
+            currency = settled_entry["currency"]
+        logger.info(f"Cost data cache MISS; querying Cost Management API from {query_from.date().isoformat()}.")
         query_definition = QueryDefinition(
             type="ActualCost",
             timeframe="Custom",
-            time_period=time_period,
-            dataset=QueryDataset(
-                granularity="None",
-                aggregation={"totalCost": {"name": "Cost", "function": "Sum"}},
-                grouping=[{"type": "Dimension", "name": "ResourceType"}]
-            )
+            time_period=QueryTimePeriod(from_property=query_from, to=now),
+            dataset=dataset
         )
-
-        console.print("\n[bold blue]--- Fetching Cost Data ---[/]")
-        result = cost_client.query.usage(scope=scope, parameters=query_definition)
-
-        if result and result.rows:
-            cost_index, currency_index, res_type_index = -1, -1, -1
-            if result.columns:
-                for i, col in enumerate(result.columns):
-                    if col.name == "Cost": cost_index = i
-                    elif col.name == "Currency": currency_index = i
-                    elif col.name == "ResourceType": res_type_index = i
-
-            if cost_index != -1 and currency_index != -1 and res_type_index != -1:
-                console.print("  [bold]Cost Breakdown by Resource Type (Month-to-Date):[/]")
-                table = Table(show_header=False, box=None, padding=(0, 1))
-                table.add_column(style="cyan") # Resource Type
-                table.add_column(style="green") # Cost
-                
-                # Filter out rows where resource type is None or empty before sorting
-                valid_rows = [row for row in result.rows if len(row) > res_type_index and row[res_type_index]]
-                sorted_rows = sorted(valid_rows, key=lambda r: r[cost_index], reverse=True)
-
-                for row in sorted_rows:
-                    cost = row[cost_index]
-                    curr = row[currency_index]
-                    res_type = row[res_type_index]
-                    if currency == "N/A": currency = curr # Capture currency from first valid row
-                    costs_by_type[res_type] += cost
-                    total_cost += cost
-                    table.add_row(f"  - {res_type}", f"{cost:.2f} {curr}")
-                console.print(table)
-                console.print(f"  [bold]Total Estimated Cost:[/][bold green] {total_cost:.2f} {currency}[/]")
+        result = _with_retry(cost_client.query.usage, scope=scope, parameters=query_definition)
+
+        rows = list(result.rows) if result and result.rows else []
+        column_names = [col.name for col in result.columns] if result and result.columns else []
+        # A row per resource type per day can run past one page, so follow nextLink to the end
+        next_link = result.next_link if result else None
+        pages = 1
+        while next_link:
+            if pages >= COST_MAX_PAGES:
+                logger.warning(f"Stopped after {pages} pages of cost data; the month-to-date total may be incomplete.")
+                break
+            page = _with_retry(_cost_query_next_page, cost_client, next_link, query_definition)
+            rows.extend(page.rows or [])
+            next_link = page.next_link
+            pages += 1
+        if rows and not {"Cost", "Currency", "ResourceType", "UsageDate"} <= set(column_names):
+            console.print("[yellow]  - Warning: Could not parse cost data columns correctly.[/]")
+            # Attempt basic fallback if possible
+            if rows[0] and len(rows[0]) >= 2:
+                try:
+                    total_cost = float(rows[0][0])
+                    currency = rows[0][1]
+                    console.print(f"[yellow]  - Fallback Total Cost (sum of first row):[/][bold yellow] {total_cost:.2f} {currency}[/]")
+                except (ValueError, TypeError):
+                    console.print("[red]  - Error in fallback cost parsing.[/]")
             else:
-                 console.print("[yellow]  - Warning: Could not parse cost data columns correctly.[/]")
-                 # Attempt basic fallback if possible
-                 if result.rows and result.rows[0] and len(result.rows[0]) >= 2:
-                     try:
-                        total_cost = float(result.rows[0][0])
-                        currency = result.rows[0][1]
-                        console.print(f"[yellow]  - Fallback Total Cost (sum of first row):[/][bold yellow] {total_cost:.2f} {currency}[/]")
-                     except (ValueError, TypeError):
-                         console.print("[red]  - Error in fallback cost parsing.[/]")
-                 else:
-                      console.print("[yellow]  - Insufficient data for fallback cost parsing.[/]")
-        else:
+                console.print("[yellow]  - Insufficient data for fallback cost parsing.[/]")
+            return costs_by_type, total_cost, currency
+
+        # Aggregate with group-bys rather than summing row by row in Python
+        cost_df = pd.DataFrame(rows, columns=column_names or ["Cost", "UsageDate", "ResourceType", "Currency"])
+        # Filter out rows where resource type is None or empty
+        cost_df = cost_df[cost_df["ResourceType"].notna() & (cost_df["ResourceType"] != "")]
+        if not cost_df.empty:
+            currency = cost_df["Currency"].iloc[0] # Capture currency from first valid row
+        # UsageDate comes back as a yyyymmdd number
+        is_settled = cost_df["UsageDate"].astype("int64") < int(settled_before.strftime("%Y%m%d"))
+        settled_costs = settled_costs.add(cost_df[is_settled].groupby("ResourceType")["Cost"].sum().astype(float), fill_value=0.0)
+        cache.put(settled_cache_key, {"through": settled_before.isoformat(), "costs": settled_costs.to_dict(), "currency": currency})
+        recent_costs = cost_df[~is_settled].groupby("ResourceType")["Cost"].sum().astype(float)
+        type_costs = settled_costs.add(recent_costs, fill_value=0.0).sort_values(ascending=False)
+
+        if type_costs.empty:
             console.print("[yellow]  - No cost data found for the period.[/]")
-
+            return costs_by_type, total_cost, currency
+        costs_by_type.update(type_costs.to_dict())
+        total_cost = float(type_costs.sum())
+        cache.put(cache_key, [dict(costs_by_type), total_cost, currency])
         return costs_by_type, total_cost, currency
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         console.print(f"[bold red]Error fetching cost data:[/] {e}")
-        if "429" in str(e) or "throttled" in str(e).lower():
-            console.print("[yellow]  - Suggestion: Cost Management API might be throttled. Consider adding delays or retries.[/]")
+        # Throttled calls were already retried by _with_retry, so a 429 here means the quota is still exhausted
+        if isinstance(e, HttpResponseError) and e.status_code == 429:
+            console.print("[yellow]  - Suggestion: Cost Management API is still throttling after retries. Try again in a few minutes.[/]")
         return costs_by_type, total_cost, currency # Return empty/default values
 
 # --- Specific Analysis Functions ---
@@ -165,42 +897,26 @@ def find_unattached_disks(credential, subscription_id, console: Console):
     console.print("\n💾 Checking for unattached managed disks (using ARG)...")
     disks = []
     try:
-        # Use Resource Graph Client
-        arg_client = ResourceGraphClient(credential)
-
-        # KQL query to find unattached disks
-        # Checks for diskState == 'Unattached' and managedBy property is null or empty
-        # Projects the required fields
-        kql_query = """
-        Resources
-        | where type =~ 'microsoft.compute/disks'
-        | where properties.diskState == 'Unattached' and (isnull(properties.managedBy) or properties.managedBy == '')
-        | project name, id, resourceGroup, location, sizeGb = properties.diskSizeGB, skuName = sku.name
-        """
-
-        # Create the query request
-        query_request = QueryRequest(subscriptions=[subscription_id], query=kql_query)
-        
-        logger.debug(f"Executing ARG query for unattached disks: {kql_query}")
-        query_response = arg_client.resources(query_request)
-        logger.debug(f"ARG query returned {query_response.total_records} records.")
-
-        if query_response.total_records > 0 and query_response.data:
-            # Process the results (which are in query_response.data as a list of dicts)
-            for disk_data in query_response.data:
-                disks.append({
-                    'name': disk_data.get('name', 'Unknown'),
-                    'resource_group': disk_data.get('resourceGroup', 'Unknown'),
-                    'location': disk_data.get('location', 'Unknown'),
-                    'size_gb': disk_data.get('sizeGb'), # Note the field name from project
-                    'sku': disk_data.get('skuName', 'Unknown'), # Note the field name
-                    'id': disk_data.get('id', 'Unknown'),
-                })
+        disk_rows = _get_arg_check_rows(credential, subscription_id, "unattached_disks")
+        logger.debug(f"ARG query returned {len(disk_rows)} records.")
+
+        # Process the results (a list of dicts matching the query's project clause)
+        for disk_data in disk_rows:
+            disks.append({
+                'name': disk_data.get('name', 'Unknown'),
+                'resource_group': disk_data.get('resourceGroup', 'Unknown'),
+                'location': disk_data.get('location', 'Unknown'),
+                'size_gb': disk_data.get('sizeGb'), # Note the field name from project
+                'sku': disk_data.get('skuName', 'Unknown'), # Note the field name
+                'id': disk_data.get('id', 'Unknown'),
+            })
 
         if not disks:
             console.print("  :heavy_check_mark: No unattached managed disks found.")
         else:
              console.print(f"  :warning: Found {len(disks)} unattached disk(s).")
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         logger.error(f"Error checking for unattached disks using ARG: {e}", exc_info=True)
         console.print(f"  [bold red]Error checking for unattached disks (ARG):[/] {e}")
@@ -213,94 +929,34 @@ def find_stopped_vms(credential, subscription_id, console: Console):
     console.print("\n🛑 Checking for stopped (not deallocated) VMs...") # Keep simple print
     stopped_vms = []
     try:
-        compute_client = ComputeManagementClient(credential, subscription_id)
-        vm_list = list(compute_client.virtual_machines.list_all())
-        for vm in vm_list:
-            rg_name = None
-            try:
-                # Extract RG name safely
-                try:
-                    rg_name = vm.id.split('/')[4]
-                except IndexError:
-                    logger.warning(f"Could not parse resource group for VM {vm.name}. Skipping.")
-                    console.print(f"  [yellow]Warning:[/][dim] Could not parse resource group for VM {vm.name}. Skipping.[/]")
+        # ARG carries each VM's power state, so no per-VM instance view call is needed
+        vm_rows = _get_arg_check_rows(credential, subscription_id, "stopped_vms")
+        disk_ids_by_vm = {row['id']: _managed_disk_ids(row) for row in vm_rows}
+        disks_by_id = _get_disk_details(credential, subscription_id, [disk_id for disk_ids in disk_ids_by_vm.values() for disk_id in disk_ids])
+
+        for row in vm_rows:
+            # --- Get Disk Details --- (OS disk first, then data disks)
+            disk_info_list = []
+            for disk_id in disk_ids_by_vm[row['id']]:
+                disk = disks_by_id.get(disk_id.lower())
+                if disk is None:
+                    logger.warning(f"Could not fetch details for disk {disk_id} of VM {row.get('name')}")
+                    disk_info_list.append({'name': disk_id.rsplit('/', 1)[-1], 'error': 'Could not fetch full details'})
                     continue
-
-                instance_view = compute_client.virtual_machines.instance_view(
-                    resource_group_name=rg_name,
-                    vm_name=vm.name
-                )
-                power_state = None
-                if instance_view.statuses:
-                    for status in instance_view.statuses:
-                        if status.code and status.code.startswith("PowerState/"):
-                            power_state = status.code.split('/')[-1]
-                            break
-                # Check if the power state is specifically 'stopped' (not 'deallocated')
-                if power_state == "stopped":
-                    vm_details = {
-                        "name": vm.name,
-                        "id": vm.id,
-                        "resource_group": rg_name,
-                        "location": vm.location,
-                        "disks": [] # Initialize list for disk details
-                    }
-
-                    # --- Get Disk Details --- 
-                    disk_info_list = []
-                    if vm.storage_profile:
-                         # Get OS Disk details
-                         if vm.storage_profile.os_disk and vm.storage_profile.os_disk.managed_disk:
-                             try:
-                                 os_disk_name = vm.storage_profile.os_disk.name
-                                 os_disk_id = vm.storage_profile.os_disk.managed_disk.id
-                                 os_disk_gb = vm.storage_profile.os_disk.disk_size_gb
-                                 # Get the full disk resource to find SKU and location
-                                 disk_resource = compute_client.disks.get(rg_name, os_disk_name)
-                                 os_disk_sku = disk_resource.sku.name if disk_resource.sku else 'Unknown'
-                                 os_disk_location = disk_resource.location
-                                 disk_info_list.append({
-                                     'name': os_disk_name,
-                                     'size_gb': os_disk_gb,
-                                     'sku': os_disk_sku,
-                                     'location': os_disk_location, # Use actual disk location
-                                     'id': os_disk_id
-                                 })
-                             except Exception as disk_err:
-                                 logger.warning(f"Could not fetch OS disk details for VM {vm.name}: {disk_err}")
-                                 disk_info_list.append({'name': vm.storage_profile.os_disk.name, 'error': 'Could not fetch full details'})
-
-                         # Get Data Disk details
-                         if vm.storage_profile.data_disks:
-                             for data_disk in vm.storage_profile.data_disks:
-                                 if data_disk.managed_disk:
-                                      try:
-                                         data_disk_name = data_disk.name
-                                         data_disk_id = data_disk.managed_disk.id
-                                         data_disk_gb = data_disk.disk_size_gb
-                                         disk_resource = compute_client.disks.get(rg_name, data_disk_name)
-                                         data_disk_sku = disk_resource.sku.name if disk_resource.sku else 'Unknown'
-                                         data_disk_location = disk_resource.location
-                                         disk_info_list.append({
-                                             'name': data_disk_name,
-                                             'size_gb': data_disk_gb,
-                                             'sku': data_disk_sku,
-                                             'location': data_disk_location,
-                                             'id': data_disk_id
-                                         })
-                                      except Exception as disk_err:
-                                         logger.warning(f"Could not fetch data disk {data_disk.name} details for VM {vm.name}: {disk_err}")
-                                         disk_info_list.append({'name': data_disk.name, 'error': 'Could not fetch full details'})
-
-                    vm_details['disks'] = disk_info_list
-                    stopped_vms.append(vm_details)
-
-            except Exception as iv_error:
-                 # Log specific error for instance view failure
-                 # Use rg_name if available, otherwise vm.id
-                 vm_identifier = f"VM {vm.name} in RG {rg_name}" if rg_name else f"VM ID {vm.id}"
-                 logging.warning(f"Could not get instance view for {vm_identifier}. Error: {iv_error}", exc_info=True)
-                 console.print(f"  [yellow]Warning:[/yellow] Could not get instance view for VM {vm.name}. Skipping status check.[/]")
+                disk_info_list.append({
+                    'name': disk.get('name'),
+                    'size_gb': disk.get('sizeGb'),
+                    'sku': disk.get('skuName') or 'Unknown',
+                    'location': disk.get('location'), # Use actual disk location
+                    'id': disk.get('id')
+                })
+            stopped_vms.append({
+                "name": row.get('name'),
+                "id": row.get('id'),
+                "resource_group": row.get('resourceGroup'),
+                "location": row.get('location'),
+                "disks": disk_info_list
+            })
 
         if not stopped_vms:
             console.print("  :heavy_check_mark: No stopped (but not deallocated) VMs found.")
@@ -308,6 +964,8 @@ def find_stopped_vms(credential, subscription_id, console: Console):
             console.print(f"  :warning: Found {len(stopped_vms)} stopped VM(s) that are incurring compute costs.")
         return stopped_vms
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         logging.error(f"Error checking for stopped VMs: {e}", exc_info=True)
         console.print(f"[bold red]Error checking for stopped VMs:[/] {e}")
@@ -320,9 +978,8 @@ def find_unused_public_ips(credential, subscription_id, console: Console):
     console.print("\n🌐 Checking for unused Public IP Addresses...") # Keep simple print
     unused_ips = []
     try:
-        network_client = NetworkManagementClient(credential, subscription_id)
-        public_ips = list(network_client.public_ip_addresses.list_all())
-        for ip in public_ips:
+        network_client = _get_client(NetworkManagementClient, credential, subscription_id)
+        for ip in network_client.public_ip_addresses.list_all():
             if ip.ip_configuration is None: # Primary indicator of being unattached
                 # Also check if it's associated with a NAT gateway (nat_gateway attribute)
                 # Or a Load Balancer frontend IP config (though ip_configuration check usually covers this)
@@ -331,7 +988,7 @@ def find_unused_public_ips(credential, subscription_id, console: Console):
                     unused_ips.append({
                         "name": ip.name, 
                         "id": ip.id, 
-                        "resource_group": ip.id.split('/')[4],
+                        "resource_group": resource_group_from_id(ip.id),
                         "location": ip.location, 
                         "ip_address": ip.ip_address,
                         "sku": sku_name
@@ -343,6 +1000,8 @@ def find_unused_public_ips(credential, subscription_id, console: Console):
             console.print(f"  :warning: Found {len(unused_ips)} unused Public IP(s).")
         return unused_ips
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         console.print(f"[bold red]Error checking for unused Public IPs:[/] {e}")
         return []
@@ -354,34 +1013,15 @@ def find_empty_resource_groups(credential, subscription_id, console: Console):
     console.print("\n🗑 Checking for empty Resource Groups (using ARG)...") 
     empty_rgs = []
     try:
-        arg_client = ResourceGraphClient(credential)
-
-        # KQL Query to find resource groups with no resources
-        # - Select resource groups
-        # - Join with resource counts per group
-        # - Filter where count is null or zero
-        kql_query = """
-        ResourceContainers
-        | where type == 'microsoft.resources/subscriptions/resourcegroups'
-        | project id, name, location, resourceGroup = name 
-        | join kind=leftouter (Resources | summarize count() by resourceGroup) on resourceGroup
-        | where isnull(count_) or count_ == 0
-        | project name, id, location
-        """
-
-        query_request = QueryRequest(subscriptions=[subscription_id], query=kql_query)
-
-        logger.debug(f"Executing ARG query for empty resource groups: {kql_query}")
-        query_response = arg_client.resources(query_request)
-        logger.debug(f"ARG query returned {query_response.total_records} empty resource groups.")
-
-        if query_response.total_records > 0 and query_response.data:
-            for rg_data in query_response.data:
-                empty_rgs.append({
-                    "name": rg_data.get('name', 'Unknown'), 
-                    "id": rg_data.get('id', 'Unknown'), 
-                    "location": rg_data.get('location', 'Unknown'),
-                })
+        rg_rows = _get_arg_check_rows(credential, subscription_id, "empty_rgs")
+        logger.debug(f"ARG query returned {len(rg_rows)} empty resource groups.")
+
+        for rg_data in rg_rows:
+            empty_rgs.append({
+                "name": rg_data.get('name', 'Unknown'), 
+                "id": rg_data.get('id', 'Unknown'), 
+                "location": rg_data.get('location', 'Unknown'),
+            })
 
         if not empty_rgs:
             console.print("  :heavy_check_mark: No empty Resource Groups found.")
@@ -389,33 +1029,33 @@ def find_empty_resource_groups(credential, subscription_id, console: Console):
             console.print(f"  :warning: Found {len(empty_rgs)} empty Resource Group(s).")
         return empty_rgs
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         logger.error(f"Error checking for empty Resource Groups using ARG: {e}", exc_info=True)
         console.print(f"[bold red]Error checking for empty Resource Groups (ARG):[/] {e}")
         return []
 
 def find_empty_app_service_plans(credential, subscription_id, console: Console):
-    """Finds App Service Plans that host no applications."""
+    """Finds App Service Plans that host no applications using Azure Resource Graph."""
     logger = logging.getLogger()
-    logger.info("🕸 Checking for empty App Service Plans...")
-    console.print("\n🕸 Checking for empty App Service Plans...") # Keep simple print
+    logger.info("🕸 Checking for empty App Service Plans (using ARG)...")
+    console.print("\n🕸 Checking for empty App Service Plans (using ARG)...") # Keep simple print
     empty_asps = []
     try:
-        web_client = WebSiteManagementClient(credential, subscription_id)
-        plans = list(web_client.app_service_plans.list())
-        for plan in plans:
-            apps_in_plan = list(web_client.web_apps.list_by_resource_group(plan.id.split('/')[4])) # Extract RG
-            # Filter apps that specifically belong to this plan
-            apps_on_this_plan = [app for app in apps_in_plan if app.server_farm_id and app.server_farm_id.lower() == plan.id.lower()]
-            if not apps_on_this_plan:
-                empty_asps.append({
-                    "name": plan.name, 
-                    "id": plan.id, 
-                    "resource_group": plan.id.split('/')[4],
-                    "location": plan.location, 
-                    "sku": plan.sku.name if plan.sku else "Unknown",
-                    "tier": plan.sku.tier if plan.sku else "Unknown" # Add tier info
-                })
+        # Plans with no sites come from one join query instead of listing apps per plan
+        plan_rows = _get_arg_check_rows(credential, subscription_id, "empty_asps")
+        logger.debug(f"ARG query returned {len(plan_rows)} empty App Service Plans.")
+
+        for plan_data in plan_rows:
+            empty_asps.append({
+                "name": plan_data.get('name', 'Unknown'),
+                "id": plan_data.get('id', 'Unknown'),
+                "resource_group": plan_data.get('resourceGroup', 'Unknown'),
+                "location": plan_data.get('location', 'Unknown'),
+                "sku": plan_data.get('skuName') or "Unknown",
+                "tier": plan_data.get('skuTier') or "Unknown" # Add tier info
+            })
 
         if not empty_asps:
             console.print("  :heavy_check_mark: No empty App Service Plans found.")
@@ -423,9 +1063,11 @@ def find_empty_app_service_plans(credential, subscription_id, console: Console):
             console.print(f"  :warning: Found {len(empty_asps)} empty App Service Plan(s).")
         return empty_asps
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
-        logging.error(f"Error checking for empty App Service Plans: {e}", exc_info=True)
-        console.print(f"[bold red]Error checking for empty App Service Plans:[/bold red] {e}")
+        logger.error(f"Error checking for empty App Service Plans using ARG: {e}", exc_info=True)
+        console.print(f"[bold red]Error checking for empty App Service Plans (ARG):[/bold red] {e}")
         return []
 
 def find_old_snapshots(credential, subscription_id, age_threshold_days, console: Console):
@@ -434,10 +1076,11 @@ def find_old_snapshots(credential, subscription_id, age_threshold_days, console:
     logger.info(f":camera_flash: Checking for disk snapshots older than {age_threshold_days} days...")
     console.print(f"\n:camera_flash: Checking for disk snapshots older than {age_threshold_days} days...") # Keep simple print
     old_snapshots = []
+    # One cutoff for the whole scan, so every snapshot is judged against the same instant
+    cutoff = datetime.now(timezone.utc) - timedelta(days=age_threshold_days)
     try:
-        compute_client = ComputeManagementClient(credential, subscription_id)
-        snapshots = list(compute_client.snapshots.list())
-        for snapshot in snapshots:
+        compute_client = _get_client(ComputeManagementClient, credential, subscription_id)
+        for snapshot in compute_client.snapshots.list():
             try:
                 creation_time = snapshot.time_created
                 if not creation_time:
@@ -450,8 +1093,8 @@ def find_old_snapshots(credential, subscription_id, age_threshold_days, console:
                     logging.warning(f"Snapshot {snapshot.name} creation time is naive. Assuming UTC.")
                     creation_time = creation_time.replace(tzinfo=timezone.utc)
 
-                if (datetime.now(timezone.utc) - creation_time) > timedelta(days=age_threshold_days):
-                    rg_name = snapshot.id.split('/')[4]
+                if creation_time < cutoff:
+                    rg_name = resource_group_from_id(snapshot.id)
                     # Determine snapshot SKU type for potential cost estimation
                     sku_name = snapshot.sku.name if snapshot.sku else 'Standard_LRS' # Default assumption
 
@@ -478,12 +1121,14 @@ def find_old_snapshots(credential, subscription_id, age_threshold_days, console:
 
         return old_snapshots
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         logging.error(f"Error checking for old snapshots: {e}", exc_info=True)
         console.print(f"[bold red]Error checking for old snapshots:[/bold red] {e}")
         return []
 
-def find_underutilized_vms(credential, subscription_id, cpu_threshold_percent, lookback_days, console: Console):
+def find_underutilized_vms(credential, subscription_id, cpu_threshold_percent, lookback_days, console: Console, use_cache=True):
     """Finds running VMs with average CPU utilization below a threshold."""
     logger = logging.getLogger()
     logger.info(f"📉 Checking running VMs for avg CPU < {cpu_threshold_percent}% over the last {lookback_days} days...")
@@ -491,122 +1136,43 @@ def find_underutilized_vms(credential, subscription_id, cpu_threshold_percent, l
     underutilized_vms = []
     monitor_client = None # Initialize outside try block
     try:
-        compute_client = ComputeManagementClient(credential, subscription_id)
-        monitor_client = MonitorManagementClient(credential, subscription_id)
+        monitor_client = _get_client(MonitorManagementClient, credential, subscription_id)
 
         # Get the correct timespan format
         timespan = _get_iso8601_timespan(lookback_days)
         logger.debug(f"Using timespan for VM metrics: {timespan}")
 
-        vm_list = list(compute_client.virtual_machines.list_all())
-        running_vm_count = 0
-
-        # Check running state first
-        vms_to_check_metrics = []
-        for vm in vm_list:
-            rg_name = None
-            try:
-                rg_name = vm.id.split('/')[4]
-            except IndexError:
-                logger.warning(f"Could not parse resource group for VM {vm.name}. Skipping power state check.")
-                continue # Skip this VM entirely if RG can't be determined
-
-            try:
-                 instance_view = compute_client.virtual_machines.instance_view(
-                     resource_group_name=rg_name,
-                     vm_name=vm.name
-                 )
-                 power_state = None
-                 if instance_view.statuses:
-                     for status in instance_view.statuses:
-                         if status.code and status.code.startswith("PowerState/"):
-                             power_state = status.code.split('/')[-1]
-                             break
-                 if power_state == "running":
-                      vms_to_check_metrics.append((vm, rg_name))
-                      running_vm_count += 1
-            except HttpResponseError as http_err:
-                 # Log non-critical errors like 'NotFound' if VM was deleted during scan
-                 if http_err.status_code == 404:
-                     logger.warning(f"VM {vm.name} in RG {rg_name} not found during instance view check (likely deleted). Skipping.")
-                 else:
-                     # Log other HTTP errors more visibly
-                     logger.error(f"HTTP error checking instance view for VM {vm.name}: {http_err}", exc_info=True)
-                     console.print(f"  [yellow]Warning:[/yellow] HTTP error checking state for VM {vm.name}. Skipping metrics check.")
-            except Exception as e:
-                 logger.error(f"Error checking power state for VM {vm.name}: {e}", exc_info=True)
-                 console.print(f"  [yellow]Warning:[/yellow] Could not check power state for VM {vm.name}. Skipping metrics check.")
+        # ARG carries each VM's power state, so running VMs come from one query rather than an instance view per VM
+        vms_to_check_metrics = _get_arg_check_rows(credential, subscription_id, "running_vms")
 
         if not vms_to_check_metrics:
             console.print("  ℹ No running VMs found to analyze.")
             return []
 
-        console.print(f"  - Found {running_vm_count} running VMs to analyze...")
+        console.print(f"  - Found {len(vms_to_check_metrics)} running VMs to analyze...")
 
-        # Now query metrics only for running VMs
-        for vm, rg_name in vms_to_check_metrics:
-            try:
-                vm_info = {
-                    "name": vm.name,
-                    "id": vm.id,
-                    "resource_group": rg_name,
-                    "location": vm.location,
-                    "size": vm.hardware_profile.vm_size if vm.hardware_profile else 'Unknown',
-                    "os_type": vm.storage_profile.os_disk.os_type if vm.storage_profile and vm.storage_profile.os_disk else 'Unknown', # Add OS type
-                    "avg_cpu_percent": None
-                }
-                avg_cpu = None
-                metric_name = "Percentage CPU"
-                try:
-                    metrics_data = monitor_client.metrics.list(
-                        resource_uri=vm.id,
-                        timespan=f"{(datetime.now() - timedelta(days=lookback_days)).isoformat()}/{datetime.now().isoformat()}",
-                        interval='P1D',
-                        metricnames=metric_name,
-                        aggregation="Average"
-                    )
-
-                    if metrics_data and metrics_data.value:
-                        time_series = metrics_data.value[0].timeseries
-                        if time_series and time_series[0].data:
-                            valid_points = [d.average for d in time_series[0].data if d.average is not None]
-                            if valid_points:
-                                avg_cpu = sum(valid_points) / len(valid_points)
-                                vm_info["avg_cpu_percent"] = avg_cpu
-                                logger.debug(f"VM {vm.name} avg CPU: {avg_cpu:.2f}%")
-                            else:
-                                 logger.warning(f"No valid data points found for metric '{metric_name}' for VM {vm.name} in the timespan.")
-                        else:
-                             logger.warning(f"No time series data found for metric '{metric_name}' for VM {vm.name} in the timespan.")
-                    else:
-                         logger.warning(f"No metric data returned for '{metric_name}' for VM {vm.name}.")
-
-                except HttpResponseError as metric_error:
-                     # Handle specific errors like rate limiting or invalid dimensions
-                     if metric_error.status_code == 429: # Too Many Requests
-                         logger.warning(f"Metrics query for VM {vm.name} throttled. Skipping.")
-                         console.print(f"  - [yellow]Throttled:[/yellow] Skipping metrics for VM {vm.name}.")
-                     else:
-                         # Log other HTTP errors more visibly
-                         logger.warning(f"Could not get metrics for VM {vm.name}. Error: {metric_error}", exc_info=True)
-                         console.print(f"  - [yellow]Warning:[/yellow] Could not get metrics for VM {vm.name}.")
-                except Exception as metric_error: # Catch other potential errors during metric processing
-                     logger.warning(f"Error processing metrics for VM {vm.name}: {metric_error}", exc_info=True)
-                     console.print(f"  - [yellow]Warning:[/yellow] Error processing metrics for VM {vm.name}.")
-
-
-                if avg_cpu is not None:
-                    if avg_cpu < cpu_threshold_percent:
-                        console.print(f"  - [bold yellow]Low Usage:[/bold yellow] VM {vm.name} (Avg CPU: {avg_cpu:.1f}%) is below threshold ({cpu_threshold_percent}%).")
-                        underutilized_vms.append(vm_info)
-                    else:
-                        logger.info(f"VM {vm.name} CPU usage OK (Avg: {avg_cpu:.1f}%)")
-                else:
-                    console.print(f"  - [dim]No CPU data for VM:[/dim] {vm.name}")
-
-            except Exception as e: # Catch errors in the outer loop for a specific VM
-                 logger.error(f"Error processing VM {vm.name}: {e}", exc_info=True)
-                 console.print(f"  [red]Error:[/red] Could not process VM {vm.name}. Check logs.")
+        # Now query metrics only for running VMs: batched per region, with per-VM calls as a fallback
+        batch_averages = _get_batch_metric_averages(
+            credential, subscription_id, [(vm['id'], vm['location']) for vm in vms_to_check_metrics],
+            "microsoft.compute/virtualmachines", "Percentage CPU", lookback_days, use_cache=use_cache
+        )
+
+        vms = [
+            {
+                "name": vm['name'],
+                "id": vm['id'],
+                "resource_group": vm.get('resourceGroup'),
+                "location": vm.get('location'),
+                "size": vm.get('vmSize') or 'Unknown',
+                "os_type": vm.get('osType') or 'Unknown', # Add OS type
+                "avg_cpu_percent": None
+            }
+            for vm in vms_to_check_metrics
+        ]
+        underutilized_vms.extend(_find_low_usage(
+            monitor_client, vms, "Percentage CPU", "avg_cpu_percent", cpu_threshold_percent, "VM", "Avg CPU %",
+            timespan, batch_averages, console
+        ))
 
         console.print("\n--- VM Usage Analysis Summary ---")
         if underutilized_vms:
@@ -614,12 +1180,14 @@ def find_underutilized_vms(credential, subscription_id, cpu_threshold_percent, l
         else:
             console.print(f"  :heavy_check_mark: No running VMs found with avg CPU < {cpu_threshold_percent}%.")
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         logger.error(f"Error checking for underutilized VMs: {e}", exc_info=True)
         console.print(f"[bold red]Error checking for underutilized VMs:[/] {e}")
     return underutilized_vms
 
-def find_low_usage_app_service_plans(credential, subscription_id, cpu_threshold_percent, lookback_days, console: Console):
+def find_low_usage_app_service_plans(credential, subscription_id, cpu_threshold_percent, lookback_days, console: Console, use_cache=True):
     """Finds App Service Plans (non-Free/Shared) with low average CPU utilization."""
     logger = logging.getLogger()
     logger.info(f"📉 Checking App Service Plans (Basic tier+) for avg CPU < {cpu_threshold_percent}% over the last {lookback_days} days...")
@@ -627,98 +1195,44 @@ def find_low_usage_app_service_plans(credential, subscription_id, cpu_threshold_
     low_usage_plans = []
     monitor_client = None # Initialize outside try block
     try:
-        web_client = WebSiteManagementClient(credential, subscription_id)
-        monitor_client = MonitorManagementClient(credential, subscription_id)
+        monitor_client = _get_client(MonitorManagementClient, credential, subscription_id)
 
         # Get the correct timespan format
         timespan = _get_iso8601_timespan(lookback_days)
         logger.debug(f"Using timespan for ASP metrics: {timespan}")
 
-        plans = list(web_client.app_service_plans.list())
-        plans_to_check = []
-        for plan in plans:
-             # Filter out Free and Shared tiers
-             if plan.sku and plan.sku.tier and plan.sku.tier.lower() not in ['free', 'shared', 'dynamic']: # Also exclude Consumption/Dynamic
-                 plans_to_check.append(plan)
+        # ARG pre-filters to Basic+ plans (excluding Free, Shared and Consumption/Dynamic) that host at least
+        # one site, so no metric calls are spent on empty plans that always report 0% CPU
+        plans_to_check = _get_arg_check_rows(credential, subscription_id, "asps_to_check")
 
         if not plans_to_check:
-            console.print("  ℹ No App Service Plans found in relevant tiers (Basic or higher) to analyze.")
+            console.print("  ℹ No App Service Plans with apps found in relevant tiers (Basic or higher) to analyze.")
             return []
 
         console.print(f"  - Found {len(plans_to_check)} App Service Plans in relevant tiers to analyze...")
 
-        for plan in plans_to_check:
-            plan_resource_uri = plan.id # Store URI for error messages
-            plan_name = plan.name # Store name for error messages
-            plan_details = None # Initialize plan_details for the current plan iteration
-            try:
-                rg_name = plan.resource_group # Assumes RG is available on plan object
-
-                plan_details = {
-                     "name": plan.name,
-                     "id": plan.id,
-                     "resource_group": rg_name,
-                     "location": plan.location,
-                     "tier": plan.sku.tier,
-                     "sku": plan.sku.name,
-                     "avg_cpu_percent": None
-                 }
-                avg_cpu = None
-                metric_name = "CpuPercentage" # Metric name for ASP CPU
-                try:
-                    metrics_data = monitor_client.metrics.list(
-                        resource_uri=plan_resource_uri,
-                        timespan=f"{(datetime.now() - timedelta(days=lookback_days)).isoformat()}/{datetime.now().isoformat()}",
-                        interval='P1D',
-                        metricnames=metric_name,
-                        aggregation="Average"
-                    )
-
-                    if metrics_data and metrics_data.value:
-                        time_series = metrics_data.value[0].timeseries
-                        if time_series and time_series[0].data:
-                            valid_points = [d.average for d in time_series[0].data if d.average is not None]
-                            if valid_points:
-                                avg_cpu = sum(valid_points) / len(valid_points)
-                                plan_details["avg_cpu_percent"] = avg_cpu
-                                logger.debug(f"ASP {plan_name} avg CPU: {avg_cpu:.2f}%")
-                            else:
-                                 logger.warning(f"No valid data points found for metric '{metric_name}' for ASP {plan_name} in the timespan.")
-                        else:
-                             logger.warning(f"No time series data found for metric '{metric_name}' for ASP {plan_name} in the timespan.")
-                    else:
-                         logger.warning(f"No metric data returned for '{metric_name}' for ASP {plan_name}.")
-
-                except HttpResponseError as metric_error:
-                     if metric_error.status_code == 429: # Too Many Requests
-                         logger.warning(f"Metrics query for ASP {plan_name} throttled. Skipping.")
-                         console.print(f"  - [yellow]Throttled:[/yellow] Skipping metrics for ASP {plan_name}.")
-                     else:
-                         # Log other HTTP errors more visibly
-                         logger.warning(f"Could not get metrics for ASP {plan_name}. Error: {metric_error}", exc_info=True)
-                         console.print(f"  - [yellow]Warning:[/yellow] Could not get metrics for ASP {plan_name}.")
-                except Exception as metric_error: # Catch other potential errors during metric processing
-                     # Use plan_name which is guaranteed to be defined here
-                     logger.warning(f"Error processing metrics for ASP {plan_name}: {metric_error}", exc_info=True)
-                     console.print(f"  - [yellow]Warning:[/yellow] Error processing metrics for ASP {plan_name}.")
-
-
-                if avg_cpu is not None:
-                    if avg_cpu < cpu_threshold_percent:
-                         console.print(f"  - [bold yellow]Low Usage:[/bold yellow] ASP {plan_name} (Avg CPU: {avg_cpu:.1f}%) is below threshold ({cpu_threshold_percent}%).")
-                         low_usage_plans.append(plan_details)
-                    else:
-                         logger.info(f"ASP {plan_name} CPU usage OK (Avg: {avg_cpu:.1f}%)")
-                else:
-                    # Check if plan_details was populated before printing
-                    name_to_print = plan_name if plan_name else "Unknown Plan"
-                    console.print(f"  - [dim]No CPU data for ASP:[/dim] {name_to_print}")
-
-            except Exception as e: # Catch errors in the outer loop for a specific plan
-                 # Use plan_name which is guaranteed to be defined here
-                 logger.error(f"Error processing ASP {plan_name}: {e}", exc_info=True)
-                 console.print(f"  [red]Error:[/red] Could not process ASP {plan_name}. Check logs.")
+        # Fetch CPU for all plans through the batched metrics API; per-plan calls are only a fallback
+        batch_averages = _get_batch_metric_averages(
+            credential, subscription_id, [(plan['id'], plan['location']) for plan in plans_to_check],
+            "microsoft.web/serverfarms", "CpuPercentage", lookback_days, use_cache=use_cache
+        )
 
+        plans = [
+            {
+                "name": plan['name'],
+                "id": plan['id'],
+                "resource_group": plan.get('resourceGroup'),
+                "location": plan.get('location'),
+                "tier": plan.get('skuTier'),
+                "sku": plan.get('skuName'),
+                "avg_cpu_percent": None
+            }
+            for plan in plans_to_check
+        ]
+        low_usage_plans.extend(_find_low_usage(
+            monitor_client, plans, "CpuPercentage", "avg_cpu_percent", cpu_threshold_percent, "ASP", "Avg CPU %",
+            timespan, batch_averages, console
+        ))
 
         console.print("\n--- App Service Plan Usage Analysis Summary ---")
         if low_usage_plans:
@@ -726,13 +1240,15 @@ def find_low_usage_app_service_plans(credential, subscription_id, cpu_threshold_
         else:
             console.print(f"  :heavy_check_mark: No ASPs found with avg CPU < {cpu_threshold_percent}%.")
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         # Catch potential errors fetching the initial list of plans
         logger.error(f"Error listing or processing App Service Plans: {e}", exc_info=True)
         console.print(f"[bold red]Error checking for low usage App Service Plans:[/] {e}")
     return low_usage_plans
 
-def find_low_dtu_sql_databases(credential, subscription_id, dtu_threshold_percent, lookback_days, console: Console):
+def find_low_dtu_sql_databases(credential, subscription_id, dtu_threshold_percent, lookback_days, console: Console, use_cache=True):
     """Finds SQL Databases (DTU-based model) with low average DTU utilization."""
     logger = logging.getLogger()
     logger.info(f"📉 Checking SQL Databases (DTU model) for avg DTU < {dtu_threshold_percent}% over the last {lookback_days} days...")
@@ -740,46 +1256,14 @@ def find_low_dtu_sql_databases(credential, subscription_id, dtu_threshold_percen
     low_dtu_dbs = []
     monitor_client = None # Initialize outside try block
     try:
-        sql_client = SqlManagementClient(credential, subscription_id)
-        monitor_client = MonitorManagementClient(credential, subscription_id)
+        monitor_client = _get_client(MonitorManagementClient, credential, subscription_id)
 
         # Get the correct timespan format
         timespan = _get_iso8601_timespan(lookback_days)
         logger.debug(f"Using timespan for SQL DTU metrics: {timespan}")
 
-        servers = list(sql_client.servers.list())
-        dbs_to_check = []
-
-        # Iterate through servers to find databases
-        for server in servers:
-            # Extract resource group name from server ID
-            try:
-                rg_name = server.id.split('/')[4]
-            except IndexError:
-                logger.warning(f"Could not parse resource group for SQL server {server.name}. Skipping databases on this server.")
-                continue
-
-            databases = list(sql_client.databases.list_by_server(resource_group_name=rg_name, server_name=server.name))
-            for db in databases:
-                # Check if it's a DTU-based database
-                # Look at currentSku or requestedSku. DTU models are like Basic, Standard, Premium
-                # vCore models often have tier 'GeneralPurpose', 'BusinessCritical', 'Hyperscale'
-                # Elastic pools are handled separately or ignored for now.
-                is_dtu_model = False
-                if db.current_sku and db.current_sku.tier and db.current_sku.tier.lower() in ['basic', 'standard', 'premium']:
-                    is_dtu_model = True
-                elif hasattr(db, 'requested_sku') and db.requested_sku and db.requested_sku.tier and db.requested_sku.tier.lower() in ['basic', 'standard', 'premium']:
-                     is_dtu_model = True
-
-                # Also check for elastic pool - skip those for now
-                if db.elastic_pool_id:
-                     logger.debug(f"Skipping database {db.name} as it's in an elastic pool.")
-                     continue # Skip elastic pool databases for this specific check
-
-                if is_dtu_model:
-                    # Get server location if DB location is None (shouldn't happen often)
-                    db_location = db.location if db.location else server.location
-                    dbs_to_check.append((db, rg_name, server.name, db_location))
+        # One Resource Graph query lists every DTU-model database, instead of listing databases server by server
+        dbs_to_check = _get_arg_check_rows(credential, subscription_id, "sql_dtu_dbs")
 
         if not dbs_to_check:
             console.print("  ℹ No SQL Databases (DTU model) found to check metrics for.")
@@ -787,75 +1271,31 @@ def find_low_dtu_sql_databases(credential, subscription_id, dtu_threshold_percen
 
         console.print(f"  - Found {len(dbs_to_check)} SQL Databases (DTU model) to analyze...")
 
-        for db, rg_name, server_name, location in dbs_to_check:
-            db_resource_uri = db.id # For error reporting
-            db_name = db.name # For error reporting
-            db_details = None # Initialize
-            try:
-                 db_details = {
-                     "name": db.name,
-                     "id": db.id,
-                     "resource_group": rg_name,
-                     "server_name": server_name,
-                     "location": location,
-                     "tier": db.current_sku.tier if db.current_sku else 'Unknown',
-                     "sku": db.current_sku.name if db.current_sku else 'Unknown',
-                     "family": db.current_sku.family if db.current_sku else None, # Family might be needed for pricing
-                     "capacity": db.current_sku.capacity if db.current_sku else None, # Capacity (DTUs)
-                     "avg_dtu_percent": None
-                 }
-                 avg_dtu = None
-                 # Metric name for DTU percentage
-                 metric_name = "dtu_consumption_percent"
-
-                 try:
-                     metrics_data = monitor_client.metrics.list(
-                         resource_uri=db_resource_uri,
-                         timespan=f"{(datetime.now() - timedelta(days=lookback_days)).isoformat()}/{datetime.now().isoformat()}",
-                         interval='P1D',
-                         metricnames=metric_name,
-                         aggregation="Average"
-                     )
-
-                     if metrics_data and metrics_data.value:
-                         time_series = metrics_data.value[0].timeseries
-                         if time_series and time_series[0].data:
-                             valid_points = [d.average for d in time_series[0].data if d.average is not None]
-                             if valid_points:
-                                 avg_dtu = sum(valid_points) / len(valid_points)
-                                 db_details["avg_dtu_percent"] = avg_dtu
-                                 logger.debug(f"SQL DB (DTU) {db_name} on {server_name} avg DTU: {avg_dtu:.2f}%")
-                             else:
-                                  logger.warning(f"No valid data points found for metric '{metric_name}' for SQL DB (DTU) {db_name} on {server_name} in the timespan.")
-                         else:
-                              logger.warning(f"No time series data found for metric '{metric_name}' for SQL DB (DTU) {db_name} on {server_name} in the timespan.")
-                     else:
-                          logger.warning(f"No metric data returned for '{metric_name}' for SQL DB (DTU) {db_name} on {server_name}.")
-
-                 except HttpResponseError as metric_error:
-                      if metric_error.status_code == 429: # Too Many Requests
-                          logger.warning(f"Metrics query for SQL DB (DTU) {db_name} on {server_name} throttled. Skipping.")
-                          console.print(f"  - [yellow]Throttled:[/yellow] Skipping metrics for SQL DB {db_name} on {server_name}.")
-                      else:
-                          # Log other HTTP errors
-                          logger.warning(f"Could not get metrics for SQL DB (DTU) {db_name} on {server_name}. Error: {metric_error}", exc_info=True)
-                          console.print(f"  - [yellow]Warning:[/yellow] Could not get metrics for DTU SQL DB {db_name} on {server_name}.")
-                 except Exception as metric_error:
-                     logger.warning(f"Error processing metrics for SQL DB (DTU) {db_name} on {server_name}: {metric_error}", exc_info=True)
-                     console.print(f"  - [yellow]Warning:[/yellow] Error processing metrics for DTU SQL DB {db_name} on {server_name}.")
-
-                 if avg_dtu is not None:
-                     if avg_dtu < dtu_threshold_percent:
-                         console.print(f"  - [bold yellow]Low Usage:[/bold yellow] SQL DB {db_name} on {server_name} (Avg DTU: {avg_dtu:.1f}%) is below threshold ({dtu_threshold_percent}%).")
-                         low_dtu_dbs.append(db_details)
-                     else:
-                         logger.info(f"SQL DB (DTU) {db_name} on {server_name} DTU usage OK (Avg: {avg_dtu:.1f}%)")
-                 else:
-                     console.print(f"  - [dim]No DTU data for SQL DB:[/dim] {db_name} on {server_name}")
-
-            except Exception as e: # Catch errors in the outer loop for a specific DB
-                 logger.error(f"Error processing SQL DB (DTU) {db_name} on {server_name}: {e}", exc_info=True)
-                 console.print(f"  [red]Error:[/red] Could not process SQL DB {db_name} on {server_name}. Check logs.")
+        # Fetch DTU for all databases through the batched metrics API; per-database calls are only a fallback
+        batch_averages = _get_batch_metric_averages(
+            credential, subscription_id, [(db['id'], db['location']) for db in dbs_to_check],
+            "microsoft.sql/servers/databases", "dtu_consumption_percent", lookback_days, use_cache=use_cache
+        )
+
+        dbs = [
+            {
+                "name": db['name'],
+                "id": db['id'],
+                "resource_group": db.get('resourceGroup'),
+                "server_name": db.get('serverName'),
+                "location": db.get('location'),
+                "tier": db.get('skuTier') or 'Unknown',
+                "sku": db.get('skuName') or 'Unknown',
+                "family": db.get('skuFamily') or None, # Family might be needed for pricing
+                "capacity": db.get('skuCapacity'), # Capacity (DTUs)
+                "avg_dtu_percent": None
+            }
+            for db in dbs_to_check
+        ]
+        low_dtu_dbs.extend(_find_low_usage(
+            monitor_client, dbs, "dtu_consumption_percent", "avg_dtu_percent", dtu_threshold_percent, "SQL DB", "Avg DTU %",
+            timespan, batch_averages, console
+        ))
 
         console.print("\n--- SQL DTU Database Usage Analysis Summary ---")
         if low_dtu_dbs:
@@ -863,12 +1303,14 @@ def find_low_dtu_sql_databases(credential, subscription_id, dtu_threshold_percen
         else:
             console.print(f"  :heavy_check_mark: No SQL DBs (DTU model) found with avg DTU < {dtu_threshold_percent}%.")
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         logger.error(f"Error checking for low DTU SQL databases: {e}", exc_info=True)
         console.print(f"[bold red]Error checking for low DTU SQL Databases:[/] {e}")
     return low_dtu_dbs
 
-def find_low_cpu_sql_vcore_databases(credential, subscription_id, cpu_threshold_percent=SQL_VCORE_LOW_CPU_THRESHOLD_PERCENT, lookback_days=METRIC_LOOKBACK_DAYS, console=None):
+def find_low_cpu_sql_vcore_databases(credential, subscription_id, cpu_threshold_percent=SQL_VCORE_LOW_CPU_THRESHOLD_PERCENT, lookback_days=METRIC_LOOKBACK_DAYS, console=None, use_cache=True):
     """Find SQL Databases using the vCore-based model that have low average CPU utilization over the specified lookback period."""
     logger = logging.getLogger()
     logger.info("Starting analysis of SQL vCore databases for low CPU usage...")
@@ -877,83 +1319,50 @@ def find_low_cpu_sql_vcore_databases(credential, subscription_id, cpu_threshold_
 
     try:
         # Initialize clients
-        sql_client = SqlManagementClient(credential, subscription_id)
-        monitor_client = MonitorManagementClient(credential, subscription_id)
+        monitor_client = _get_client(MonitorManagementClient, credential, subscription_id)
+
+        # Get the correct timespan format
+        timespan = _get_iso8601_timespan(lookback_days)
+        logger.debug(f"Using timespan for SQL vCore metrics: {timespan}")
 
-        # Get all SQL servers
-        servers = list(sql_client.servers.list())
-        if not servers:
-            logger.info("No SQL servers found in the subscription.")
+        # One Resource Graph query lists every vCore database, instead of listing databases server by server
+        dbs_to_check = _get_arg_check_rows(credential, subscription_id, "sql_vcore_dbs")
+        if not dbs_to_check:
+            logger.info("No SQL vCore databases found in the subscription.")
             return []
 
-        low_cpu_dbs = []
-        for server in servers:
-            try:
-                # Extract the resource group from the server ID
-                # Format: /subscriptions/{sub}/resourceGroups/{rg}/providers/...
-                resource_group_name = server.id.split('/')[4] if server.id and len(server.id.split('/')) > 4 else None
-                
-                if not resource_group_name:
-                    logger.warning(f"Could not extract resource group name from server ID: {server.id}")
-                    continue
-                    
-                # Get all databases for this server
-                databases = list(sql_client.databases.list_by_server(resource_group_name, server.name))
-                for db in databases:
-                    try:
-                        # Check if it's a vCore-based model
-                        if not hasattr(db, 'sku') or not db.sku or not hasattr(db.sku, 'name') or not db.sku.name:
-                            continue
-                            
-                        sku_name = db.sku.name.lower()
-                        if not any(prefix in sku_name for prefix in ['bc_', 'gp_', 'hs_']):
-                            continue
-
-                        # Get CPU metrics
-                        metrics_data = monitor_client.metrics.list(
-                            resource_uri=db.id,
-                            timespan=f"{(datetime.now() - timedelta(days=lookback_days)).isoformat()}/{datetime.now().isoformat()}",
-                            interval='P1D',
-                            metricnames='cpu_percent',
-                            aggregation='Average'
-                        )
-
-                        if not metrics_data.value:
-                            logger.warning(f"No CPU metrics found for database {db.name} in server {server.name}")
-                            continue
-
-                        avg_cpu = metrics_data.value[0].timeseries[0].data[-1].average if metrics_data.value[0].timeseries[0].data else None
-                        if avg_cpu is None:
-                            logger.warning(f"Could not calculate average CPU for database {db.name} in server {server.name}")
-                            continue
-
-                        if avg_cpu < cpu_threshold_percent:
-                            low_cpu_dbs.append({
-                                'id': db.id,
-                                'name': db.name,
-                                'resource_group': resource_group_name,
-                                'location': server.location,
-                                'sku': db.sku.name,
-                                'tier': db.sku.tier if hasattr(db.sku, 'tier') else 'Unknown',
-                                'avg_cpu_percent': avg_cpu
-                            })
-                            logger.info(f"Found low CPU vCore database: {db.name} (Avg CPU: {avg_cpu:.1f}%)")
-
-                    except Exception as db_error:
-                        logger.error(f"Error processing database {db.name} in server {server.name}: {db_error}")
-                        continue
-
-            except Exception as server_error:
-                logger.error(f"Error processing server {server.name}: {server_error}")
-                continue
+        # Fetch CPU for all databases through the batched metrics API; per-database calls are only a fallback
+        batch_averages = _get_batch_metric_averages(
+            credential, subscription_id, [(db['id'], db['location']) for db in dbs_to_check],
+            "microsoft.sql/servers/databases", "cpu_percent", lookback_days, use_cache=use_cache
+        )
 
-        return low_cpu_dbs
+        dbs = [
+            {
+                "id": db['id'],
+                "name": db['name'],
+                "resource_group": db.get('resourceGroup'),
+                "server_name": db.get('serverName'),
+                "location": db.get('location'),
+                "sku": db.get('skuName'),
+                "tier": db.get('skuTier') or 'Unknown',
+                "avg_cpu_percent": None
+            }
+            for db in dbs_to_check
+        ]
+        # This check only prints its header, so per-database outcomes go to the log alone
+        return _find_low_usage(
+            monitor_client, dbs, "cpu_percent", "avg_cpu_percent", cpu_threshold_percent, "SQL vCore DB", "Avg CPU %",
+            timespan, batch_averages, console, report=False
+        )
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         logger.error(f"Error in find_low_cpu_sql_vcore_databases: {e}")
         return []
 
-def find_idle_application_gateways(credential, subscription_id, lookback_days, idle_connection_threshold, console: Console):
+def find_idle_application_gateways(credential, subscription_id, lookback_days, idle_connection_threshold, console: Console, use_cache=True):
     """Finds Application Gateways with average current connections below a threshold."""
     logger = logging.getLogger()
     logger.info(f"🚥 Checking Application Gateways for avg current connections < {idle_connection_threshold} over the last {lookback_days} days...")
@@ -961,14 +1370,30 @@ def find_idle_application_gateways(credential, subscription_id, lookback_days, i
     idle_gateways = []
     monitor_client = None # Initialize outside try block
     try:
-        network_client = NetworkManagementClient(credential, subscription_id)
-        monitor_client = MonitorManagementClient(credential, subscription_id)
+        network_client = _get_client(NetworkManagementClient, credential, subscription_id)
+        monitor_client = _get_client(MonitorManagementClient, credential, subscription_id)
 
         # Get the correct timespan format
         timespan = _get_iso8601_timespan(lookback_days)
         logger.debug(f"Using timespan for App Gateway metrics: {timespan}")
 
-        gateways = list(network_client.application_gateways.list_all())
+        # Keep only the fields the check needs while the pager streams; gateway models carry their whole configuration
+        gateways = []
+        for gw in network_client.application_gateways.list_all():
+            # Extract RG name safely
+            rg_name = resource_group_from_id(gw.id)
+            if not rg_name:
+                logger.warning(f"Could not parse resource group for App Gateway {gw.name}. Skipping metrics check.")
+                continue
+            gateways.append({
+                "name": gw.name,
+                "id": gw.id,
+                "resource_group": rg_name,
+                "location": gw.location,
+                "tier": gw.sku.tier if gw.sku else 'Unknown',
+                "sku": gw.sku.name if gw.sku else 'Unknown',
+                "avg_current_connections": None
+            })
 
         if not gateways:
             console.print("  ℹ No Application Gateways found to analyze.")
@@ -976,82 +1401,16 @@ def find_idle_application_gateways(credential, subscription_id, lookback_days, i
 
         console.print(f"  - Found {len(gateways)} Application Gateways to analyze...")
 
-        for gw in gateways:
-            gw_resource_uri = gw.id # For error reporting
-            gw_name = gw.name # For error reporting
-            gw_details = None # Initialize
-            try:
-                 # Extract RG name safely
-                 rg_name = None
-                 try:
-                     rg_name = gw.id.split('/')[4]
-                 except IndexError:
-                     logger.warning(f"Could not parse resource group for App Gateway {gw_name}. Skipping metrics check.")
-                     continue
-
-                 gw_details = {
-                     "name": gw.name,
-                     "id": gw.id,
-                     "resource_group": rg_name,
-                     "location": gw.location,
-                     "tier": gw.sku.tier if gw.sku else 'Unknown',
-                     "sku": gw.sku.name if gw.sku else 'Unknown',
-                     "avg_current_connections": None
-                 }
-                 avg_connections = None
-                 # Metric for current connections (adjust if needed based on exact metric name)
-                 # Common names: 'CurrentConnections', 'TotalRequests', 'Throughput'
-                 # Let's use 'CurrentConnections' as a likely candidate for 'idle'
-                 metric_name = "CurrentConnections"
-
-                 try:
-                     metrics_data = monitor_client.metrics.list(
-                         resource_uri=gw_resource_uri,
-                         timespan=timespan, # Use correct timespan format
-                         interval="PT1H",
-                         metricnames=metric_name,
-                         aggregation="Average"
-                     )
-
-                     if metrics_data and metrics_data.value:
-                         time_series = metrics_data.value[0].timeseries
-                         if time_series and time_series[0].data:
-                             valid_points = [d.average for d in time_series[0].data if d.average is not None]
-                             if valid_points:
-                                 avg_connections = sum(valid_points) / len(valid_points)
-                                 gw_details["avg_current_connections"] = avg_connections
-                                 logger.debug(f"App Gateway {gw_name} avg connections: {avg_connections:.2f}")
-                             else:
-                                  logger.warning(f"No valid data points found for metric '{metric_name}' for App Gateway {gw_name} in the timespan.")
-                         else:
-                              logger.warning(f"No time series data found for metric '{metric_name}' for App Gateway {gw_name} in the timespan.")
-                     else:
-                          logger.warning(f"No metric data returned for '{metric_name}' for App Gateway {gw_name}.")
-
-                 except HttpResponseError as metric_error:
-                      if metric_error.status_code == 429: # Too Many Requests
-                          logger.warning(f"Metrics query for App Gateway {gw_name} throttled. Skipping.")
-                          console.print(f"  - [yellow]Throttled:[/yellow] Skipping metrics for App Gateway {gw_name}.")
-                      else:
-                          # Log other HTTP errors
-                          logger.warning(f"Could not get metrics for App Gateway {gw_name}. Error: {metric_error}", exc_info=True)
-                          console.print(f"  - [yellow]Warning:[/yellow] Could not get metrics for App Gateway {gw_name}.")
-                 except Exception as metric_error:
-                     logger.warning(f"Error processing metrics for App Gateway {gw_name}: {metric_error}", exc_info=True)
-                     console.print(f"  - [yellow]Warning:[/yellow] Error processing metrics for App Gateway {gw_name}.")
-
-                 if avg_connections is not None:
-                     if avg_connections < idle_connection_threshold:
-                         console.print(f"  - [bold yellow]Idle:[/bold yellow] App Gateway {gw_name} (Avg Connections: {avg_connections:.1f}) is below threshold ({idle_connection_threshold}).")
-                         idle_gateways.append(gw_details)
-                     else:
-                          logger.info(f"App Gateway {gw_name} connection usage OK (Avg: {avg_connections:.1f})")
-                 else:
-                     console.print(f"  - [dim]No connection data for App Gateway:[/dim] {gw_name}")
-
-            except Exception as e: # Catch errors in the outer loop for a specific Gateway
-                logger.error(f"Error processing App Gateway {gw_name}: {e}", exc_info=True)
-                console.print(f"  [red]Error:[/red] Could not process App Gateway {gw_name}. Check logs.")
+        # Fetch connections for all gateways through the batched metrics API; per-gateway calls are only a fallback
+        batch_averages = _get_batch_metric_averages(
+            credential, subscription_id, [(gw["id"], gw["location"]) for gw in gateways],
+            "microsoft.network/applicationgateways", "CurrentConnections", lookback_days, use_cache=use_cache
+        )
+
+        idle_gateways.extend(_find_low_usage(
+            monitor_client, gateways, "CurrentConnections", "avg_current_connections", idle_connection_threshold, "App Gateway", "Avg Connections",
+            timespan, batch_averages, console
+        ))
 
         console.print("\n--- Application Gateway Usage Analysis Summary ---")
         if idle_gateways:
@@ -1059,12 +1418,14 @@ def find_idle_application_gateways(credential, subscription_id, lookback_days, i
         else:
             console.print(f"  :heavy_check_mark: No Application Gateways found with avg connections < {idle_connection_threshold}.")
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         logger.error(f"Error checking for idle Application Gateways: {e}", exc_info=True)
         console.print(f"[bold red]Error checking for idle Application Gateways:[/] {e}")
     return idle_gateways
 
-def find_low_usage_web_apps(credential, subscription_id, cpu_threshold_percent, lookback_days, console: Console):
+def find_low_usage_web_apps(credential, subscription_id, cpu_threshold_percent, lookback_days, console: Console, use_cache=True):
     """Finds Web Apps (running on Basic+ plans) with low average CPU utilization."""
     logger = logging.getLogger()
     logger.info(f"💻 Checking Web Apps (on Basic+ plans) for avg CPU < {cpu_threshold_percent}% over the last {lookback_days} days...")
@@ -1072,51 +1433,14 @@ def find_low_usage_web_apps(credential, subscription_id, cpu_threshold_percent,
     low_usage_apps = []
     monitor_client = None # Initialize outside try block
     try:
-        web_client = WebSiteManagementClient(credential, subscription_id)
-        monitor_client = MonitorManagementClient(credential, subscription_id)
+        monitor_client = _get_client(MonitorManagementClient, credential, subscription_id)
 
         # Get the correct timespan format
         timespan = _get_iso8601_timespan(lookback_days)
         logger.debug(f"Using timespan for Web App metrics: {timespan}")
 
-        web_apps = list(web_client.web_apps.list())
-        apps_to_check = []
-        plan_cache = {} # Cache plan details to avoid redundant lookups
-
-        console.print(f"  - Found {len(web_apps)} total Web Apps. Analyzing those on Basic+ plans...")
-        # Filter apps based on their App Service Plan tier
-        for app in web_apps:
-            # Check if app has a valid server farm ID
-            if not app.server_farm_id:
-                 logger.debug(f"Skipping Web App {app.name} as it has no associated App Service Plan ID.")
-                 continue
-
-            plan_id = app.server_farm_id
-            plan_info = plan_cache.get(plan_id)
-
-            if not plan_info:
-                try:
-                    # Extract plan RG and name from ID
-                    parts = plan_id.split('/')
-                    plan_rg = parts[4]
-                    plan_name = parts[8]
-                    plan = web_client.app_service_plans.get(plan_rg, plan_name)
-                    if plan and plan.sku and plan.sku.tier:
-                        plan_info = {'tier': plan.sku.tier.lower(), 'name': plan.name}
-                        plan_cache[plan_id] = plan_info
-                    else:
-                        plan_cache[plan_id] = {'tier': 'unknown', 'name': plan_name} # Cache unknown tier
-                        logger.warning(f"Could not determine tier for plan {plan_name} ({plan_id}). Skipping apps on this plan.")
-                        continue
-                except Exception as plan_err:
-                    logger.error(f"Error fetching details for plan {plan_id} for app {app.name}: {plan_err}", exc_info=True)
-                    plan_cache[plan_id] = {'tier': 'error', 'name': 'Unknown'} # Cache error state
-                    console.print(f"  [yellow]Warning:[/yellow] Could not get plan details for app {app.name}. Skipping.")
-                    continue
-
-            # Check if the plan tier is relevant (Basic or higher)
-            if plan_info and plan_info.get('tier') not in ['free', 'shared', 'dynamic', 'unknown', 'error']:
-                apps_to_check.append((app, plan_info)) # Append app and its cached plan info
+        # One Resource Graph query lists the apps on Basic+ plans, instead of listing apps and fetching each plan
+        apps_to_check = _get_arg_check_rows(credential, subscription_id, "web_apps_to_check")
 
         if not apps_to_check:
             console.print("  ℹ No Web Apps found running on relevant App Service Plans (Basic or higher).")
@@ -1124,93 +1448,29 @@ def find_low_usage_web_apps(credential, subscription_id, cpu_threshold_percent,
 
         console.print(f"  - Found {len(apps_to_check)} Web Apps (on Basic+ plans) to analyze...")
 
-        for app, plan_info in apps_to_check:
-            app_resource_uri = app.id # For error reporting
-            app_name = app.name # For error reporting
-            app_details = None # Initialize
-            try:
-                # Extract RG name safely
-                rg_name = None
-                try:
-                    rg_name = app.id.split('/')[4]
-                except IndexError:
-                    logger.warning(f"Could not parse resource group for Web App {app_name}. Skipping metrics check.")
-                    continue
-
-                app_details = {
-                     "name": app.name,
-                     "id": app.id,
-                     "resource_group": rg_name,
-                     "location": app.location,
-                     "plan_name": plan_info.get('name', 'Unknown'),
-                     "plan_tier": plan_info.get('tier', 'Unknown').capitalize(), # Capitalize tier for display
-                     "avg_cpu_percent": None
-                }
-                avg_cpu = None
-                # Metrics for Web Apps can be 'CpuTime' (total seconds) or 'AverageCpuPercentage' (often requires specific diagnostics settings)
-                # Let's try 'CpuTime' and calculate percentage based on plan capacity if needed, or use 'AverageCpuPercentage' if available
-                # Preferred metric name: 'AverageCpuPercentage' (if enabled via Diagnostics) or 'CpuPercentage'
-                metric_name = "CpuPercentage" # Common metric for Web App CPU %
+        # Fetch CPU for all apps through the batched metrics API; per-app calls are only a fallback
+        batch_averages = _get_batch_metric_averages(
+            credential, subscription_id, [(app['id'], app['location']) for app in apps_to_check],
+            "microsoft.web/sites", "CpuPercentage", lookback_days, use_cache=use_cache
+        )
 
-                try:
-                    metrics_data = monitor_client.metrics.list(
-                        resource_uri=app_resource_uri,
-                        timespan=timespan, # Use correct timespan format
-                        interval="PT1H",
-                        metricnames=metric_name,
-                        aggregation="Average"
-                    )
-                    # Process metrics_data if successful
-                    if metrics_data and metrics_data.value:
-                         valid_points = [d.average for d in metrics_data.value[0].timeseries[0].data if d.average is not None]
-                         if valid_points:
-                             avg_cpu = sum(valid_points) / len(valid_points)
-                             app_details["avg_cpu_percent"] = avg_cpu
-                             logger.debug(f"Web App {app_name} avg CPU: {avg_cpu:.2f}%")
-                         else:
-                              logger.warning(f"No valid data points found for metric '{metric_name}' for Web App {app_name} in the timespan.")
-                    else:
-                         logger.warning(f"No metric data returned for '{metric_name}' for Web App {app_name}.")
-
-                except HttpResponseError as metric_error:
-                     # Check for specific "Metric configuration not found" error
-                     is_metric_not_found_error = (
-                         metric_error.status_code == 400 and
-                         metric_error.error and
-                         hasattr(metric_error.error, 'message') and
-                         metric_error.error.message and
-                         "failed to find metric configuration" in metric_error.error.message.lower()
-                     )
-
-                     if is_metric_not_found_error:
-                         # Log a concise warning and continue gracefully
-                         logger.warning(f"Metric '{metric_name}' not found for Web App {app_name}. It might need to be enabled in Diagnostics settings.")
-                         console.print(f"  - [yellow]Warning:[/yellow] Metric '{metric_name}' not found for Web App {app_name}. (Enable in Diagnostics?)")
-                     elif metric_error.status_code == 429: # Too Many Requests
-                         logger.warning(f"Metrics query for Web App {app_name} throttled. Skipping.")
-                         console.print(f"  - [yellow]Throttled:[/yellow] Skipping metrics for Web App {app_name}.")
-                     else:
-                         # Log other HTTP errors with traceback for debugging
-                         logger.warning(f"Could not get metrics for Web App {app_name}. Error: {metric_error}", exc_info=True)
-                         console.print(f"  - [yellow]Warning:[/yellow] Could not get metrics for Web App {app_name} (Error: {metric_error.status_code}). Check logs.")
-                except Exception as metric_error:
-                    # Log other unexpected errors during metric processing
-                    logger.warning(f"Error processing metrics for Web App {app_name}: {metric_error}", exc_info=True)
-                    console.print(f"  - [yellow]Warning:[/yellow] Error processing metrics for Web App {app_name}. Check logs.")
-
-
-                if avg_cpu is not None:
-                    if avg_cpu < cpu_threshold_percent:
-                        console.print(f"  - [bold yellow]Low Usage:[/bold yellow] Web App {app_name} (Avg CPU: {avg_cpu:.1f}%) is below threshold ({cpu_threshold_percent}%).")
-                        low_usage_apps.append(app_details)
-                    else:
-                         logger.info(f"Web App {app_name} CPU usage OK (Avg: {avg_cpu:.1f}%)")
-                else:
-                    console.print(f"  - [dim]No CPU data for Web App:[/dim] {app_name}")
-
-            except Exception as e: # Catch errors in the outer loop for a specific App
-                logger.error(f"Error processing Web App {app_name}: {e}", exc_info=True)
-                console.print(f"  [red]Error:[/red] Could not process Web App {app_name}. Check logs.")
+        apps = [
+            {
+                "name": app['name'],
+                "id": app['id'],
+                "resource_group": app.get('resourceGroup'),
+                "location": app.get('location'),
+                "plan_name": app.get('planName') or 'Unknown',
+                "plan_tier": (app.get('planTier') or 'Unknown').capitalize(), # Capitalize tier for display
+                "avg_cpu_percent": None
+            }
+            for app in apps_to_check
+        ]
+        # CpuPercentage may need Diagnostics enabled; once one app reports it missing, the rest are skipped
+        low_usage_apps.extend(_find_low_usage(
+            monitor_client, apps, "CpuPercentage", "avg_cpu_percent", cpu_threshold_percent, "Web App", "Avg CPU %",
+            timespan, batch_averages, console, skip_missing_metric=True
+        ))
 
         console.print("\n--- Web App Usage Analysis Summary ---")
         if low_usage_apps:
@@ -1218,91 +1478,141 @@ def find_low_usage_web_apps(credential, subscription_id, cpu_threshold_percent,
         else:
             console.print(f"  :heavy_check_mark: No running Web Apps (on Basic+ plans) found with avg CPU < {cpu_threshold_percent}%.")
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         logger.error(f"Error checking for low usage Web Apps: {e}", exc_info=True)
         console.print(f"[bold red]Error checking for low usage Web Apps:[/] {e}")
     return low_usage_apps
 
 def find_orphaned_nsgs(credential, subscription_id, console: Console):
-    """Finds Network Security Groups not associated with any NIC or subnet."""
+    """Finds Network Security Groups not associated with any NIC or subnet using Azure Resource Graph."""
     logger = logging.getLogger()
     logger.info("🛡 Checking for orphaned Network Security Groups (NSGs)...")
     console.print("\n🛡 Checking for orphaned Network Security Groups (NSGs)...") # Keep simple print
     orphaned_nsgs = []
     try:
-        network_client = NetworkManagementClient(credential, subscription_id)
-        all_nsgs = list(network_client.network_security_groups.list_all())
-        all_nics = list(network_client.network_interfaces.list_all())
-        all_subnets = []
-        vnets = list(network_client.virtual_networks.list_all())
-        for vnet in vnets:
-            subnets = list(network_client.subnets.list(vnet.id.split('/')[4], vnet.name))
-            all_subnets.extend(subnets)
-
-        all_nsg_ids = set(nsg.id for nsg in all_nsgs)
-        associated_nsg_ids = set(nic.network_security_group.id for nic in all_nics if nic.network_security_group)
-        associated_nsg_ids.update(subnet.network_security_group.id for subnet in all_subnets if subnet.network_security_group)
-
-        orphaned_nsg_ids = all_nsg_ids - associated_nsg_ids
-
-        if not orphaned_nsg_ids:
+        # One query instead of listing every NIC, VNet and subnet to collect associations
+        nsg_rows = _get_arg_check_rows(credential, subscription_id, "orphaned_nsgs")
+        logger.debug(f"ARG query returned {len(nsg_rows)} orphaned NSGs.")
+
+        for nsg_data in nsg_rows:
+            orphaned_nsgs.append({
+                "name": nsg_data.get('name', 'Unknown'),
+                "id": nsg_data.get('id', 'Unknown'),
+                "resource_group": nsg_data.get('resourceGroup', 'Unknown'),
+                "location": nsg_data.get('location', 'Unknown')
+            })
+
+        if not orphaned_nsgs:
             console.print("  :heavy_check_mark: No orphaned NSGs found.")
         else:
-            console.print(f"  :warning: Found {len(orphaned_nsg_ids)} potentially orphaned NSG(s).")
-            # Retrieve details for orphaned NSGs
-            for nsg in all_nsgs:
-                if nsg.id in orphaned_nsg_ids:
-                    orphaned_nsgs.append({
-                        "name": nsg.name,
-                        "id": nsg.id,
-                        "resource_group": nsg.id.split('/')[4],
-                        "location": nsg.location
-                    })
-
+            console.print(f"  :warning: Found {len(orphaned_nsgs)} potentially orphaned NSG(s).")
         return orphaned_nsgs
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         logging.error(f"Error checking for orphaned NSGs: {e}", exc_info=True)
         console.print(f"[bold red]Error checking for orphaned NSGs:[/bold red] {e}")
         return []
 
 def find_orphaned_route_tables(credential, subscription_id, console: Console):
-    """Finds Route Tables not associated with any subnet."""
+    """Finds Route Tables not associated with any subnet using Azure Resource Graph."""
     logger = logging.getLogger()
     logger.info("🗺 Checking for orphaned Route Tables...")
     console.print("\n🗺 Checking for orphaned Route Tables...") # Keep simple print
     orphaned_rts = []
     try:
-        network_client = NetworkManagementClient(credential, subscription_id)
-        all_route_tables = list(network_client.route_tables.list_all())
-        all_subnets = []
-        vnets = list(network_client.virtual_networks.list_all())
-        for vnet in vnets:
-            subnets = list(network_client.subnets.list(vnet.id.split('/')[4], vnet.name))
-            all_subnets.extend(subnets)
-
-        all_route_table_ids = set(rt.id for rt in all_route_tables)
-        associated_route_table_ids = set(subnet.route_table.id for subnet in all_subnets if subnet.route_table)
-
-        orphaned_route_table_ids = all_route_table_ids - associated_route_table_ids
+        # One query instead of listing every VNet and its subnets to collect associations
+        rt_rows = _get_arg_check_rows(credential, subscription_id, "orphaned_route_tables")
+        logger.debug(f"ARG query returned {len(rt_rows)} orphaned Route Tables.")
+
+        for rt_data in rt_rows:
+            orphaned_rts.append({
+                "name": rt_data.get('name', 'Unknown'),
+                "id": rt_data.get('id', 'Unknown'),
+                "resource_group": rt_data.get('resourceGroup', 'Unknown'),
+                "location": rt_data.get('location', 'Unknown')
+            })
 
-        if not orphaned_route_table_ids:
+        if not orphaned_rts:
             console.print("  :heavy_check_mark: No orphaned Route Tables found.")
         else:
-            console.print(f"  :warning: Found {len(orphaned_route_table_ids)} potentially orphaned Route Table(s).")
-            # Retrieve details for orphaned route tables
-            for rt in all_route_tables:
-                if rt.id in orphaned_route_table_ids:
-                    orphaned_rts.append({
-                        "name": rt.name,
-                        "id": rt.id,
-                        "resource_group": rt.id.split('/')[4],
-                        "location": rt.location
-                    })
-
+            console.print(f"  :warning: Found {len(orphaned_rts)} potentially orphaned Route Table(s).")
         return orphaned_rts
 
+    except ClientAuthenticationError:
+        raise
     except Exception as e:
         logging.error(f"Error checking for orphaned Route Tables: {e}", exc_info=True)
         console.print(f"[bold red]Error checking for orphaned Route Tables:[/bold red] {e}")
-        return [] 
\ No newline at end of file
+        return []
+
+# --- Running All Checks ---
+
+def run_all_checks(credential, subscription_id, console: Console = _console, use_cache=True, on_check_done=None, max_workers=ANALYSIS_CHECK_WORKERS):
+    """Runs the cost query and every find_* check concurrently.
+
+    The checks are independent (different APIs and clients), so total time is roughly that of the
+    slowest check rather than the sum. Resource Graph checks share a few prefetched queries, and
+    concurrent ARG calls are capped by ARG_MAX_CONCURRENT_QUERIES. on_check_done(name), if given,
+    is called as each check finishes.
+
+    Returns (cost_data, findings): cost_data is get_cost_data's (costs_by_type, total_cost, currency)
+    tuple and findings maps each check name to its list of findings.
+
+    A check's own errors leave it with no findings, but a ClientAuthenticationError is raised: every
+    check shares the credential, so the rest would fail the same way and the report would look clean.
+    """
+    logger = logging.getLogger()
+    checks = {
+        'cost_data': (get_cost_data, dict(use_cache=use_cache)),
+        'unattached_disks': (find_unattached_disks, {}),
+        'stopped_vms': (find_stopped_vms, {}),
+        'unused_public_ips': (find_unused_public_ips, {}),
+        'empty_rgs': (find_empty_resource_groups, {}),
+        'empty_asps': (find_empty_app_service_plans, {}),
+        'old_snapshots': (find_old_snapshots, dict(age_threshold_days=SNAPSHOT_AGE_THRESHOLD_DAYS)),
+        'low_cpu_vms': (find_underutilized_vms, dict(cpu_threshold_percent=LOW_CPU_THRESHOLD_PERCENT, lookback_days=METRIC_LOOKBACK_DAYS, use_cache=use_cache)),
+        'low_cpu_asps': (find_low_usage_app_service_plans, dict(cpu_threshold_percent=APP_SERVICE_PLAN_LOW_CPU_THRESHOLD_PERCENT, lookback_days=METRIC_LOOKBACK_DAYS, use_cache=use_cache)),
+        'low_dtu_dbs': (find_low_dtu_sql_databases, dict(dtu_threshold_percent=SQL_DB_LOW_DTU_THRESHOLD_PERCENT, lookback_days=METRIC_LOOKBACK_DAYS, use_cache=use_cache)),
+        'low_cpu_vcore_dbs': (find_low_cpu_sql_vcore_databases, dict(cpu_threshold_percent=SQL_VCORE_LOW_CPU_THRESHOLD_PERCENT, lookback_days=METRIC_LOOKBACK_DAYS, use_cache=use_cache)),
+        'idle_gateways': (find_idle_application_gateways, dict(lookback_days=METRIC_LOOKBACK_DAYS, idle_connection_threshold=IDLE_CONNECTION_THRESHOLD_GATEWAY, use_cache=use_cache)),
+        'low_cpu_apps': (find_low_usage_web_apps, dict(cpu_threshold_percent=LOW_CPU_THRESHOLD_WEB_APP, lookback_days=METRIC_LOOKBACK_DAYS, use_cache=use_cache)),
+        'orphaned_nsgs': (find_orphaned_nsgs, {}),
+        'orphaned_rts': (find_orphaned_route_tables, {}),
+    }
+
+    # A few grouped ARG queries up front; the ARG-based finders then read their rows from them
+    prefetch_arg_checks(credential, subscription_id)
+
+    cost_data = (defaultdict(float), 0.0, "N/A")
+    findings = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(check_fn, credential, subscription_id, console=console, **kwargs): name
+            for name, (check_fn, kwargs) in checks.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except ClientAuthenticationError:
+                for pending in futures:
+                    pending.cancel()
+                raise
+            except Exception as e:
+                # The finders handle their own errors; this only catches the unexpected
+                logger.error(f"Check '{name}' failed: {e}", exc_info=True)
+                console.print(f"[bold red]Error running check '{name}':[/] {e}")
+                result = None
+            if name == 'cost_data':
+                cost_data = result or cost_data
+            else:
+                findings[name] = result if result is not None else []
+            logger.debug(f"Check '{name}' finished.")
+            if on_check_done:
+                on_check_done(name)
+    # Report in a stable order regardless of completion order
+    return cost_data, {name: findings[name] for name in checks if name in findings}
@@ -0,0 +1,56 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+from .config import COST_CACHE_FILENAME
+
+# Small JSON-file cache for slow, heavily throttled API results that change slowly (e.g. Cost Management).
+# Entries are {key: {"stored_at": ISO timestamp, "value": JSON-serializable value}}.
+
+# Checks running side by side write to the same file, so each read-modify-write is serialized
+_write_lock = threading.Lock()
+
+def make_key(*parts) -> str:
+    """Builds a stable cache key from the given parts."""
+    return hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+def _read_entries(filename):
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        return entries if isinstance(entries, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.getLogger().warning(f"Ignoring unreadable cache file {filename}: {e}")
+        return {}
+
+def get(key, max_age, filename=None):
+    """Returns (value, stored_at) for key if it was stored less than max_age (a timedelta) ago, else None."""
+    entry = _read_entries(filename or COST_CACHE_FILENAME).get(key)
+    if not entry:
+        return None
+    try:
+        stored_at = datetime.fromisoformat(entry["stored_at"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if datetime.now(timezone.utc) - stored_at >= max_age:
+        return None
+    return entry.get("value"), stored_at
+
+def put(key, value, filename=None):
+    """Stores value under key, replacing the cache file atomically so concurrent readers never see a partial write."""
+    filename = filename or COST_CACHE_FILENAME
+    with _write_lock:
+        entries = _read_entries(filename)
+        entries[key] = {"stored_at": datetime.now(timezone.utc).isoformat(), "value": value}
+        temp_filename = f"{filename}.tmp"
+        try:
+            with open(temp_filename, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(temp_filename, filename)
+        except OSError as e:
+            logging.getLogger().warning(f"Could not write cache file {filename}: {e}")
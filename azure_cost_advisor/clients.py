@@ -1,9 +1,15 @@
 import os
 import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from azure.identity import DefaultAzureCredential
 from azure.mgmt.resource import SubscriptionClient
+from azure.core.pipeline.transport import RequestsTransport
 from rich.console import Console # Keep console for now, might pass later
 
+from .config import HTTP_CONNECTION_POOL_SIZE
+
 # Initialize console here or pass it?
 # For now, keep it initialized here for self-contained function, but main will pass it later.
 _console = Console()
@@ -63,6 +69,23 @@ def get_azure_credentials(console: Console = _console):
         console.print(f"[bold red]Authentication or subscription detection failed:[/] {e}")
         return None, None
 
+def build_shared_transport(pool_maxsize: int = HTTP_CONNECTION_POOL_SIZE) -> RequestsTransport:
+    """Builds one HTTP transport that several management clients can share.
+
+    Each client otherwise opens its own requests.Session, so concurrent calls across
+    clients would pay for separate connection pools and TLS handshakes.
+    """
+    session = requests.Session()
+    # Retries are handled by the azure-core pipeline, so keep urllib3 from retrying on its own
+    adapter = HTTPAdapter(
+        pool_connections=pool_maxsize,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=False, redirect=False, raise_on_status=False)
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, session_owner=False)
+
 # Placeholder for future client helper functions if needed
 # def get_compute_client(credential, subscription_id):
 #     return ComputeManagementClient(credential, subscription_id) 
\ No newline at end of file
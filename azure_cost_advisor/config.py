@@ -14,5 +14,32 @@ METRIC_LOOKBACK_DAYS = 7
 LOG_FILENAME = "cleanup_log.txt"
 RETAIL_PRICES_API_ENDPOINT = "https://prices.azure.com/api/retail/prices"
 HOURS_PER_MONTH = 730 # Approximate hours for monthly cost estimation
+CLEANUP_MAX_WORKERS = 30 # Max concurrent delete/deallocate requests during --force-cleanup
+LRO_POLLING_INTERVAL_SECONDS = 2 # Poll cadence for long-running delete/deallocate operations
+HTTP_CONNECTION_POOL_SIZE = 64 # Connections kept alive in the transport shared by management clients
+ARG_ID_BATCH_SIZE = 1000 # Max resource IDs per Resource Graph existence query (ARG caps results at 1000 rows)
+ARG_PAGE_SIZE = 1000 # Rows per Resource Graph page (ARG's maximum; the default is 100)
+ARG_MAX_PAGES = 100 # Safety cap on skip-token pages followed for one Resource Graph query
+ARG_MAX_CONCURRENT_QUERIES = 2 # Resource Graph queries allowed in flight at once (ARG throttles at 15 queries per 5s)
+ARG_QUERY_BURST = 15 # Resource Graph queries allowed back to back before pacing starts (ARG's quota is 15 per 5s window)
+ARG_QUERIES_PER_SECOND = 3 # Sustained Resource Graph query rate (15 per 5s)
+ARM_READ_BURST = 250 # Per-resource ARM reads (metrics.list) allowed back to back (ARM's per-subscription read bucket)
+ARM_READS_PER_SECOND = 25 # Sustained ARM read rate, the bucket's refill rate
+THROTTLE_SLOWDOWN_SECONDS = 60 # After a 429, client-side rate limits refill at half speed for this long
+RETRY_MAX_ATTEMPTS = 5 # Attempts for a throttled (HTTP 429) analysis API call before giving up
+RETRY_MAX_WAIT_SECONDS = 60 # Longest throttling wait honored; a 429 asking for longer is raised instead of retried
+ANALYSIS_CHECK_WORKERS = 10 # Analysis checks run side by side by run_all_checks
+ANALYSIS_MAX_WORKERS = 16 # Max concurrent per-resource ARM/Monitor reads during analysis (keep well under ARM read throttling)
+METRICS_MAX_CONCURRENT_QUERIES = 16 # Per-resource Monitor metrics calls allowed in flight at once across all checks
+COST_CACHE_FILENAME = ".cost_data_cache.json" # On-disk cache for month-to-date Cost Management results
+COST_BREAKDOWN_MAX_ROWS = 20 # Resource types listed in the console cost breakdown; the rest are summed into one line
+COST_MAX_PAGES = 100 # Safety cap on nextLink pages followed for one Cost Management query
+COST_CACHE_TTL_HOURS = 2 # Reuse cached cost data for this long before querying the API again
+COST_SETTLE_DAYS = 3 # Days Cost Management may keep revising; older days are cached for the rest of the month
+METRICS_BATCH_SIZE = 50 # Max resource IDs per Azure Monitor metrics:getBatch request (API limit)
+METRICS_BATCH_API_VERSION = "2023-10-01"
+METRICS_CACHE_FILENAME = ".metrics_cache.json" # On-disk cache for per-resource metric averages
+METRICS_CACHE_TTL_MINUTES = 30 # Reuse cached metric averages for this long (half the hourly granularity Monitor aggregates at)
+TOKEN_REFRESH_MARGIN_SECONDS = 300 # Fetch a new access token once the cached one is this close to expiring
 
 # DISK_SIZE_TO_TIER moved to pricing.py 
\ No newline at end of file
@@ -4,7 +4,6 @@ import json
 import re # Import regex for flexible matching
 from typing import List, Dict, Any, Optional, Tuple, Set, TYPE_CHECKING
 from rich.console import Console # Keep for potential future use or passthrough
-from azure.mgmt.costmanagement import CostManagementClient # Added import
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 import math # For ceiling function
@@ -17,6 +16,9 @@ from .config import (
     HOURS_PER_MONTH,
     # DISK_SIZE_TO_TIER <<< Removed from import
 )
+from .utils import LazyImport
+
+CostManagementClient = LazyImport("azure.mgmt.costmanagement", "CostManagementClient") # Loaded on first use
 
 # Type hint for logger to avoid circular import if utils imports pricing
 if TYPE_CHECKING:
@@ -1,5 +1,5 @@
+import importlib
 import logging
-import sys
 from rich.logging import RichHandler
 from .config import LOG_FILENAME
 
@@ -46,6 +46,40 @@ def setup_logger(level=logging.INFO, filename=LOG_FILENAME):
         
     return logger # Return the configured root logger
 
+class LazyImport:
+    """Stands in for a module attribute (e.g. an Azure SDK client class) and imports it on first use.
+
+    The azure.mgmt.* packages each take hundreds of milliseconds to import, and a run rarely needs all
+    of them. Calling the stand-in, or reading an attribute from it, imports the real object and forwards to it.
+    """
+    def __init__(self, module_name, attr_name):
+        self._module_name = module_name
+        self._attr_name = attr_name
+        self._target = None
+
+    def _resolve(self):
+        if self._target is None:
+            self._target = getattr(importlib.import_module(self._module_name), self._attr_name)
+        return self._target
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __repr__(self):
+        return f"<lazy {self._module_name}.{self._attr_name}>"
+
+def resource_group_from_id(resource_id):
+    """Returns the resource group name from an ARM resource ID, or None if the ID is too short to contain one.
+
+    IDs look like /subscriptions/{sub}/resourceGroups/{rg}/providers/...; only the first five
+    segments are split off, so long nested IDs aren't split in full.
+    """
+    parts = resource_id.split('/', 5) if resource_id else []
+    return parts[4] or None if len(parts) > 4 else None
+
 # Example usage (if running this file directly)
 if __name__ == "__main__":
     # Example of using the setup function
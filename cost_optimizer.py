@@ -5,6 +5,7 @@ import pandas as pd
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
 import sys
+from azure.core.exceptions import ClientAuthenticationError
 
 # Import from the new module structure
 from azure_cost_advisor import (
@@ -93,11 +94,13 @@ def main():
     parser.add_argument("--cleanup", action="store_true", help="Enable interactive cleanup prompts for identified resources.")
     parser.add_argument("--force-cleanup", action="store_true", help="Force cleanup actions without interactive confirmation (USE WITH CAUTION!).")
     parser.add_argument("--wait-for-cleanup", action="store_true", help="Wait for each cleanup operation (delete/deallocate) to complete.")
+    parser.add_argument("--cleanup-workers", type=int, default=config.CLEANUP_MAX_WORKERS, help=f"Max concurrent cleanup actions per resource type with --force-cleanup (default: {config.CLEANUP_MAX_WORKERS}).")
     parser.add_argument("--send-email", action="store_true", help="Send a summary report email (requires EMAIL_* and SMTP_* env vars).")
     parser.add_argument("--html-report", default="azure_cost_optimization_report.html", help="Filename for the HTML report.")
     parser.add_argument("--csv-report", default="azure_cost_optimization_report.csv", help="Filename for the CSV summary report.")
     parser.add_argument("--ignore-file", default="ignored_resources.txt", help="File containing resource IDs to ignore (one per line).")
     parser.add_argument("--include-ignored-in-report", action="store_true", help="Include ignored resources in a separate section in the HTML report.")
+    parser.add_argument("--no-cache", action="store_true", help=f"Always query Azure instead of reusing cost data cached within the last {config.COST_CACHE_TTL_HOURS}h and metric averages cached within the last {config.METRICS_CACHE_TTL_MINUTES}min.")
     parser.add_argument("--debug", action="store_true", help="Enable debug logging.")
     args = parser.parse_args()
 
@@ -135,21 +138,19 @@ def main():
     ) as progress:
         task_analyze = progress.add_task("[cyan]Analyzing Azure resources...[/]", total=None) # Indeterminate
 
-        # Cost Data (Using analysis module now)
-        costs_by_type, total_cost, currency = analysis.get_cost_data(credential, subscription_id, console=console)
-
-        # --- Identify Potential Optimizations --- 
-        # Pass credential, subscription_id, and console to each function
-        all_findings_raw['unattached_disks'] = analysis.find_unattached_disks(credential, subscription_id, console=console)
-        all_findings_raw['stopped_vms'] = analysis.find_stopped_vms(credential, subscription_id, console=console)
-        all_findings_raw['unused_public_ips'] = analysis.find_unused_public_ips(credential, subscription_id, console=console)
-        all_findings_raw['empty_rgs'] = analysis.find_empty_resource_groups(credential, subscription_id, console=console)
-        all_findings_raw['empty_asps'] = analysis.find_empty_app_service_plans(credential, subscription_id, console=console)
-        all_findings_raw['old_snapshots'] = analysis.find_old_snapshots(credential, subscription_id, age_threshold_days=config.SNAPSHOT_AGE_THRESHOLD_DAYS, console=console)
-        all_findings_raw['low_cpu_vms'] = analysis.find_underutilized_vms(credential, subscription_id, cpu_threshold_percent=config.LOW_CPU_THRESHOLD_PERCENT, lookback_days=config.METRIC_LOOKBACK_DAYS, console=console)
-        all_findings_raw['low_cpu_asps'] = analysis.find_low_usage_app_service_plans(credential, subscription_id, cpu_threshold_percent=config.APP_SERVICE_PLAN_LOW_CPU_THRESHOLD_PERCENT, lookback_days=config.METRIC_LOOKBACK_DAYS, console=console)
-        all_findings_raw['low_dtu_dbs'] = analysis.find_low_dtu_sql_databases(credential, subscription_id, dtu_threshold_percent=config.SQL_DB_LOW_DTU_THRESHOLD_PERCENT, lookback_days=config.METRIC_LOOKBACK_DAYS, console=console)
-        all_findings_raw['low_cpu_vcore_dbs'] = analysis.find_low_cpu_sql_vcore_databases(credential, subscription_id, cpu_threshold_percent=config.SQL_VCORE_LOW_CPU_THRESHOLD_PERCENT, lookback_days=config.METRIC_LOOKBACK_DAYS, console=console)
+        # Cost data and all optimization checks run concurrently (Using analysis module now)
+        def _on_check_done(check_name):
+            progress.update(task_analyze, description=f"[cyan]Analyzing Azure resources... ({check_name} done)[/]")
+
+        try:
+            (costs_by_type, total_cost, currency), all_findings_raw = analysis.run_all_checks(
+                credential, subscription_id, console=console, use_cache=not args.no_cache, on_check_done=_on_check_done
+            )
+        except ClientAuthenticationError as e:
+            # Stop rather than report a subscription with no findings
+            logger.error(f"Azure authentication failed during analysis: {e}", exc_info=True)
+            console.print(f"[bold red]Azure authentication failed during analysis:[/] {e}")
+            sys.exit(1)
         
         # Ensure low_cpu_vcore_dbs is always a list of dictionaries
         if all_findings_raw['low_cpu_vcore_dbs'] is None:
@@ -172,15 +173,13 @@ def main():
         elif not isinstance(all_findings_raw['low_cpu_vcore_dbs'], list):
             logger.error(f"low_cpu_vcore_dbs returned unexpected type {type(all_findings_raw['low_cpu_vcore_dbs'])}: {all_findings_raw['low_cpu_vcore_dbs']}")
             all_findings_raw['low_cpu_vcore_dbs'] = []
-            
-        all_findings_raw['idle_gateways'] = analysis.find_idle_application_gateways(credential, subscription_id, lookback_days=config.METRIC_LOOKBACK_DAYS, idle_connection_threshold=config.IDLE_CONNECTION_THRESHOLD_GATEWAY, console=console)
-        all_findings_raw['low_cpu_apps'] = analysis.find_low_usage_web_apps(credential, subscription_id, cpu_threshold_percent=config.LOW_CPU_THRESHOLD_WEB_APP, lookback_days=config.METRIC_LOOKBACK_DAYS, console=console)
-        all_findings_raw['orphaned_nsgs'] = analysis.find_orphaned_nsgs(credential, subscription_id, console=console)
-        all_findings_raw['orphaned_rts'] = analysis.find_orphaned_route_tables(credential, subscription_id, console=console)
 
         progress.update(task_analyze, completed=1, total=1) # Mark as complete
 
     console.print("\n[bold green]:mag: Analysis complete.[/]")
+    # Rendered here rather than by the cost check, so it doesn't interleave with the other checks' output
+    if costs_by_type:
+        analysis.print_cost_breakdown(console, costs_by_type, total_cost, currency)
 
     # --- Process Findings into DataFrames & Filter Ignored ---
     findings_dfs = {}
@@ -463,7 +462,8 @@ def main():
             findings_dfs=findings_dfs, # Pass the dictionary of filtered DataFrames
             console=console,
             wait_for_completion=args.wait_for_cleanup, 
-            force_cleanup=args.force_cleanup
+            force_cleanup=args.force_cleanup,
+            max_workers=max(1, args.cleanup_workers)
         )
     else:
         console.print("\n⏩ Cleanup actions skipped. Use --cleanup for interactive or --force-cleanup for non-interactive cleanup.")
@@ -0,0 +1,363 @@
+import io
+import re
+import pytest
+from unittest.mock import MagicMock
+import pandas as pd
+
+import azure_cost_advisor.actions as actions
+from azure_cost_advisor.actions import perform_interactive_cleanup
+from rich.console import Console
+
+# --- Helpers ---
+
+def _patch_clients(mocker):
+    """Patches the management client constructors used by the cleanup orchestration."""
+    mock_clients = {
+        'resource': MagicMock(),
+        'compute': MagicMock(),
+        'network': MagicMock(),
+        'web': MagicMock(),
+        'graph': MagicMock(),
+    }
+    # By default Resource Graph reports every queried ID as still existing
+    mock_clients['graph'].resources.side_effect = lambda request: MagicMock(
+        data=[{'id': resource_id} for resource_id in re.findall(r"'([^']*)'", request.query)]
+    )
+    mocker.patch("azure_cost_advisor.actions.ResourceManagementClient", return_value=mock_clients['resource'])
+    mocker.patch("azure_cost_advisor.actions.ComputeManagementClient", return_value=mock_clients['compute'])
+    mocker.patch("azure_cost_advisor.actions.NetworkManagementClient", return_value=mock_clients['network'])
+    mocker.patch("azure_cost_advisor.actions.WebSiteManagementClient", return_value=mock_clients['web'])
+    mocker.patch("azure_cost_advisor.actions.ResourceGraphClient", return_value=mock_clients['graph'])
+    return mock_clients
+
+def _patch_tty(mocker, is_tty=True):
+    """Patches stdin so the cleanup prompts believe an interactive terminal is (or is not) attached."""
+    mock_stdin = mocker.patch("azure_cost_advisor.actions.sys.stdin")
+    mock_stdin.isatty.return_value = is_tty
+    return mock_stdin
+
+def _disk_df(count):
+    return pd.DataFrame([
+        {
+            'Name': f"disk-{i}",
+            'ID': f"/subscriptions/sub-1/resourceGroups/rg-{i}/providers/Microsoft.Compute/disks/disk-{i}",
+        }
+        for i in range(count)
+    ])
+
+# --- Test Cases ---
+
+def test_force_cleanup_deletes_every_row(mocker):
+    """Tests that --force-cleanup issues one delete per finding when running concurrently."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_clients = _patch_clients(mocker)
+    findings_dfs = {'unattached_disks': _disk_df(5)}
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", findings_dfs, console=mock_console, force_cleanup=True)
+
+    # Assert
+    assert mock_clients['compute'].disks.begin_delete.call_count == 5
+    mock_clients['compute'].disks.begin_delete.assert_any_call("rg-3", "disk-3", polling_interval=actions.LRO_POLLING_INTERVAL_SECONDS)
+    mock_console.print.assert_any_call("  Actions Succeeded/Initiated: 5")
+    mock_console.input.assert_not_called()
+
+def test_wait_for_poller_polls_until_done():
+    """Tests that waiting polls on a short cadence instead of one blocking result() call."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_poller = MagicMock()
+    mock_poller.done.side_effect = [False, False, True]
+    mock_poller.status.return_value = "InProgress"
+
+    # Act
+    actions._wait_for_poller(mock_poller, "ACTION - TEST", mock_console)
+
+    # Assert
+    assert mock_poller.wait.call_count == 2
+    mock_poller.wait.assert_called_with(timeout=actions.LRO_POLLING_INTERVAL_SECONDS)
+    mock_poller.result.assert_called_once()
+
+def test_delete_resource_group_uses_name_only(mocker):
+    """Tests that resource group deletes are dispatched without a separate RG argument."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_clients = {'resource': MagicMock()}
+
+    # Act
+    success = actions.delete_resource(
+        MagicMock(), "sub-1", "/subscriptions/sub-1/resourceGroups/empty-rg", "Empty Resource Group", "empty-rg",
+        mock_clients, console=mock_console, force_cleanup=True
+    )
+
+    # Assert
+    assert success is True
+    mock_clients['resource'].resource_groups.begin_delete.assert_called_once_with("empty-rg", polling_interval=actions.LRO_POLLING_INTERVAL_SECONDS)
+
+def test_interactive_cleanup_yes_to_all_prompts_once(mocker):
+    """Tests that answering 'a' approves every remaining resource of that type without re-prompting."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_console.input.return_value = "a"
+    mock_clients = _patch_clients(mocker)
+    _patch_tty(mocker)
+    findings_dfs = {'unattached_disks': _disk_df(4)}
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", findings_dfs, console=mock_console)
+
+    # Assert
+    mock_console.input.assert_called_once()
+    assert mock_clients['compute'].disks.begin_delete.call_count == 4
+
+def test_interactive_cleanup_skip_type_stops_prompting(mocker):
+    """Tests that answering 's' skips every remaining resource of that type."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_console.input.side_effect = ["y", "s"]
+    mock_clients = _patch_clients(mocker)
+    _patch_tty(mocker)
+    findings_dfs = {'unattached_disks': _disk_df(4)}
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", findings_dfs, console=mock_console)
+
+    # Assert
+    assert mock_console.input.call_count == 2
+    mock_clients['compute'].disks.begin_delete.assert_called_once()
+    mock_console.print.assert_any_call("  Skipping remaining Unattached Disks.")
+
+def test_interactive_cleanup_without_tty_does_not_prompt(mocker):
+    """Tests that interactive cleanup skips everything instead of blocking when stdin is not a TTY."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_clients = _patch_clients(mocker)
+    _patch_tty(mocker, is_tty=False)
+    findings_dfs = {'unattached_disks': _disk_df(2)}
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", findings_dfs, console=mock_console)
+
+    # Assert
+    mock_console.input.assert_not_called()
+    mock_clients['compute'].disks.begin_delete.assert_not_called()
+
+def test_wait_for_cleanup_waits_after_all_deletes_start(mocker):
+    """Tests that --wait-for-cleanup starts every delete first and then waits on the batch."""
+    # Arrange
+    # A real console is needed here since the batch wait renders a Rich progress display
+    console = Console(file=io.StringIO())
+    print_spy = mocker.spy(console, "print")
+    mock_clients = _patch_clients(mocker)
+    call_order = []
+
+    def make_poller(fail=False):
+        def result():
+            call_order.append("wait")
+            if fail:
+                raise Exception("Simulated LRO failure")
+        poller = MagicMock()
+        poller.result.side_effect = result
+        return poller
+
+    pollers = iter([make_poller(), make_poller(fail=True), make_poller()])
+
+    def begin_delete(*args, **kwargs):
+        call_order.append("start")
+        return next(pollers)
+
+    mock_clients['compute'].disks.begin_delete.side_effect = begin_delete
+    findings_dfs = {'unattached_disks': _disk_df(3)}
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", findings_dfs, console=console, wait_for_completion=True, force_cleanup=True)
+
+    # Assert
+    assert call_order == ["start"] * 3 + ["wait"] * 3
+    print_spy.assert_any_call("  Actions Succeeded/Initiated: 2")
+    print_spy.assert_any_call("  Actions Failed: 1")
+
+def test_cleanup_skips_duplicate_ids_across_findings(mocker):
+    """Tests that a resource listed under two findings is only deleted once."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_clients = _patch_clients(mocker)
+    disks_df = _disk_df(2)
+    findings_dfs = {
+        'unattached_disks': disks_df,
+        'old_snapshots': disks_df.assign(ID=disks_df['ID'].str.upper()).iloc[[0]],
+    }
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", findings_dfs, console=mock_console, force_cleanup=True)
+
+    # Assert
+    assert mock_clients['compute'].disks.begin_delete.call_count == 2
+    mock_clients['compute'].snapshots.begin_delete.assert_not_called()
+
+def test_force_cleanup_without_terminal_only_logs_per_resource_status(mocker):
+    """Tests that non-TTY force cleanup keeps per-resource status out of the console but still prints the summary."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_clients = _patch_clients(mocker)
+    mocker.patch("azure_cost_advisor.actions.sys.stdout").isatty.return_value = False
+    findings_dfs = {'unattached_disks': _disk_df(3)}
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", findings_dfs, console=mock_console, force_cleanup=True)
+
+    # Assert
+    assert mock_clients['compute'].disks.begin_delete.call_count == 3
+    printed = [str(call.args[0]) for call in mock_console.print.call_args_list if call.args]
+    assert not any("disk-" in line for line in printed)
+    mock_console.print.assert_any_call("  Actions Succeeded/Initiated: 3")
+
+def test_force_cleanup_deallocates_stopped_vms_concurrently(mocker):
+    """Tests that stopped VMs go through the shared cleanup path and are deallocated by RG and name."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_clients = _patch_clients(mocker)
+    run_concurrently = mocker.spy(actions, "_run_rows_concurrently")
+    findings_dfs = {'stopped_vms': pd.DataFrame([
+        {'Name': 'vm-1', 'Resource Group': 'rg-a'},
+        {'Name': 'vm-2', 'Resource Group': 'rg-b'},
+    ])}
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", findings_dfs, console=mock_console, force_cleanup=True)
+
+    # Assert
+    run_concurrently.assert_called_once()
+    deallocate = mock_clients['compute'].virtual_machines.begin_deallocate
+    assert deallocate.call_count == 2
+    deallocate.assert_any_call("rg-b", "vm-2", polling_interval=actions.LRO_POLLING_INTERVAL_SECONDS)
+    mock_clients['compute'].virtual_machines.begin_delete.assert_not_called()
+    mock_console.print.assert_any_call("  Actions Succeeded/Initiated: 2")
+
+def test_cleanup_drops_rows_missing_id_or_name_up_front(mocker):
+    """Tests that rows without an ID or Name are filtered out once, with a single warning."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_clients = _patch_clients(mocker)
+    disks_df = _disk_df(4)
+    disks_df.loc[1, 'ID'] = None
+    disks_df.loc[2, 'Name'] = ''
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", {'unattached_disks': disks_df}, console=mock_console, force_cleanup=True)
+
+    # Assert
+    assert mock_clients['compute'].disks.begin_delete.call_count == 2
+    mock_console.print.assert_any_call("  [yellow]Warning:[/yellow] Skipping 2 item(s) due to missing ID/Name.")
+    mock_console.print.assert_any_call("  Actions Attempted: 2")
+
+def test_cleanup_skips_resources_already_gone(mocker):
+    """Tests that resources Resource Graph no longer reports are skipped without a delete call."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_clients = _patch_clients(mocker)
+    disks_df = _disk_df(3)
+    mock_clients['graph'].resources.side_effect = None
+    mock_clients['graph'].resources.return_value = MagicMock(data=[{'id': disks_df.loc[1, 'ID'].upper()}])
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", {'unattached_disks': disks_df}, console=mock_console, force_cleanup=True)
+
+    # Assert
+    mock_clients['graph'].resources.assert_called_once()
+    mock_clients['compute'].disks.begin_delete.assert_called_once_with("rg-1", "disk-1", polling_interval=actions.LRO_POLLING_INTERVAL_SECONDS)
+    mock_console.print.assert_any_call("  Skipping 2 Unattached Disk(s) that no longer exist.")
+
+def test_find_existing_ids_batches_queries():
+    """Tests that the existence check splits large ID lists into batches and fails open."""
+    # Arrange
+    mock_graph = MagicMock()
+    mock_graph.resources.return_value = MagicMock(data=[{'id': '/A'}])
+    failing_graph = MagicMock()
+    failing_graph.resources.side_effect = Exception("Throttled")
+
+    # Act
+    existing = actions._find_existing_ids(mock_graph, "sub-1", ['/a', '/b', '/c'], batch_size=2)
+    unknown = actions._find_existing_ids(failing_graph, "sub-1", ['/a'])
+
+    # Assert
+    assert mock_graph.resources.call_count == 2
+    assert "where id in~ ('/a', '/b')" in mock_graph.resources.call_args_list[0].args[0].query
+    assert existing == {'/a'}
+    assert unknown is None
+
+def test_unattended_force_cleanup_uses_fast_delete(mocker):
+    """Tests that non-TTY force cleanup without waiting submits the lean delete path directly."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_clients = _patch_clients(mocker)
+    mocker.patch("azure_cost_advisor.actions.sys.stdout").isatty.return_value = False
+    cleanup_row = mocker.spy(actions, "_cleanup_row")
+    fast_delete = mocker.spy(actions, "_fast_delete")
+    mock_clients['compute'].disks.begin_delete.side_effect = [MagicMock(), actions.ResourceNotFoundError("gone"), MagicMock()]
+    mock_info = mocker.patch.object(actions.logger, "info")
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", {'unattached_disks': _disk_df(3)}, console=mock_console, force_cleanup=True)
+
+    # Assert
+    assert fast_delete.call_count == 3
+    cleanup_row.assert_not_called()
+    mock_info.assert_any_call(
+        "ACTION - DELETE - %s - %s (%s): Deletion initiated (--force-cleanup).",
+        "Unattached Disk", "disk-0", "/subscriptions/sub-1/resourceGroups/rg-0/providers/Microsoft.Compute/disks/disk-0"
+    )
+    mock_console.print.assert_any_call("  Actions Attempted: 3")
+    mock_console.print.assert_any_call("  Actions Succeeded/Initiated: 2")
+
+def test_cleanup_keeps_stopped_vms_without_ids(mocker):
+    """Tests that stopped VMs with no ID are not treated as duplicates of each other."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_clients = _patch_clients(mocker)
+    findings_dfs = {'stopped_vms': pd.DataFrame([
+        {'Name': 'vm-1', 'Resource Group': 'rg-a', 'ID': None},
+        {'Name': 'vm-2', 'Resource Group': 'rg-b', 'ID': None},
+    ])}
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", findings_dfs, console=mock_console, force_cleanup=True)
+
+    # Assert
+    assert mock_clients['compute'].virtual_machines.begin_deallocate.call_count == 2
+    mock_console.print.assert_any_call("  Actions Succeeded/Initiated: 2")
+
+def test_existence_check_keeps_stopped_vms_without_ids(mocker):
+    """Tests that the ARG existence check, run for other findings, doesn't skip stopped VMs with no ID."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_clients = _patch_clients(mocker)
+    findings_dfs = {
+        'unattached_disks': _disk_df(1),
+        'stopped_vms': pd.DataFrame([{'Name': 'vm-1', 'Resource Group': 'rg-a', 'ID': None}]),
+    }
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", findings_dfs, console=mock_console, force_cleanup=True)
+
+    # Assert
+    mock_clients['graph'].resources.assert_called_once()
+    mock_clients['compute'].virtual_machines.begin_deallocate.assert_called_once_with("rg-a", "vm-1", polling_interval=actions.LRO_POLLING_INTERVAL_SECONDS)
+
+def test_unattended_force_cleanup_skips_ids_without_resource_group(mocker):
+    """Tests that the fast delete path reports a malformed ID instead of deleting with no resource group."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_clients = _patch_clients(mocker)
+    mocker.patch("azure_cost_advisor.actions.sys.stdout").isatty.return_value = False
+    disks_df = _disk_df(2)
+    disks_df.loc[0, 'ID'] = "/subscriptions/sub-1"
+
+    # Act
+    perform_interactive_cleanup(MagicMock(), "sub-1", {'unattached_disks': disks_df}, console=mock_console, force_cleanup=True)
+
+    # Assert
+    mock_clients['compute'].disks.begin_delete.assert_called_once_with("rg-1", "disk-1", polling_interval=actions.LRO_POLLING_INTERVAL_SECONDS)
+    mock_console.print.assert_any_call("  Actions Attempted: 2")
+    mock_console.print.assert_any_call("  Actions Succeeded/Initiated: 1")
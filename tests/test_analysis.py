@@ -1,13 +1,17 @@
 import pytest
-from unittest.mock import MagicMock, PropertyMock
+from unittest.mock import ANY, MagicMock, PropertyMock
 import logging
+import threading
+from datetime import datetime, timedelta, timezone
 
 # Assuming the analysis functions are in azure_cost_advisor.analysis
 # Adjust the import path if your structure is different
 import azure_cost_advisor.analysis as analysis # Import the module itself
+from azure_cost_advisor import cache
 # Import all functions being tested at the top level
 from azure_cost_advisor.analysis import find_unattached_disks, find_stopped_vms, find_unused_public_ips, find_empty_resource_groups 
 # We also need Console for type hinting, but can mock its methods
+from azure.mgmt.monitor.models import TimeSeriesElement
 from rich.console import Console
 
 # --- Test Data Structures (Simulating Azure SDK Objects) ---
@@ -31,27 +35,6 @@ class MockDisk:
         self.managed_by = managed_by
         self.disk_state = disk_state
 
-# Mock VM Status object
-class MockVMStatus:
-    def __init__(self, code="PowerState/running"):
-        self.code = code
-
-# Mock VM Instance View object
-class MockVMInstanceView:
-    def __init__(self, statuses=None):
-        # Default to a running status if none provided
-        self.statuses = statuses if statuses is not None else [MockVMStatus("PowerState/running")]
-
-# Mock Virtual Machine object
-class MockVM:
-    def __init__(self, name, id, location):
-        self.name = name
-        self.id = id
-        self.location = location
-        # Instance view will often be fetched separately, 
-        # but can be pre-associated for simpler mocks if needed
-        # self.instance_view = MockVMInstanceView() 
-
 # Mock for IP Configuration (placeholder, presence indicates attachment)
 class MockIPConfiguration:
     def __init__(self, id="some_nic_ip_config_id"):
@@ -76,10 +59,31 @@ class MockPublicIPAddress:
 
 # Mock for Resource Graph Query Response
 class MockArgQueryResponse:
-    def __init__(self, data=None, total_records=0):
+    def __init__(self, data=None, total_records=0, skip_token=None):
         # data should be a list of dictionaries, matching the 'project' clause of the KQL
         self.data = data if data is not None else []
         self.total_records = total_records
+        self.skip_token = skip_token
+
+def _mock_arg_checks(mocker, rows):
+    """Patches ARG so each prefetch query returns the rows tagged with the checks it asks for."""
+    mock_arg_client_instance = MagicMock()
+    mock_arg_client_instance.resources.side_effect = lambda request: MockArgQueryResponse(
+        data=[row for row in rows if f"check = '{row['check']}'" in request.query]
+    )
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
+    return mock_arg_client_instance
+
+@pytest.fixture(autouse=True)
+def _isolated_metrics_cache(mocker, tmp_path):
+    """Keeps metric averages cached by one test from being served to the next."""
+    mocker.patch("azure_cost_advisor.analysis.METRICS_CACHE_FILENAME", str(tmp_path / "metrics_cache.json"))
+
+@pytest.fixture(autouse=True)
+def _fresh_rate_limits(mocker):
+    """Gives each test full request budgets, so earlier tests' ARG and metrics calls don't pace later ones."""
+    mocker.patch.object(analysis, "_arg_rate_limit", analysis._TokenBucket(analysis.ARG_QUERY_BURST, analysis.ARG_QUERIES_PER_SECOND))
+    mocker.patch.object(analysis, "_metrics_rate_limit", analysis._TokenBucket(analysis.ARM_READ_BURST, analysis.ARM_READS_PER_SECOND))
 
 # --- Test Cases ---
 
@@ -117,7 +121,7 @@ def test_find_unattached_disks_positive_case(mocker):
 
     # Assert
     # Verify ResourceGraphClient was called correctly
-    analysis.ResourceGraphClient.assert_called_once_with(mock_credential)
+    analysis.ResourceGraphClient.assert_called_once_with(mock_credential, transport=ANY, retry_policy=ANY)
     # Verify the .resources() method was called (can also check query content if needed)
     mock_arg_client_instance.resources.assert_called_once()
     # Check args of .resources() call - QueryRequest object
@@ -200,187 +204,350 @@ def test_find_unattached_disks_api_error(mocker):
 # --- Tests for find_stopped_vms ---
 
 def test_find_stopped_vms_positive_case(mocker):
-    """Tests finding a VM that is stopped but not deallocated."""
+    """Tests finding a VM that is stopped but not deallocated, with its disks looked up in one ARG query."""
     # Arrange
     mock_credential = MagicMock()
     mock_subscription_id = "sub-456"
     mock_console = MagicMock(spec=Console)
 
-    vm1_stopped = MockVM(
-        name="stopped-vm-1", 
-        id="/subscriptions/sub-456/resourceGroups/rg-A/providers/Microsoft.Compute/virtualMachines/stopped-vm-1", 
-        location="eastus"
-    )
-    vm2_running = MockVM(
-        name="running-vm-1", 
-        id="/subscriptions/sub-456/resourceGroups/rg-A/providers/Microsoft.Compute/virtualMachines/running-vm-1", 
-        location="eastus"
-    )
-    vm3_deallocated = MockVM(
-        name="dealloc-vm-1", 
-        id="/subscriptions/sub-456/resourceGroups/rg-B/providers/Microsoft.Compute/virtualMachines/dealloc-vm-1", 
-        location="westus"
-    )
-
-    # Mock the list_all call
-    mock_compute_client_instance = MagicMock()
-    mock_compute_client_instance.virtual_machines.list_all.return_value = [
-        vm1_stopped, vm2_running, vm3_deallocated
+    vm_id = "/subscriptions/sub-456/resourceGroups/rg-A/providers/Microsoft.Compute/virtualMachines/stopped-vm-1"
+    os_disk_id = "/subscriptions/sub-456/resourceGroups/rg-A/providers/Microsoft.Compute/disks/stopped-vm-1-os"
+    data_disk_id = "/subscriptions/sub-456/resourceGroups/rg-A/providers/Microsoft.Compute/disks/stopped-vm-1-data"
+    # Running and deallocated VMs are filtered out by the KQL query itself
+    mock_vm_data = [{
+        "name": "stopped-vm-1", "id": vm_id, "resourceGroup": "rg-A", "location": "eastus",
+        "osDiskId": os_disk_id, "dataDisks": [{"lun": 0, "managedDisk": {"id": data_disk_id}}, {"lun": 1, "vhd": {"uri": "unmanaged"}}],
+    }]
+    mock_disk_data = [
+        {"id": data_disk_id.upper(), "name": "stopped-vm-1-data", "location": "eastus", "sizeGb": 256, "skuName": "Standard_LRS"},
+        {"id": os_disk_id, "name": "stopped-vm-1-os", "location": "eastus", "sizeGb": 128, "skuName": "Premium_LRS"},
     ]
-
-    # Mock the instance_view call - return different views based on vm name
-    def mock_instance_view(resource_group_name, vm_name):
-        if vm_name == "stopped-vm-1":
-            return MockVMInstanceView(statuses=[MockVMStatus("provisioningState/succeeded"), MockVMStatus("PowerState/stopped")])
-        elif vm_name == "running-vm-1":
-            return MockVMInstanceView(statuses=[MockVMStatus("PowerState/running")])
-        elif vm_name == "dealloc-vm-1":
-            return MockVMInstanceView(statuses=[MockVMStatus("PowerState/deallocated")])
-        else:
-            raise Exception(f"Unexpected vm_name in mock_instance_view: {vm_name}")
-
-    mock_compute_client_instance.virtual_machines.instance_view.side_effect = mock_instance_view
-    
-    # Patch the client constructor
-    mocker.patch("azure_cost_advisor.analysis.ComputeManagementClient", return_value=mock_compute_client_instance)
-
-    # Get the logger instance that the function will use
-    # Important: Mock the specific logger methods *before* the function call
-    logger_instance = logging.getLogger() # Get the root logger or specific if named
-    mocker.patch.object(logger_instance, 'warning') # Patch the 'warning' method
+    mock_arg_client_instance = MagicMock()
+    mock_arg_client_instance.resources.side_effect = [
+        MockArgQueryResponse(data=mock_vm_data, total_records=1),
+        MockArgQueryResponse(data=mock_disk_data, total_records=2),
+    ]
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
+    mock_compute_client = mocker.patch("azure_cost_advisor.analysis.ComputeManagementClient")
 
     # Act
     findings = find_stopped_vms(mock_credential, mock_subscription_id, mock_console)
 
     # Assert
-    analysis.ComputeManagementClient.assert_called_once_with(mock_credential, mock_subscription_id)
-    mock_compute_client_instance.virtual_machines.list_all.assert_called_once()
-    # Check instance_view was called for each VM
-    assert mock_compute_client_instance.virtual_machines.instance_view.call_count == 3
-    mock_compute_client_instance.virtual_machines.instance_view.assert_any_call(resource_group_name="rg-A", vm_name="stopped-vm-1")
-    mock_compute_client_instance.virtual_machines.instance_view.assert_any_call(resource_group_name="rg-A", vm_name="running-vm-1")
-    mock_compute_client_instance.virtual_machines.instance_view.assert_any_call(resource_group_name="rg-B", vm_name="dealloc-vm-1")
+    mock_compute_client.assert_not_called()
+    assert mock_arg_client_instance.resources.call_count == 2
+    disk_query = mock_arg_client_instance.resources.call_args.args[0].query
+    assert os_disk_id in disk_query and data_disk_id in disk_query
 
     # Verify console output
     mock_console.print.assert_any_call("\n🛑 Checking for stopped (not deallocated) VMs...")
     mock_console.print.assert_any_call("  :warning: Found 1 stopped VM(s) that are incurring compute costs.")
-    
+
     # Verify findings
     assert len(findings) == 1
     found_vm = findings[0]
     assert found_vm['name'] == "stopped-vm-1"
-    assert found_vm['id'] == vm1_stopped.id
+    assert found_vm['id'] == vm_id
     assert found_vm['resource_group'] == "rg-A"
     assert found_vm['location'] == "eastus"
+    assert found_vm['disks'] == [
+        {'name': "stopped-vm-1-os", 'size_gb': 128, 'sku': "Premium_LRS", 'location': "eastus", 'id': os_disk_id},
+        {'name': "stopped-vm-1-data", 'size_gb': 256, 'sku': "Standard_LRS", 'location': "eastus", 'id': data_disk_id.upper()},
+    ]
 
 def test_find_stopped_vms_negative_case(mocker):
-    """Tests finding no stopped VMs when all are running or deallocated."""
+    """Tests finding no stopped VMs when ARG returns none (no disk lookup is made)."""
     # Arrange
-    mock_credential = MagicMock()
-    mock_subscription_id = "sub-456"
     mock_console = MagicMock(spec=Console)
-
-    vm1_running = MockVM("running-vm-2", "/subs/sub-456/rgs/rg-C/prov/Microsoft.Compute/vms/running-vm-2", "westus")
-    vm2_deallocated = MockVM("dealloc-vm-2", "/subs/sub-456/rgs/rg-C/prov/Microsoft.Compute/vms/dealloc-vm-2", "westus")
-
-    mock_compute_client_instance = MagicMock()
-    mock_compute_client_instance.virtual_machines.list_all.return_value = [vm1_running, vm2_deallocated]
-
-    def mock_instance_view(resource_group_name, vm_name):
-        if vm_name == "running-vm-2":
-            return MockVMInstanceView(statuses=[MockVMStatus("PowerState/running")])
-        elif vm_name == "dealloc-vm-2":
-             return MockVMInstanceView(statuses=[MockVMStatus("PowerState/deallocated")])
-        else:
-             raise Exception(f"Unexpected vm_name: {vm_name}")
-             
-    mock_compute_client_instance.virtual_machines.instance_view.side_effect = mock_instance_view
-    mocker.patch("azure_cost_advisor.analysis.ComputeManagementClient", return_value=mock_compute_client_instance)
+    mock_arg_client_instance = MagicMock()
+    mock_arg_client_instance.resources.return_value = MockArgQueryResponse(data=[], total_records=0)
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
 
     # Act
-    findings = find_stopped_vms(mock_credential, mock_subscription_id, mock_console)
+    findings = find_stopped_vms(MagicMock(), "sub-456", mock_console)
 
     # Assert
-    mock_compute_client_instance.virtual_machines.list_all.assert_called_once()
-    assert mock_compute_client_instance.virtual_machines.instance_view.call_count == 2
+    mock_arg_client_instance.resources.assert_called_once()
     mock_console.print.assert_any_call("\n🛑 Checking for stopped (not deallocated) VMs...")
     mock_console.print.assert_any_call("  :heavy_check_mark: No stopped (but not deallocated) VMs found.")
     assert len(findings) == 0
 
-def test_find_stopped_vms_instance_view_error(mocker):
-    """Tests that the function continues if instance_view fails for one VM."""
+def test_find_stopped_vms_disk_lookup_error(mocker):
+    """Tests that stopped VMs are still reported if the disk detail lookup fails."""
     # Arrange
-    mock_credential = MagicMock()
-    mock_subscription_id = "sub-456"
     mock_console = MagicMock(spec=Console)
+    os_disk_id = "/subs/sub-456/rgs/rg-D/prov/Microsoft.Compute/disks/stopped-vm-ok-os"
+    mock_vm_data = [{"name": "stopped-vm-ok", "id": "/subs/sub-456/rgs/rg-D/prov/Microsoft.Compute/vms/stopped-vm-ok",
+                     "resourceGroup": "rg-D", "location": "eastus", "osDiskId": os_disk_id, "dataDisks": None}]
+    mock_arg_client_instance = MagicMock()
+    mock_arg_client_instance.resources.side_effect = [
+        MockArgQueryResponse(data=mock_vm_data, total_records=1),
+        Exception("Simulated disk lookup error"),
+    ]
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
+    logger_instance = logging.getLogger()
+    mocker.patch.object(logger_instance, 'warning')
 
-    vm1_stopped = MockVM("stopped-vm-ok", "/subs/sub-456/rgs/rg-D/prov/Microsoft.Compute/vms/stopped-vm-ok", "eastus")
-    vm2_error = MockVM("error-vm", "/subs/sub-456/rgs/rg-D/prov/Microsoft.Compute/vms/error-vm", "eastus")
-
-    mock_compute_client_instance = MagicMock()
-    mock_compute_client_instance.virtual_machines.list_all.return_value = [vm1_stopped, vm2_error]
+    # Act
+    findings = find_stopped_vms(MagicMock(), "sub-456", mock_console)
 
-    def mock_instance_view(resource_group_name, vm_name):
-        if vm_name == "stopped-vm-ok":
-            return MockVMInstanceView(statuses=[MockVMStatus("PowerState/stopped")])
-        elif vm_name == "error-vm":
-            raise Exception("Simulated instance view error")
-        else:
-            raise Exception(f"Unexpected vm_name: {vm_name}")
-             
-    mock_compute_client_instance.virtual_machines.instance_view.side_effect = mock_instance_view
+    # Assert
+    logger_instance.warning.assert_any_call("Could not look up disk details in ARG: Simulated disk lookup error", exc_info=True)
+    assert len(findings) == 1
+    assert findings[0]['disks'] == [{'name': "stopped-vm-ok-os", 'error': 'Could not fetch full details'}]
+    mock_console.print.assert_any_call("  :warning: Found 1 stopped VM(s) that are incurring compute costs.")
 
-    # Patch the client constructor
-    mocker.patch("azure_cost_advisor.analysis.ComputeManagementClient", return_value=mock_compute_client_instance)
+def test_find_stopped_vms_api_error(mocker):
+    """Tests behavior when the ARG query for stopped VMs raises an exception."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_arg_client_instance = MagicMock()
+    mock_arg_client_instance.resources.side_effect = Exception("Simulated ARG API error")
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
 
-    # Get the logger instance and patch its 'warning' method
+    # Get the logger instance and patch its 'error' method
     logger_instance = logging.getLogger()
-    mocker.patch.object(logger_instance, 'warning')
+    mocker.patch.object(logger_instance, 'error')
 
     # Act
-    findings = find_stopped_vms(mock_credential, mock_subscription_id, mock_console)
+    findings = find_stopped_vms(MagicMock(), "sub-456", mock_console)
 
     # Assert
-    assert mock_compute_client_instance.virtual_machines.instance_view.call_count == 2
-    # Check warning was logged and printed
-    logger_instance.warning.assert_called_once_with(
-        "Could not get instance view for VM error-vm in RG rg-D. Error: Simulated instance view error", 
+    mock_arg_client_instance.resources.assert_called_once()
+    logger_instance.error.assert_called_once_with(
+        "Error checking for stopped VMs: Simulated ARG API error", 
         exc_info=True
     )
-    mock_console.print.assert_any_call("  [yellow]Warning:[/][dim] Could not get instance view for VM error-vm. Skipping status check.[/]")
-    # Check that the valid stopped VM was still found
-    assert len(findings) == 1
-    assert findings[0]['name'] == "stopped-vm-ok"
-    mock_console.print.assert_any_call("  :warning: Found 1 stopped VM(s) that are incurring compute costs.")
+    mock_console.print.assert_any_call("[bold red]Error checking for stopped VMs:[/] Simulated ARG API error")
+    assert len(findings) == 0
 
-def test_find_stopped_vms_list_all_error(mocker):
-    """Tests behavior when the list_all API call raises an exception."""
+# --- Tests for find_underutilized_vms ---
+
+def _mock_running_vms(mocker):
+    """Patches an ARG client returning two running VMs (idle-vm, busy-vm); stopped VMs are filtered out by the query."""
+    vms = [
+        {"name": name, "id": f"/subscriptions/sub-456/resourceGroups/rg-E/providers/Microsoft.Compute/virtualMachines/{name}",
+         "resourceGroup": "rg-E", "location": "eastus", "vmSize": "Standard_B2s", "osType": "Linux"}
+        for name in ("idle-vm", "busy-vm")
+    ]
+    mock_arg_client_instance = MagicMock()
+    mock_arg_client_instance.resources.return_value = MockArgQueryResponse(data=vms, total_records=len(vms))
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
+    return vms
+
+def test_find_underutilized_vms_uses_metrics_batch_api(mocker):
+    """Tests that running VMs' CPU comes from one regional metrics:getBatch call instead of per-VM queries."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    vm_idle, vm_busy = _mock_running_vms(mocker)
+    mock_monitor_client_instance = MagicMock()
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient", return_value=mock_monitor_client_instance)
+
+    batch_response = MagicMock()
+    batch_response.json.return_value = {"values": [
+        {"resourceid": vm["id"], "value": [{"timeseries": [{"data": [{"average": value} for value in values] + [{"timeStamp": "no-average"}]}]}]}
+        for vm, values in ((vm_idle, [1.0, 3.0]), (vm_busy, [40.0, 60.0]))
+    ]}
+    mock_post = mocker.patch("azure_cost_advisor.analysis.requests.post", return_value=batch_response)
+
+    # Act
+    findings = analysis.find_underutilized_vms(MagicMock(), "sub-456", cpu_threshold_percent=5, lookback_days=7, console=mock_console)
+
+    # Assert
+    mock_post.assert_called_once()
+    assert mock_post.call_args.args[0] == "https://eastus.metrics.monitor.azure.com/subscriptions/sub-456/metrics:getBatch"
+    assert mock_post.call_args.kwargs["json"] == {"resourceids": [vm_idle["id"], vm_busy["id"]]}
+    assert mock_post.call_args.kwargs["params"]["metricnamespace"] == "microsoft.compute/virtualmachines"
+    mock_monitor_client_instance.metrics.list.assert_not_called()
+    assert [vm['name'] for vm in findings] == ["idle-vm"]
+    assert findings[0]['avg_cpu_percent'] == 2.0
+
+def test_find_underutilized_vms_reuses_cached_metric_averages(mocker):
+    """Tests that a repeat run within the TTL reads averages from disk instead of the batch API."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    vm_idle, vm_busy = _mock_running_vms(mocker)
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient", return_value=MagicMock())
+    batch_response = MagicMock()
+    batch_response.json.return_value = {"values": [
+        {"resourceid": vm["id"], "value": [{"timeseries": [{"data": [{"average": value}]}]}]}
+        for vm, value in ((vm_idle, 2.0), (vm_busy, 50.0))
+    ]}
+    mock_post = mocker.patch("azure_cost_advisor.analysis.requests.post", return_value=batch_response)
+
+    # Act
+    first = analysis.find_underutilized_vms(MagicMock(), "sub-456", cpu_threshold_percent=5, lookback_days=7, console=mock_console)
+    second = analysis.find_underutilized_vms(MagicMock(), "sub-456", cpu_threshold_percent=5, lookback_days=7, console=mock_console)
+    refreshed = analysis.find_underutilized_vms(MagicMock(), "sub-456", cpu_threshold_percent=5, lookback_days=7, console=mock_console, use_cache=False)
+
+    # Assert
+    assert mock_post.call_count == 2
+    assert [vm['avg_cpu_percent'] for vm in first] == [vm['avg_cpu_percent'] for vm in second] == [vm['avg_cpu_percent'] for vm in refreshed] == [2.0]
+
+def test_batch_metric_cache_expires_each_average_on_its_own(mocker):
+    """Tests that re-storing the cache entry with new averages does not keep older ones alive past the TTL."""
+    # Arrange
+    stale_at = (datetime.now(timezone.utc) - timedelta(minutes=analysis.METRICS_CACHE_TTL_MINUTES + 1)).isoformat()
+    fresh_at = datetime.now(timezone.utc).isoformat()
+    cache_key = cache.make_key("sub-1", "microsoft.compute/virtualmachines", "Percentage CPU", 7, "P1D")
+    cache.put(cache_key, {"/vm/stale": [stale_at, 1.0], "/vm/fresh": [fresh_at, 2.0]}, filename=analysis.METRICS_CACHE_FILENAME)
+    mocker.patch("azure_cost_advisor.analysis._get_token", return_value="token")
+    mock_query = mocker.patch("azure_cost_advisor.analysis._query_metrics_batch", return_value={"/vm/stale": [9.0]})
+
+    # Act
+    averages = analysis._get_batch_metric_averages(
+        MagicMock(), "sub-1", [("/vm/stale", "eastus"), ("/vm/fresh", "eastus")],
+        "microsoft.compute/virtualmachines", "Percentage CPU", 7
+    )
+
+    # Assert
+    assert mock_query.call_args.args[5] == ["/vm/stale"]
+    assert averages == {"/vm/fresh": 2.0, "/vm/stale": 9.0}
+    stored, _ = cache.get(cache_key, timedelta(days=1), filename=analysis.METRICS_CACHE_FILENAME)
+    assert stored["/vm/fresh"][0] == fresh_at
+
+def test_find_underutilized_vms_checks_metrics_for_running_vms_only(mocker):
+    """Tests that only the running VMs from ARG get a metrics query when falling back to per-VM queries."""
     # Arrange
     mock_credential = MagicMock()
     mock_subscription_id = "sub-456"
     mock_console = MagicMock(spec=Console)
+    vm_idle, vm_busy = _mock_running_vms(mocker)
+    mocker.patch("azure_cost_advisor.analysis.requests.post", side_effect=Exception("Batch API unavailable"))
 
-    mock_compute_client_instance = MagicMock()
-    mock_compute_client_instance.virtual_machines.list_all.side_effect = Exception("Simulated list_all error")
-    
-    # Patch the client constructor
-    mocker.patch("azure_cost_advisor.analysis.ComputeManagementClient", return_value=mock_compute_client_instance)
+    cpu_by_vm = {vm_idle["id"]: [1.0, 3.0], vm_busy["id"]: [40.0, 60.0]}
+    def mock_metrics_list(resource_uri, **kwargs):
+        series = MagicMock(data=[MagicMock(average=value) for value in cpu_by_vm[resource_uri]])
+        return MagicMock(value=[MagicMock(timeseries=[series])])
 
-    # Get the logger instance and patch its 'error' method
+    mock_monitor_client_instance = MagicMock()
+    mock_monitor_client_instance.metrics.list.side_effect = mock_metrics_list
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient", return_value=mock_monitor_client_instance)
+
+    # Act
+    findings = analysis.find_underutilized_vms(mock_credential, mock_subscription_id, cpu_threshold_percent=5, lookback_days=7, console=mock_console)
+
+    # Assert
+    assert "PowerState/running" in analysis.ResourceGraphClient.return_value.resources.call_args.args[0].query
+    assert mock_monitor_client_instance.metrics.list.call_count == 2
+    # Every query shares the check's absolute UTC window
+    timespans = {call.kwargs["timespan"] for call in mock_monitor_client_instance.metrics.list.call_args_list}
+    assert len(timespans) == 1 and timespans.pop().endswith("Z")
+    assert [vm['name'] for vm in findings] == ["idle-vm"]
+    assert findings[0]['avg_cpu_percent'] == 2.0
+    mock_console.print.assert_any_call("  - Found 2 running VMs to analyze...")
+
+def test_find_underutilized_vms_raises_auth_errors_from_metric_fallback(mocker):
+    """Tests that an expired credential in the per-VM fallback fails the check instead of being logged per VM."""
+    from azure.core.exceptions import ClientAuthenticationError
+    # Arrange
+    _mock_running_vms(mocker)
+    mocker.patch("azure_cost_advisor.analysis.requests.post", side_effect=Exception("Batch API unavailable"))
+    mock_monitor_client_instance = MagicMock()
+    mock_monitor_client_instance.metrics.list.side_effect = ClientAuthenticationError("Token expired")
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient", return_value=mock_monitor_client_instance)
+
+    # Act / Assert
+    with pytest.raises(ClientAuthenticationError):
+        analysis.find_underutilized_vms(MagicMock(), "sub-456", cpu_threshold_percent=5, lookback_days=7, console=MagicMock(spec=Console))
+
+def test_find_underutilized_vms_logs_expected_metric_outcomes_quietly(mocker):
+    """Tests that a VM without data logs at DEBUG and an HTTP error warns without a traceback."""
+    from azure.core.exceptions import HttpResponseError
+    # Arrange
+    vm_idle, vm_busy = _mock_running_vms(mocker)
+    mocker.patch("azure_cost_advisor.analysis.requests.post", side_effect=Exception("Batch API unavailable"))
+    server_error = HttpResponseError(message="InternalServerError")
+    server_error.status_code = 500
+
+    def mock_metrics_list(resource_uri, **kwargs):
+        if resource_uri == vm_busy["id"]:
+            raise server_error
+        return MagicMock(value=[MagicMock(timeseries=[MagicMock(data=[])])])
+
+    mock_monitor_client_instance = MagicMock()
+    mock_monitor_client_instance.metrics.list.side_effect = mock_metrics_list
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient", return_value=mock_monitor_client_instance)
     logger_instance = logging.getLogger()
-    mocker.patch.object(logger_instance, 'error')
+    mocker.patch.object(logger_instance, 'warning')
+    mocker.patch.object(logger_instance, 'debug')
 
     # Act
-    findings = find_stopped_vms(mock_credential, mock_subscription_id, mock_console)
+    analysis.find_underutilized_vms(MagicMock(), "sub-456", cpu_threshold_percent=5, lookback_days=7, console=MagicMock(spec=Console))
 
     # Assert
-    mock_compute_client_instance.virtual_machines.list_all.assert_called_once()
-    logger_instance.error.assert_called_once_with(
-        "Error checking for stopped VMs: Simulated list_all error", 
-        exc_info=True
+    assert any("No valid data points" in str(call.args[0]) and "idle-vm" in str(call.args[0]) for call in logger_instance.debug.call_args_list)
+    metric_warnings = [call for call in logger_instance.warning.call_args_list if "busy-vm" in str(call.args[0])]
+    assert len(metric_warnings) == 1
+    assert "exc_info" not in metric_warnings[0].kwargs
+    assert not any("idle-vm" in str(call.args[0]) for call in logger_instance.warning.call_args_list)
+
+def test_check_usage_metric_reports_throttling_and_drops_deleted_resources(mocker):
+    """Tests the shared per-resource worker: batch hits, throttled fallbacks and resources deleted mid-scan."""
+    from azure.core.exceptions import HttpResponseError
+    mocker.patch("azure_cost_advisor.analysis.time.sleep")
+    mock_console = MagicMock(spec=Console)
+    mock_monitor_client = MagicMock()
+    throttled = HttpResponseError(message="TooManyRequests")
+    throttled.status_code = 429
+    deleted = HttpResponseError(message="ResourceNotFound")
+    deleted.status_code = 404
+
+    def _details(name):
+        return {"name": name, "id": f"/subscriptions/s/resourceGroups/rg/providers/Microsoft.Sql/servers/srv/databases/{name}", "server_name": "srv", "avg_dtu_percent": None}
+
+    batched = _details("db-batched")
+    checked = analysis._check_usage_metric(
+        mock_monitor_client, batched, "dtu_consumption_percent", "avg_dtu_percent", 10, "SQL DB",
+        "timespan", {batched["id"].lower(): 4.0}, mock_console
     )
-    mock_console.print.assert_any_call("[bold red]Error checking for stopped VMs:[/] Simulated list_all error")
-    assert len(findings) == 0
+    assert checked["avg_dtu_percent"] == 4.0
+    mock_monitor_client.metrics.list.assert_not_called()
+
+    mock_monitor_client.metrics.list.side_effect = throttled
+    checked = analysis._check_usage_metric(
+        mock_monitor_client, _details("db-throttled"), "dtu_consumption_percent", "avg_dtu_percent", 10, "SQL DB",
+        "timespan", {}, mock_console
+    )
+    assert checked["avg_dtu_percent"] is None
+    mock_console.print.assert_any_call("  - [yellow]Throttled:[/yellow] Skipping metrics for SQL DB db-throttled on srv.")
+
+    mock_monitor_client.metrics.list.side_effect = deleted
+    assert analysis._check_usage_metric(
+        mock_monitor_client, _details("db-deleted"), "dtu_consumption_percent", "avg_dtu_percent", 10, "SQL DB",
+        "timespan", {}, mock_console
+    ) is None
+
+def test_find_underutilized_vms_skips_vms_deleted_during_the_scan(mocker):
+    """Tests that a 404 from a VM's metrics query drops it quietly instead of retrying or reporting it."""
+    from azure.core.exceptions import HttpResponseError
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    vm_idle, vm_busy = _mock_running_vms(mocker)
+    mocker.patch("azure_cost_advisor.analysis.requests.post", side_effect=Exception("Batch API unavailable"))
+    deleted = HttpResponseError(message="ResourceNotFound")
+    deleted.status_code = 404
+
+    def mock_metrics_list(resource_uri, **kwargs):
+        if resource_uri == vm_busy["id"]:
+            raise deleted
+        return MagicMock(value=[MagicMock(timeseries=[MagicMock(data=[MagicMock(average=1.0)])])])
+
+    mock_monitor_client_instance = MagicMock()
+    mock_monitor_client_instance.metrics.list.side_effect = mock_metrics_list
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient", return_value=mock_monitor_client_instance)
+    logger_instance = logging.getLogger()
+    mocker.patch.object(logger_instance, 'warning')
+
+    # Act
+    findings = analysis.find_underutilized_vms(MagicMock(), "sub-456", cpu_threshold_percent=5, lookback_days=7, console=mock_console)
+
+    # Assert
+    assert mock_monitor_client_instance.metrics.list.call_count == 2
+    assert [vm['name'] for vm in findings] == ["idle-vm"]
+    warned = " ".join(str(call.args[0]) for call in logger_instance.warning.call_args_list)
+    printed = " ".join(str(call.args[0]) for call in mock_console.print.call_args_list if call.args)
+    assert "busy-vm" not in warned and "busy-vm" not in printed
 
 # --- Tests for find_unused_public_ips ---
 
@@ -442,7 +609,7 @@ def test_find_unused_public_ips_positive_case(mocker):
     findings = find_unused_public_ips(mock_credential, mock_subscription_id, mock_console)
 
     # Assert
-    analysis.NetworkManagementClient.assert_called_once_with(mock_credential, mock_subscription_id)
+    analysis.NetworkManagementClient.assert_called_once_with(mock_credential, mock_subscription_id, transport=ANY, retry_policy=ANY)
     mock_network_client_instance.public_ip_addresses.list_all.assert_called_once()
     
     # Verify console output
@@ -539,7 +706,7 @@ def test_find_empty_resource_groups_positive_case(mocker):
     findings = find_empty_resource_groups(mock_credential, mock_subscription_id, mock_console)
 
     # Assert
-    analysis.ResourceGraphClient.assert_called_once_with(mock_credential)
+    analysis.ResourceGraphClient.assert_called_once_with(mock_credential, transport=ANY, retry_policy=ANY)
     mock_arg_client_instance.resources.assert_called_once()
     # Verify query content
     call_args, call_kwargs = mock_arg_client_instance.resources.call_args
@@ -612,4 +779,761 @@ def test_find_empty_resource_groups_api_error(mocker):
     mock_console.print.assert_any_call("[bold red]Error checking for empty Resource Groups (ARG):[/] Simulated ARG error for RGs")
     assert len(findings) == 0
 
-# TODO: Add tests for other analysis functions (find_stopped_vms, find_unused_public_ips, etc.) 
\ No newline at end of file
+# TODO: Add tests for other analysis functions (find_stopped_vms, find_unused_public_ips, etc.) 
+
+# --- Tests for find_empty_app_service_plans ---
+
+def test_find_empty_app_service_plans_uses_single_arg_query(mocker):
+    """Tests that empty plans come from one ARG join query instead of per-plan app listing."""
+    # Arrange
+    mock_credential = MagicMock()
+    mock_subscription_id = "sub-789"
+    mock_console = MagicMock(spec=Console)
+
+    mock_arg_data = [
+        {
+            'name': 'empty-plan',
+            'id': '/subscriptions/sub-789/resourceGroups/rg-web/providers/Microsoft.Web/serverfarms/empty-plan',
+            'resourceGroup': 'rg-web',
+            'location': 'westeurope',
+            'skuName': 'B1',
+            'skuTier': 'Basic',
+        }
+    ]
+    mock_arg_client_instance = MagicMock()
+    mock_arg_client_instance.resources.return_value = MockArgQueryResponse(data=mock_arg_data, total_records=1)
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
+
+    # Act
+    findings = analysis.find_empty_app_service_plans(mock_credential, mock_subscription_id, mock_console)
+
+    # Assert
+    mock_arg_client_instance.resources.assert_called_once()
+    query_request_arg = mock_arg_client_instance.resources.call_args[0][0]
+    assert query_request_arg.subscriptions == [mock_subscription_id]
+    assert "type =~ 'microsoft.web/serverfarms'" in query_request_arg.query
+    assert "join kind=leftouter" in query_request_arg.query
+    assert "where isnull(siteCount) or siteCount == 0" in query_request_arg.query
+    mock_console.print.assert_any_call("  :warning: Found 1 empty App Service Plan(s).")
+    assert findings == [{
+        "name": "empty-plan",
+        "id": mock_arg_data[0]['id'],
+        "resource_group": "rg-web",
+        "location": "westeurope",
+        "sku": "B1",
+        "tier": "Basic",
+    }]
+
+def test_find_empty_resource_groups_follows_skip_token(mocker):
+    """Tests that ARG results spanning several pages are all returned, at the max page size."""
+    # Arrange
+    mock_credential = MagicMock()
+    mock_console = MagicMock(spec=Console)
+    first_page = MockArgQueryResponse(data=[{"name": "rg-a", "id": "/subscriptions/sub-000/resourceGroups/rg-a", "location": "uksouth"}],
+                                      total_records=2, skip_token="page-2")
+    second_page = MockArgQueryResponse(data=[{"name": "rg-b", "id": "/subscriptions/sub-000/resourceGroups/rg-b", "location": "uksouth"}],
+                                       total_records=2)
+    mock_arg_client_instance = MagicMock()
+    mock_arg_client_instance.resources.side_effect = [first_page, second_page]
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
+
+    # Act
+    findings = find_empty_resource_groups(mock_credential, "sub-000", mock_console)
+
+    # Assert
+    assert [rg['name'] for rg in findings] == ["rg-a", "rg-b"]
+    requests_made = [call.args[0] for call in mock_arg_client_instance.resources.call_args_list]
+    assert [request.options.skip_token for request in requests_made] == [None, "page-2"]
+    assert all(request.options.top == 1000 for request in requests_made)
+
+def test_prefetch_arg_checks_serves_finders_from_grouped_queries(mocker):
+    """Tests that the grouped ARG queries feed each ARG-based finder without further queries."""
+    # Arrange
+    mock_credential = MagicMock()
+    mock_subscription_id = "sub-union"
+    mock_console = MagicMock(spec=Console)
+
+    mock_arg_data = [
+        {'check': 'unattached_disks', 'name': 'disk-1', 'id': '/subscriptions/sub-union/resourceGroups/rg1/providers/Microsoft.Compute/disks/disk-1',
+         'resourceGroup': 'rg1', 'location': 'eastus', 'sizeGb': 64, 'skuName': 'Standard_LRS'},
+        {'check': 'empty_rgs', 'name': 'rg-empty', 'id': '/subscriptions/sub-union/resourceGroups/rg-empty', 'location': 'eastus'},
+    ]
+    mock_arg_client_instance = _mock_arg_checks(mocker, mock_arg_data)
+
+    # Act
+    assert analysis.prefetch_arg_checks(mock_credential, mock_subscription_id) is True
+    disks = find_unattached_disks(mock_credential, mock_subscription_id, mock_console)
+    rgs = find_empty_resource_groups(mock_credential, mock_subscription_id, mock_console)
+    asps = analysis.find_empty_app_service_plans(mock_credential, mock_subscription_id, mock_console)
+
+    # Assert
+    queries = [call.args[0].query for call in mock_arg_client_instance.resources.call_args_list]
+    assert len(queries) == len(analysis._ARG_PREFETCH_GROUPS)
+    assert any(query.startswith("union ") and "extend check = 'empty_asps'" in query for query in queries)
+    assert [d['name'] for d in disks] == ['disk-1']
+    assert [rg['name'] for rg in rgs] == ['rg-empty']
+    assert asps == []
+
+    # Prefetched rows are consumed once; a repeat call queries ARG again
+    find_unattached_disks(mock_credential, mock_subscription_id, mock_console)
+    assert mock_arg_client_instance.resources.call_count == len(analysis._ARG_PREFETCH_GROUPS) + 1
+
+def test_arg_prefetch_groups_stay_within_arg_query_limits():
+    """Tests that every check is prefetched exactly once, in groups of at most 3 union legs and 3 joins."""
+    grouped = [check for checks in analysis._ARG_PREFETCH_GROUPS for check in checks]
+    assert sorted(grouped) == sorted(analysis._ARG_CHECK_QUERIES)
+    for checks in analysis._ARG_PREFETCH_GROUPS:
+        query = analysis._arg_prefetch_query(checks)
+        assert len(checks) <= 3
+        assert query.count("| join") <= 3
+        assert query.startswith("union ") == (len(checks) > 1)
+
+def test_prefetch_arg_checks_falls_back_for_a_failed_group(mocker):
+    """Tests that a failed group leaves only its own checks to query ARG individually."""
+    mock_arg_client_instance = MagicMock()
+
+    def mock_resources(request):
+        if "check = 'empty_rgs'" in request.query:
+            raise Exception("Query rejected")
+        return MockArgQueryResponse(data=[])
+    mock_arg_client_instance.resources.side_effect = mock_resources
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
+
+    assert analysis.prefetch_arg_checks(MagicMock(), "sub-partial") is False
+    assert ("sub-partial", "unattached_disks") in analysis._prefetched_arg_rows
+    assert ("sub-partial", "empty_rgs") not in analysis._prefetched_arg_rows
+    for checks in analysis._ARG_PREFETCH_GROUPS:
+        for check in checks:
+            analysis._prefetched_arg_rows.pop(("sub-partial", check), None)
+
+def test_sql_database_checks_share_the_arg_prefetch(mocker):
+    """Tests that the DTU and vCore checks take their databases from the ARG prefetch, not per-server listings."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    db_prefix = "/subscriptions/sub-sql/resourceGroups/rg-data/providers/Microsoft.Sql/servers/sql-1/databases"
+    mock_arg_data = [
+        {'check': 'sql_dtu_dbs', 'name': 'orders', 'id': f"{db_prefix}/orders", 'resourceGroup': 'rg-data', 'location': 'westeurope',
+         'serverName': 'sql-1', 'skuName': 'S1', 'skuTier': 'Standard', 'skuFamily': '', 'skuCapacity': 20},
+        {'check': 'sql_vcore_dbs', 'name': 'reports', 'id': f"{db_prefix}/reports", 'resourceGroup': 'rg-data', 'location': 'westeurope',
+         'serverName': 'sql-1', 'skuName': 'GP_Gen5_2', 'skuTier': 'GeneralPurpose'},
+    ]
+    mock_arg_client_instance = _mock_arg_checks(mocker, mock_arg_data)
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient")
+
+    def mock_batch_post(url, **kwargs):
+        response = MagicMock()
+        response.json.return_value = {"values": [
+            {"resourceid": resource_id, "value": [{"timeseries": [{"data": [{"average": 2.0}]}]}]}
+            for resource_id in kwargs["json"]["resourceids"]
+        ]}
+        return response
+    mocker.patch("azure_cost_advisor.analysis.requests.post", side_effect=mock_batch_post)
+
+    # Act
+    analysis.prefetch_arg_checks(MagicMock(), "sub-sql")
+    dtu_findings = analysis.find_low_dtu_sql_databases(MagicMock(), "sub-sql", dtu_threshold_percent=10, lookback_days=7, console=mock_console)
+    vcore_findings = analysis.find_low_cpu_sql_vcore_databases(MagicMock(), "sub-sql", cpu_threshold_percent=10, lookback_days=7, console=mock_console)
+
+    # Assert
+    assert mock_arg_client_instance.resources.call_count == len(analysis._ARG_PREFETCH_GROUPS)
+    assert [(db['name'], db['server_name'], db['sku'], db['capacity'], db['family']) for db in dtu_findings] == [("orders", "sql-1", "S1", 20, None)]
+    assert [(db['name'], db['sku'], db['tier']) for db in vcore_findings] == [("reports", "GP_Gen5_2", "GeneralPurpose")]
+
+def test_find_low_cpu_sql_vcore_databases_shares_usage_error_handling(mocker):
+    """Tests that the vCore check runs through the shared usage helper, logging metric errors without a console."""
+    from azure.core.exceptions import HttpResponseError
+    # Arrange
+    db_prefix = "/subscriptions/sub-sql/resourceGroups/rg-data/providers/Microsoft.Sql/servers/sql-1/databases"
+    _mock_arg_checks(mocker, [
+        {'check': 'sql_vcore_dbs', 'name': name, 'id': f"{db_prefix}/{name}", 'resourceGroup': 'rg-data', 'location': 'westeurope',
+         'serverName': 'sql-1', 'skuName': 'GP_Gen5_2', 'skuTier': None}
+        for name in ("reports", "broken")
+    ])
+    mocker.patch("azure_cost_advisor.analysis.requests.post", side_effect=Exception("Batch API unavailable"))
+    server_error = HttpResponseError(message="InternalServerError")
+    server_error.status_code = 500
+
+    def mock_metrics_list(resource_uri, **kwargs):
+        if resource_uri.endswith("/broken"):
+            raise server_error
+        return MagicMock(value=[MagicMock(timeseries=[MagicMock(data=[MagicMock(average=3.0)])])])
+
+    mock_monitor_client_instance = MagicMock()
+    mock_monitor_client_instance.metrics.list.side_effect = mock_metrics_list
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient", return_value=mock_monitor_client_instance)
+    logger_instance = logging.getLogger()
+    mocker.patch.object(logger_instance, 'warning')
+
+    # Act
+    analysis.prefetch_arg_checks(MagicMock(), "sub-sql")
+    findings = analysis.find_low_cpu_sql_vcore_databases(MagicMock(), "sub-sql", cpu_threshold_percent=10, lookback_days=7)
+
+    # Assert
+    assert [(db['name'], db['tier'], db['avg_cpu_percent']) for db in findings] == [("reports", "Unknown", 3.0)]
+    assert any("SQL vCore DB broken on sql-1" in str(call.args[0]) for call in logger_instance.warning.call_args_list)
+
+def test_orphan_checks_read_associations_from_arg(mocker):
+    """Tests that orphaned NSGs and route tables come from ARG rather than a walk over NICs, VNets and subnets."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_arg_data = [
+        {'check': 'orphaned_nsgs', 'name': 'nsg-old', 'id': '/subscriptions/sub-net/resourceGroups/rg-net/providers/Microsoft.Network/networkSecurityGroups/nsg-old',
+         'resourceGroup': 'rg-net', 'location': 'eastus'},
+        {'check': 'orphaned_route_tables', 'name': 'rt-old', 'id': '/subscriptions/sub-net/resourceGroups/rg-net/providers/Microsoft.Network/routeTables/rt-old',
+         'resourceGroup': 'rg-net', 'location': 'eastus'},
+    ]
+    mock_arg_client_instance = _mock_arg_checks(mocker, mock_arg_data)
+    mock_network_client = mocker.patch("azure_cost_advisor.analysis.NetworkManagementClient")
+
+    # Act
+    analysis.prefetch_arg_checks(MagicMock(), "sub-net")
+    nsgs = analysis.find_orphaned_nsgs(MagicMock(), "sub-net", mock_console)
+    route_tables = analysis.find_orphaned_route_tables(MagicMock(), "sub-net", mock_console)
+
+    # Assert
+    assert mock_arg_client_instance.resources.call_count == len(analysis._ARG_PREFETCH_GROUPS)
+    mock_network_client.assert_not_called()
+    assert nsgs == [{"name": "nsg-old", "id": mock_arg_data[0]['id'], "resource_group": "rg-net", "location": "eastus"}]
+    assert [rt['name'] for rt in route_tables] == ["rt-old"]
+
+# --- Tests for find_low_usage_app_service_plans ---
+
+def test_find_low_usage_app_service_plans_checks_only_prefiltered_plans(mocker):
+    """Tests that only ARG-prefiltered plans (Basic+ with sites) get a CPU check."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    plan_id = "/subscriptions/sub-789/resourceGroups/rg-web/providers/Microsoft.Web/serverfarms/quiet-plan"
+    mock_arg_client_instance = MagicMock()
+    mock_arg_client_instance.resources.return_value = MockArgQueryResponse(data=[
+        {"name": "quiet-plan", "id": plan_id, "resourceGroup": "rg-web", "location": "West Europe", "skuName": "S1", "skuTier": "Standard"},
+    ], total_records=1)
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient", return_value=MagicMock())
+    batch_response = MagicMock()
+    batch_response.json.return_value = {"values": [
+        {"resourceid": plan_id, "value": [{"timeseries": [{"data": [{"average": 2.0}, {"average": 4.0}]}]}]},
+    ]}
+    mock_post = mocker.patch("azure_cost_advisor.analysis.requests.post", return_value=batch_response)
+
+    # Act
+    findings = analysis.find_low_usage_app_service_plans(MagicMock(), "sub-789", cpu_threshold_percent=10, lookback_days=7, console=mock_console)
+
+    # Assert
+    query = mock_arg_client_instance.resources.call_args[0][0].query
+    assert "toint(properties.numberOfSites) > 0" in query
+    assert "!in ('free', 'shared', 'dynamic')" in query
+    assert mock_post.call_args.args[0].startswith("https://westeurope.metrics.monitor.azure.com/")
+    assert findings == [{
+        "name": "quiet-plan", "id": plan_id, "resource_group": "rg-web", "location": "West Europe",
+        "tier": "Standard", "sku": "S1", "avg_cpu_percent": 3.0,
+    }]
+
+# --- Tests for find_idle_application_gateways ---
+
+def test_find_idle_application_gateways_uses_metrics_batch_api(mocker):
+    """Tests that gateway connections come from the daily metrics:getBatch call instead of per-gateway queries."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    gateway = MagicMock()
+    gateway.name = "quiet-gw"
+    gateway.id = "/subscriptions/sub-1/resourceGroups/rg-net/providers/Microsoft.Network/applicationGateways/quiet-gw"
+    gateway.location = "northeurope"
+    mock_network_client_instance = MagicMock()
+    mock_network_client_instance.application_gateways.list_all.return_value = [gateway]
+    mocker.patch("azure_cost_advisor.analysis.NetworkManagementClient", return_value=mock_network_client_instance)
+    mock_monitor_client_instance = MagicMock()
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient", return_value=mock_monitor_client_instance)
+    batch_response = MagicMock()
+    batch_response.json.return_value = {"values": [
+        {"resourceid": gateway.id, "value": [{"timeseries": [{"data": [{"average": 1.0}, {"average": 2.0}]}]}]},
+    ]}
+    mock_post = mocker.patch("azure_cost_advisor.analysis.requests.post", return_value=batch_response)
+
+    # Act
+    findings = analysis.find_idle_application_gateways(MagicMock(), "sub-1", lookback_days=7, idle_connection_threshold=5, console=mock_console)
+
+    # Assert
+    assert mock_post.call_args.kwargs["params"]["metricnamespace"] == "microsoft.network/applicationgateways"
+    assert mock_post.call_args.kwargs["params"]["interval"] == "P1D"
+    mock_monitor_client_instance.metrics.list.assert_not_called()
+    assert [gw['name'] for gw in findings] == ["quiet-gw"]
+    assert findings[0]['avg_current_connections'] == 1.5
+
+def test_find_idle_application_gateways_queries_fallback_metrics_concurrently(mocker):
+    """Tests that per-gateway metric queries run side by side and findings keep the listing order."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    gateways = []
+    for name in ("gw-a", "gw-b", "gw-c"):
+        gateway = MagicMock()
+        gateway.name = name
+        gateway.id = f"/subscriptions/sub-1/resourceGroups/rg-net/providers/Microsoft.Network/applicationGateways/{name}"
+        gateway.location = "northeurope"
+        gateways.append(gateway)
+    mock_network_client_instance = MagicMock()
+    mock_network_client_instance.application_gateways.list_all.return_value = gateways
+    mocker.patch("azure_cost_advisor.analysis.NetworkManagementClient", return_value=mock_network_client_instance)
+    mocker.patch("azure_cost_advisor.analysis.requests.post", side_effect=Exception("Batch API unavailable"))
+
+    # Every query waits until all three are in flight, so a serial loop would never get past the first
+    all_in_flight = threading.Barrier(len(gateways), timeout=5)
+    def mock_metrics_list(resource_uri, **kwargs):
+        all_in_flight.wait()
+        series = MagicMock(data=[MagicMock(average=0.5)])
+        return MagicMock(value=[MagicMock(timeseries=[series])])
+
+    mock_monitor_client_instance = MagicMock()
+    mock_monitor_client_instance.metrics.list.side_effect = mock_metrics_list
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient", return_value=mock_monitor_client_instance)
+
+    # Act
+    findings = analysis.find_idle_application_gateways(MagicMock(), "sub-1", lookback_days=7, idle_connection_threshold=5, console=mock_console)
+
+    # Assert
+    assert mock_monitor_client_instance.metrics.list.call_count == 3
+    assert [gw['name'] for gw in findings] == ["gw-a", "gw-b", "gw-c"]
+
+# --- Tests for find_low_usage_web_apps ---
+
+def test_find_low_usage_web_apps_stops_querying_a_missing_metric(mocker):
+    """Tests that once one app reports the CPU metric missing, the remaining apps are not queried for it."""
+    # Arrange
+    from azure.core.exceptions import HttpResponseError
+    mock_console = MagicMock(spec=Console)
+    mock_arg_data = [
+        {'name': name, 'id': f"/subscriptions/sub-web/resourceGroups/rg-web/providers/Microsoft.Web/sites/{name}",
+         'resourceGroup': 'rg-web', 'location': 'eastus', 'planName': 'plan-1', 'planTier': 'standard'}
+        for name in ("app-1", "app-2", "app-3")
+    ]
+    mock_arg_client_instance = MagicMock()
+    mock_arg_client_instance.resources.return_value = MockArgQueryResponse(data=mock_arg_data, total_records=3)
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
+    mocker.patch("azure_cost_advisor.analysis.requests.post", side_effect=Exception("Batch API unavailable"))
+    mocker.patch("azure_cost_advisor.analysis.ANALYSIS_MAX_WORKERS", 1)
+
+    missing_metric = HttpResponseError(message="Bad request")
+    missing_metric.status_code = 400
+    missing_metric.error = MagicMock(message="Failed to find metric configuration for provider: Microsoft.Web")
+    mock_monitor_client_instance = MagicMock()
+    mock_monitor_client_instance.metrics.list.side_effect = missing_metric
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient", return_value=mock_monitor_client_instance)
+
+    # Act
+    findings = analysis.find_low_usage_web_apps(MagicMock(), "sub-web", cpu_threshold_percent=5, lookback_days=7, console=mock_console)
+
+    # Assert
+    mock_monitor_client_instance.metrics.list.assert_called_once()
+    assert findings == []
+
+# --- Tests for get_cost_data ---
+
+def _mock_cost_query_result():
+    result = MagicMock()
+    columns = []
+    for name in ("Cost", "UsageDate", "ResourceType", "Currency"):
+        column = MagicMock()
+        column.name = name
+        columns.append(column)
+    result.columns = columns
+    today = int(datetime.now(timezone.utc).strftime("%Y%m%d"))
+    result.rows = [
+        [12.5, today, "microsoft.compute/virtualmachines", "USD"],
+        [2.5, today, "microsoft.storage/storageaccounts", "USD"],
+    ]
+    result.next_link = None
+    return result
+
+def test_get_cost_data_reuses_cached_result(mocker, tmp_path):
+    """Tests that a second call within the TTL is served from the on-disk cache."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mocker.patch("azure_cost_advisor.cache.COST_CACHE_FILENAME", str(tmp_path / "cost_cache.json"))
+    mock_cost_client_instance = MagicMock()
+    mock_cost_client_instance.query.usage.return_value = _mock_cost_query_result()
+    mocker.patch("azure_cost_advisor.analysis.CostManagementClient", return_value=mock_cost_client_instance)
+
+    # Act
+    first = analysis.get_cost_data(MagicMock(), "sub-1", console=mock_console)
+    second = analysis.get_cost_data(MagicMock(), "sub-1", console=mock_console)
+    refreshed = analysis.get_cost_data(MagicMock(), "sub-1", console=mock_console, use_cache=False)
+
+    # Assert
+    assert mock_cost_client_instance.query.usage.call_count == 2
+    assert first == second == refreshed
+    costs_by_type, total_cost, currency = second
+    assert costs_by_type["microsoft.compute/virtualmachines"] == 12.5
+    assert total_cost == 15.0
+    assert currency == "USD"
+
+def test_get_cost_data_reports_persistent_throttling(mocker, tmp_path):
+    """Tests that a 429 is retried via its status code and still reported as throttling once retries run out."""
+    # Arrange
+    from azure.core.exceptions import HttpResponseError
+    mock_console = MagicMock(spec=Console)
+    mocker.patch("azure_cost_advisor.cache.COST_CACHE_FILENAME", str(tmp_path / "cost_cache.json"))
+    mock_sleep = mocker.patch("azure_cost_advisor.analysis.time.sleep")
+    throttled = HttpResponseError(message="Request was rejected")
+    throttled.status_code = 429
+    throttled.response = MagicMock(headers={"Retry-After": "2"})
+    mock_cost_client_instance = MagicMock()
+    mock_cost_client_instance.query.usage.side_effect = throttled
+    mocker.patch("azure_cost_advisor.analysis.CostManagementClient", return_value=mock_cost_client_instance)
+
+    # Act
+    costs_by_type, total_cost, _ = analysis.get_cost_data(MagicMock(), "sub-throttled", console=mock_console, use_cache=False)
+
+    # Assert
+    assert mock_cost_client_instance.query.usage.call_count == analysis.RETRY_MAX_ATTEMPTS
+    mock_sleep.assert_called_with(2.0)
+    assert not costs_by_type and total_cost == 0.0
+    mock_console.print.assert_any_call("[yellow]  - Suggestion: Cost Management API is still throttling after retries. Try again in a few minutes.[/]")
+
+def test_get_cost_data_sums_rows_per_resource_type(mocker, tmp_path):
+    """Tests that rows are summed per resource type, highest first, ignoring rows without a type."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mocker.patch("azure_cost_advisor.cache.COST_CACHE_FILENAME", str(tmp_path / "cost_cache.json"))
+    query_result = _mock_cost_query_result()
+    today = query_result.rows[0][1]
+    query_result.rows += [
+        [7.0, today, "microsoft.storage/storageaccounts", "USD"],
+        [3.0, today, "", "USD"],
+        [1.0, today, None, "USD"],
+    ]
+    mock_cost_client_instance = MagicMock()
+    mock_cost_client_instance.query.usage.return_value = query_result
+    mocker.patch("azure_cost_advisor.analysis.CostManagementClient", return_value=mock_cost_client_instance)
+
+    # Act
+    costs_by_type, total_cost, currency = analysis.get_cost_data(MagicMock(), "sub-2", console=mock_console, use_cache=False)
+
+    # Assert
+    assert list(costs_by_type.items()) == [
+        ("microsoft.compute/virtualmachines", 12.5),
+        ("microsoft.storage/storageaccounts", 9.5),
+    ]
+    assert total_cost == 22.0
+    assert currency == "USD"
+
+def test_get_cost_data_follows_next_link(mocker, tmp_path):
+    """Tests that rows on later result pages are fetched and summed along with the first page."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mocker.patch("azure_cost_advisor.cache.COST_CACHE_FILENAME", str(tmp_path / "cost_cache.json"))
+    first_page = _mock_cost_query_result()
+    today = first_page.rows[0][1]
+    next_link = "https://management.azure.com/subscriptions/sub-3/providers/Microsoft.CostManagement/query?$skiptoken=abc"
+    first_page.next_link = next_link
+    second_page = MagicMock()
+    second_page.json.return_value = {"properties": {
+        "nextLink": None,
+        "columns": [{"name": name, "type": "String"} for name in ("Cost", "UsageDate", "ResourceType", "Currency")],
+        "rows": [[5.0, today, "microsoft.compute/virtualmachines", "USD"]],
+    }}
+    mock_cost_client_instance = MagicMock()
+    mock_cost_client_instance.query.usage.return_value = first_page
+    mock_cost_client_instance.send_request.return_value = second_page
+    mocker.patch("azure_cost_advisor.analysis.CostManagementClient", return_value=mock_cost_client_instance)
+
+    # Act
+    costs_by_type, total_cost, _ = analysis.get_cost_data(MagicMock(), "sub-3", console=mock_console, use_cache=False)
+
+    # Assert
+    request = mock_cost_client_instance.send_request.call_args.args[0]
+    assert request.method == "POST" and request.url == next_link
+    assert costs_by_type["microsoft.compute/virtualmachines"] == 17.5
+    assert total_cost == 20.0
+
+def test_get_cost_data_queries_only_unsettled_days_after_a_cache_miss(mocker, tmp_path):
+    """Tests that settled days are cached for the month, so the next query starts where they end."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mocker.patch("azure_cost_advisor.cache.COST_CACHE_FILENAME", str(tmp_path / "cost_cache.json"))
+    mocker.patch("azure_cost_advisor.analysis.COST_CACHE_TTL_HOURS", 0) # Every call misses the whole-result cache
+    now = datetime.now(timezone.utc)
+    today = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
+    settled_before = max(datetime(now.year, now.month, 1, tzinfo=timezone.utc), today - timedelta(days=analysis.COST_SETTLE_DAYS))
+    settled_day = int((settled_before - timedelta(days=1)).strftime("%Y%m%d"))
+    first_result = _mock_cost_query_result()
+    first_result.rows.append([4.0, settled_day, "microsoft.compute/virtualmachines", "USD"])
+    mock_cost_client_instance = MagicMock()
+    mock_cost_client_instance.query.usage.side_effect = [first_result, _mock_cost_query_result()]
+    mocker.patch("azure_cost_advisor.analysis.CostManagementClient", return_value=mock_cost_client_instance)
+
+    # Act
+    first = analysis.get_cost_data(MagicMock(), "sub-3", console=mock_console)
+    second = analysis.get_cost_data(MagicMock(), "sub-3", console=mock_console)
+
+    # Assert
+    periods = [call.kwargs["parameters"].time_period for call in mock_cost_client_instance.query.usage.call_args_list]
+    assert periods[1].from_property == settled_before
+    assert first[0]["microsoft.compute/virtualmachines"] == second[0]["microsoft.compute/virtualmachines"] == 16.5
+    assert first[1] == second[1] == 19.0
+
+# --- Tests for list_all_resources ---
+
+def test_list_all_resources_projects_fields_via_arg(mocker):
+    """Tests that resources are listed through one projected ARG query, as columns."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mock_arg_data = [
+        {"name": "vm-1", "type": "microsoft.compute/virtualmachines", "location": "eastus",
+         "id": "/subscriptions/sub-1/resourceGroups/rg1/providers/Microsoft.Compute/virtualMachines/vm-1", "tags": {"env": "dev"}},
+    ]
+    mock_arg_client_instance = MagicMock()
+    mock_arg_client_instance.resources.return_value = MockArgQueryResponse(data=mock_arg_data, total_records=1)
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
+
+    # Act
+    resources = analysis.list_all_resources(MagicMock(), "sub-1", console=mock_console)
+
+    # Assert
+    query_request_arg = mock_arg_client_instance.resources.call_args[0][0]
+    assert query_request_arg.query == "Resources | project name, type, location, id, tags"
+    assert list(resources.columns) == ["name", "type", "location", "id", "tags"]
+    assert resources.to_dict('records') == mock_arg_data
+    mock_console.print.assert_any_call(":white_check_mark: Total resources found: 1")
+
+# --- Tests for run_all_checks ---
+
+def test_run_all_checks_collects_every_check(mocker):
+    """Tests that every check runs once and results come back keyed by check name, in a stable order."""
+    # Arrange
+    mock_console = MagicMock(spec=Console)
+    mocker.patch.object(analysis, "prefetch_arg_checks", return_value=True)
+    mocker.patch.object(analysis, "get_cost_data", return_value=({"microsoft.compute/disks": 4.0}, 4.0, "USD"))
+    finder_names = [
+        "find_unattached_disks", "find_stopped_vms", "find_unused_public_ips", "find_empty_resource_groups",
+        "find_empty_app_service_plans", "find_old_snapshots", "find_underutilized_vms", "find_low_usage_app_service_plans",
+        "find_low_dtu_sql_databases", "find_low_cpu_sql_vcore_databases", "find_idle_application_gateways",
+        "find_low_usage_web_apps", "find_orphaned_nsgs", "find_orphaned_route_tables",
+    ]
+    finders = {name: mocker.patch.object(analysis, name, return_value=[{"name": name}]) for name in finder_names}
+    finders["find_stopped_vms"].side_effect = Exception("boom")
+    done = []
+
+    # Act
+    cost_data, findings = analysis.run_all_checks(MagicMock(), "sub-1", console=mock_console, on_check_done=done.append)
+
+    # Assert
+    assert cost_data == ({"microsoft.compute/disks": 4.0}, 4.0, "USD")
+    assert list(findings)[:3] == ["unattached_disks", "stopped_vms", "unused_public_ips"]
+    assert len(findings) == len(finder_names)
+    assert findings["stopped_vms"] == []
+    assert findings["orphaned_rts"] == [{"name": "find_orphaned_route_tables"}]
+    for finder in finders.values():
+        finder.assert_called_once()
+    assert sorted(done) == sorted(["cost_data"] + list(findings))
+
+def test_run_all_checks_stops_on_authentication_failure(mocker):
+    """Tests that an expired credential fails the run instead of looking like a clean subscription."""
+    from azure.core.exceptions import ClientAuthenticationError
+    mock_console = MagicMock(spec=Console)
+    mock_arg_client_instance = MagicMock()
+    mock_arg_client_instance.resources.side_effect = ClientAuthenticationError(message="Token expired")
+    mocker.patch("azure_cost_advisor.analysis.ResourceGraphClient", return_value=mock_arg_client_instance)
+
+    with pytest.raises(ClientAuthenticationError):
+        analysis.run_all_checks(MagicMock(), "sub-auth", console=mock_console)
+
+    # The prefetch fails first, so no finder runs its own (untagged) query after it
+    queries = [call.args[0].query for call in mock_arg_client_instance.resources.call_args_list]
+    assert queries and all("| extend check = " in query for query in queries)
+    with pytest.raises(ClientAuthenticationError):
+        find_unattached_disks(MagicMock(), "sub-auth", mock_console)
+
+# --- Tests for _with_retry ---
+
+def test_with_retry_waits_for_quota_reset_on_429(mocker):
+    """Tests that a throttled call is retried after the advertised quota reset, and other errors are not retried."""
+    from azure.core.exceptions import HttpResponseError
+    mock_sleep = mocker.patch("azure_cost_advisor.analysis.time.sleep")
+    throttled = HttpResponseError(message="Too many requests")
+    throttled.status_code = 429
+    throttled.response = MagicMock(headers={"x-ms-user-quota-resets-after": "00:00:03"})
+    call = MagicMock(side_effect=[throttled, "ok"])
+
+    assert analysis._with_retry(call, "arg", key="value") == "ok"
+    assert call.call_count == 2
+    call.assert_called_with("arg", key="value")
+    mock_sleep.assert_called_once_with(3.0)
+
+    not_found = HttpResponseError(message="Not found")
+    not_found.status_code = 404
+    failing_call = MagicMock(side_effect=not_found)
+    with pytest.raises(HttpResponseError):
+        analysis._with_retry(failing_call)
+    failing_call.assert_called_once()
+
+def test_with_retry_gives_up_when_asked_to_wait_too_long(mocker):
+    """Tests that a 429 advertising a wait beyond RETRY_MAX_WAIT_SECONDS is raised rather than slept on."""
+    from azure.core.exceptions import HttpResponseError
+    mock_sleep = mocker.patch("azure_cost_advisor.analysis.time.sleep")
+    throttled = HttpResponseError(message="Too many requests")
+    throttled.status_code = 429
+    throttled.response = MagicMock(headers={"Retry-After": str(analysis.RETRY_MAX_WAIT_SECONDS * 20)})
+    call = MagicMock(side_effect=throttled)
+
+    with pytest.raises(HttpResponseError):
+        analysis._with_retry(call)
+    call.assert_called_once()
+    mock_sleep.assert_not_called()
+
+def test_token_bucket_paces_calls_beyond_its_burst(mocker):
+    """Tests that calls within the burst run immediately and later ones wait for the refill."""
+    clock = [100.0]
+    mocker.patch("azure_cost_advisor.analysis.time.monotonic", side_effect=lambda: clock[0])
+    mock_sleep = mocker.patch("azure_cost_advisor.analysis.time.sleep")
+    bucket = analysis._TokenBucket(capacity=2, rate=4)
+
+    bucket.acquire()
+    bucket.acquire()
+    mock_sleep.assert_not_called()
+    bucket.acquire()
+    bucket.acquire()
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [0.25, 0.5]
+
+    clock[0] += 10 # Long idle: the bucket refills to capacity, not beyond it
+    mock_sleep.reset_mock()
+    bucket.acquire()
+    bucket.acquire()
+    mock_sleep.assert_not_called()
+    bucket.acquire()
+    mock_sleep.assert_called_once_with(0.25)
+
+def test_token_bucket_slows_down_after_throttling(mocker):
+    """Tests that a 429 drops the saved-up burst and halves the refill rate until the slowdown expires."""
+    clock = [100.0]
+    mocker.patch("azure_cost_advisor.analysis.time.monotonic", side_effect=lambda: clock[0])
+    mock_sleep = mocker.patch("azure_cost_advisor.analysis.time.sleep")
+    bucket = analysis._TokenBucket(capacity=2, rate=4)
+
+    bucket.throttled()
+    bucket.acquire()
+    mock_sleep.assert_called_once_with(0.5)
+
+    clock[0] += analysis.THROTTLE_SLOWDOWN_SECONDS # Slowdown over: back to the full rate, burst refilled
+    mock_sleep.reset_mock()
+    bucket.acquire()
+    bucket.acquire()
+    bucket.acquire()
+    mock_sleep.assert_called_once_with(0.25)
+
+# --- Tests for client reuse ---
+
+def test_get_token_reuses_token_until_near_expiry(mocker):
+    """Tests that a token is fetched once per credential and scope, and again only when close to expiring."""
+    from azure.core.credentials import AccessToken
+    mocker.patch("azure_cost_advisor.analysis.time.time", return_value=1_000_000)
+    mock_credential = MagicMock()
+    mock_credential.get_token.side_effect = [
+        AccessToken("token-1", 1_000_000 + 3600),
+        AccessToken("token-2", 1_000_000 + analysis.TOKEN_REFRESH_MARGIN_SECONDS - 1),
+        AccessToken("token-3", 1_000_000 + 3600),
+    ]
+
+    assert analysis._get_token(mock_credential, "scope-a") == "token-1"
+    assert analysis._get_token(mock_credential, "scope-a") == "token-1"
+    assert analysis._get_token(mock_credential, "scope-b") == "token-2"
+    assert analysis._get_token(mock_credential, "scope-b") == "token-3"
+    assert mock_credential.get_token.call_count == 3
+
+def test_management_clients_are_reused_across_checks(mocker):
+    """Tests that checks sharing a credential and subscription share one client instance."""
+    mock_credential = MagicMock()
+    mock_console = MagicMock(spec=Console)
+    mock_network_client_instance = MagicMock()
+    mock_network_client_instance.public_ip_addresses.list_all.return_value = []
+    mock_network_client_instance.application_gateways.list_all.return_value = []
+    mocker.patch("azure_cost_advisor.analysis.NetworkManagementClient", return_value=mock_network_client_instance)
+    mocker.patch("azure_cost_advisor.analysis.MonitorManagementClient")
+
+    find_unused_public_ips(mock_credential, "sub-shared", mock_console)
+    analysis.find_idle_application_gateways(mock_credential, "sub-shared", lookback_days=7, idle_connection_threshold=5, console=mock_console)
+    analysis.find_unused_public_ips(MagicMock(), "sub-shared", mock_console)
+
+    # One client for the shared credential, and a separate one for the other credential
+    assert analysis.NetworkManagementClient.call_count == 2
+    analysis.NetworkManagementClient.assert_any_call(mock_credential, "sub-shared", transport=ANY, retry_policy=ANY)
+
+def test_get_client_shares_one_transport(mocker):
+    """Tests that every client is built on the same pooled transport, created only once."""
+    mocker.patch.object(analysis, "_transport", None)
+    mock_build = mocker.patch("azure_cost_advisor.analysis.build_shared_transport")
+    first_class, second_class = MagicMock(), MagicMock()
+    mock_credential = MagicMock()
+
+    analysis._get_client(first_class, mock_credential, "sub-pool")
+    analysis._get_client(second_class, mock_credential, "sub-pool")
+
+    mock_build.assert_called_once_with()
+    first_class.assert_called_once_with(mock_credential, "sub-pool", transport=mock_build.return_value, retry_policy=ANY)
+    second_class.assert_called_once_with(mock_credential, "sub-pool", transport=mock_build.return_value, retry_policy=ANY)
+
+def test_client_retry_policy_leaves_throttling_to_with_retry():
+    """Tests that SDK clients don't retry 429s or long Retry-After waits themselves, but still retry 5xx."""
+    policy = analysis._CappedRetryPolicy()
+    settings = policy.configure_retries({})
+
+    def _response(status_code, headers=None):
+        response = MagicMock()
+        response.http_request.method = "GET"
+        response.http_response.status_code = status_code
+        response.http_response.headers = headers or {}
+        return response
+
+    assert not policy.is_retry(settings, _response(429, {"Retry-After": "2"}))
+    assert not policy.is_retry(settings, _response(503, {"Retry-After": str(analysis.RETRY_MAX_WAIT_SECONDS + 1)}))
+    assert policy.is_retry(settings, _response(503))
+
+def test_print_cost_breakdown_collapses_long_tail(mocker):
+    """Tests that only the top resource types get rows and the rest are summed into one line."""
+    mocker.patch.object(analysis, "COST_BREAKDOWN_MAX_ROWS", 2)
+    console = Console(record=True, width=120)
+    costs_by_type = {"type-a": 30.0, "type-b": 20.0, "type-c": 5.0, "type-d": 1.5}
+
+    analysis.print_cost_breakdown(console, costs_by_type, 56.5, "USD")
+
+    output = console.export_text()
+    assert "type-a" in output and "type-b" in output
+    assert "type-c" not in output
+    assert "2 more resource type(s)" in output and "6.50 USD" in output
+    assert "56.50 USD" in output
+
+def test_report_usage_results_prints_once_per_check():
+    """Tests that low-usage results are filtered on the calling thread and printed as one table plus one no-data line."""
+    console = Console(record=True, width=120)
+    results = [
+        {"name": "idle-app", "avg_cpu_percent": 1.25},
+        {"name": "busy-app", "avg_cpu_percent": 80.0},
+        {"name": "quiet-app", "avg_cpu_percent": None},
+    ]
+
+    below = analysis._report_usage_results(console, results, "avg_cpu_percent", 5, "Web App", "Avg CPU %")
+
+    output = console.export_text()
+    assert [details["name"] for details in below] == ["idle-app"]
+    assert "idle-app" in output and "1.2" in output
+    assert "busy-app" not in output
+    assert "No usage data for 1 Web App(s): quiet-app" in output
+
+def test_first_series_data_handles_empty_metrics_responses():
+    point = MagicMock(average=4.0)
+    response = MagicMock()
+    response.value = [MagicMock(timeseries=[MagicMock(data=[point])])]
+    assert analysis._first_series_data(response) == [point]
+
+    no_series = MagicMock()
+    no_series.value = [MagicMock(timeseries=[])]
+    assert analysis._mean_average(analysis._first_series_data(no_series)) is None
+    assert analysis._first_series_data(MagicMock(value=[])) == ()
+
+    empty_series = MagicMock()
+    empty_series.value = [MagicMock(timeseries=[TimeSeriesElement()])]
+    assert analysis._mean_average(analysis._first_series_data(empty_series)) is None
+    assert analysis._first_series_data(None) == ()
+
+def test_mean_average_skips_missing_points():
+    points = [MagicMock(average=2.0), MagicMock(average=None), MagicMock(average=4.0)]
+    assert analysis._mean_average(points) == 3.0
+    assert analysis._mean_average([MagicMock(average=None)]) is None